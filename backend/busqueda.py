@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Búsqueda de productos por texto
+Sistema de Inventario - Empresa de Maquinados
+
+Usa el índice FTS5 productos_fts (migración 7): cada palabra escrita se
+busca como prefijo en nombre, descripción, categoría, ubicación y código
+de barras, y los resultados se ordenan con bm25 dando más peso al nombre.
+Si la base no tiene FTS5 se usa el LIKE de antes, que recorre toda la
+tabla. Cuando no se llenan los resultados se completan con los nombres
+parecidos del índice de trigramas (errores de escritura, trigramas.py).
+"""
+
+import logging
+import re
+from typing import List, Optional, Sequence, Tuple
+
+from trigramas import indice_nombres
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+BUSQUEDA_LIMIT_DEFAULT = 20
+BUSQUEDA_LIMIT_MAX = 100
+# Palabras de la consulta que se toman en cuenta
+BUSQUEDA_MAX_TERMINOS = 8
+
+# Pesos de bm25 en el orden de las columnas de productos_fts:
+# nombre, descripcion, categoria, ubicacion, codigo_barras
+PESOS_BM25 = (10.0, 1.0, 2.0, 2.0, 5.0)
+RANK_BM25 = f"bm25({', '.join(str(p) for p in PESOS_BM25)})"
+
+_fts_disponible: Optional[bool] = None
+
+def fts_disponible(conn) -> bool:
+    """¿Existe productos_fts? (se consulta una vez por proceso)"""
+    global _fts_disponible
+    if _fts_disponible is None:
+        _fts_disponible = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'productos_fts'"
+        ).fetchone() is not None
+        if not _fts_disponible:
+            logger.warning("⚠️ Índice productos_fts no disponible, búsqueda con LIKE")
+    return _fts_disponible
+
+def consulta_fts(texto: str) -> Optional[str]:
+    """Convertir lo que escribió el usuario en una consulta MATCH segura
+
+    Cada palabra va entre comillas (sin operadores de FTS5) y con * para
+    buscar por prefijo; todas deben aparecer.
+    """
+    terminos = re.findall(r"\w+", texto or "")[:BUSQUEDA_MAX_TERMINOS]
+    if not terminos:
+        return None
+    return " ".join(f'"{termino}"*' for termino in terminos)
+
+def ids_fts(conn, texto: str, limit: int) -> List[int]:
+    consulta = consulta_fts(texto)
+    if consulta is None:
+        return []
+    # Ordenar y limitar dentro de FTS5 (columna rank)
+    return [row[0] for row in conn.execute("""
+        SELECT rowid FROM productos_fts
+        WHERE productos_fts MATCH ? AND rank MATCH ?
+        ORDER BY rank
+        LIMIT ?
+    """, (consulta, RANK_BM25, limit))]
+
+def ids_like(conn, texto: str, limit: int) -> List[int]:
+    """Búsqueda original por subcadena (recorre toda la tabla)"""
+    texto = (texto or "").strip()
+    if not texto:
+        return []
+    patron = f"%{texto}%"
+    return [row[0] for row in conn.execute("""
+        SELECT id FROM productos
+        WHERE nombre LIKE ? OR codigo_barras LIKE ?
+        ORDER BY nombre
+        LIMIT ?
+    """, (patron, patron, limit))]
+
+def ids_difusos(conn, texto: str, limit: int) -> List[int]:
+    """Nombres parecidos según el índice de trigramas"""
+    indice_nombres.actualizar(conn)
+    return [producto_id for producto_id, _ in indice_nombres.buscar(texto, limit)]
+
+def buscar_ids(conn, texto: str, limit: int, difusa: bool = True) -> Tuple[List[int], int]:
+    """Ids de productos ordenados por relevancia y cuántos son coincidencias exactas
+
+    Primero las coincidencias de texto (FTS5 o LIKE); si faltan para llegar
+    al límite se agregan los nombres parecidos que no estén ya.
+    """
+    ids = ids_fts(conn, texto, limit) if fts_disponible(conn) else ids_like(conn, texto, limit)
+    exactos = len(ids)
+    if difusa and exactos < limit:
+        vistos = set(ids)
+        for producto_id in ids_difusos(conn, texto, limit):
+            if producto_id not in vistos:
+                ids.append(producto_id)
+                if len(ids) >= limit:
+                    break
+    return ids, exactos
+
+def leer_productos_ordenados(conn, ids: List[int], columnas: Sequence[str]) -> list:
+    """Filas de los productos en el mismo orden que ids"""
+    if not ids:
+        return []
+    campos = ", ".join(f"p.{c}" for c in columnas)
+    valores = ", ".join("(?, ?)" for _ in ids)
+    params = [v for posicion, producto_id in enumerate(ids) for v in (producto_id, posicion)]
+    return conn.execute(f"""
+        WITH orden (id, posicion) AS (VALUES {valores})
+        SELECT {campos}
+        FROM orden
+        JOIN productos p ON p.id = orden.id
+        ORDER BY orden.posicion
+    """, params).fetchall()
+
+def buscar_productos(conn, texto: str, limit: int, columnas: Sequence[str], difusa: bool = True) -> list:
+    """Productos que coinciden con el texto, los más relevantes primero"""
+    ids, _ = buscar_ids(conn, texto, limit, difusa)
+    return leer_productos_ordenados(conn, ids, columnas)
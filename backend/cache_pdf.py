@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caché en disco de los PDFs de tickets
+Sistema de Inventario - Empresa de Maquinados
+
+Un archivo por (ticket, versión): la versión la suben los triggers de la
+migración 10 al entregar o devolver, así que un PDF guardado nunca queda
+viejo, solo deja de pedirse. Al guardar una versión nueva se borran las
+anteriores del mismo ticket. El formato del PDF también va en el nombre
+para que un cambio en pdf_tickets.py no sirva comprobantes con el diseño
+anterior.
+"""
+
+import glob
+import logging
+import os
+import re
+import threading
+from typing import Dict, Optional
+
+from pdf_tickets import PDF_TICKET_FORMATO
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Archivos que se conservan (los más viejos se borran)
+PDF_CACHE_MAX_ARCHIVOS = 5000
+# Cada cuántos guardados revisar el límite
+PDF_CACHE_REVISION = 50
+
+# ticket_<id>_v<versión>_f<formato>.pdf
+_VERSION_ARCHIVO = re.compile(r"_v(\d+)_f\d+\.pdf$")
+
+class CachePDF:
+    """PDFs de tickets ya generados, en un directorio por base de datos"""
+
+    def __init__(self, max_archivos: int = PDF_CACHE_MAX_ARCHIVOS):
+        self.max_archivos = max_archivos
+        self.directorio: Optional[str] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.guardados = 0
+
+    def configurar(self, directorio: str):
+        """Usar el directorio (se llama una vez en lifespan)"""
+        os.makedirs(directorio, exist_ok=True)
+        self.directorio = directorio
+        logger.info(f"✅ Caché de PDFs en {directorio}")
+
+    def _ruta(self, ticket_id: int, version: int) -> str:
+        return os.path.join(self.directorio, f"ticket_{ticket_id}_v{version}_f{PDF_TICKET_FORMATO}.pdf")
+
+    def leer(self, ticket_id: int, version: int) -> Optional[bytes]:
+        """PDF de esa versión del ticket, o None si no está (bloqueante)"""
+        if self.directorio is None:
+            return None
+        try:
+            with open(self._ruta(ticket_id, version), "rb") as archivo:
+                datos = archivo.read()
+        except FileNotFoundError:
+            # También si otra petición acaba de guardar una versión más nueva
+            datos = None
+        with self._lock:
+            if datos is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return datos
+
+    def _versiones(self, ticket_id: int) -> Dict[str, int]:
+        """Archivos guardados del ticket con su versión"""
+        versiones = {}
+        for ruta in glob.glob(os.path.join(self.directorio, f"ticket_{ticket_id}_v*.pdf")):
+            encontrado = _VERSION_ARCHIVO.search(ruta)
+            if encontrado:
+                versiones[ruta] = int(encontrado.group(1))
+        return versiones
+
+    def guardar(self, ticket_id: int, version: int, datos: bytes):
+        """Guardar el PDF y borrar las versiones anteriores del ticket (bloqueante)
+
+        Si ya hay una versión más nueva guardada no se escribe nada: este PDF
+        se generó antes del último cambio y nadie lo va a volver a pedir.
+        """
+        if self.directorio is None:
+            return
+        versiones = self._versiones(ticket_id)
+        if any(otra > version for otra in versiones.values()):
+            return
+
+        ruta = self._ruta(ticket_id, version)
+        # Escribir aparte y renombrar: nadie lee un PDF a medias
+        temporal = f"{ruta}.{threading.get_ident()}.tmp"
+        with open(temporal, "wb") as archivo:
+            archivo.write(datos)
+        os.replace(temporal, ruta)
+
+        for anterior, otra in versiones.items():
+            if anterior != ruta and otra <= version:
+                try:
+                    os.remove(anterior)
+                except OSError:
+                    pass
+
+        with self._lock:
+            self.guardados += 1
+            revisar = self.guardados % PDF_CACHE_REVISION == 0
+        if revisar:
+            self.recortar()
+
+    def recortar(self):
+        """Borrar los PDFs menos recientes si hay más de max_archivos"""
+        with os.scandir(self.directorio) as entradas:
+            archivos = [(e.stat().st_mtime, e.path) for e in entradas if e.name.endswith(".pdf")]
+        if len(archivos) <= self.max_archivos:
+            return
+        archivos.sort()
+        for _, ruta in archivos[:len(archivos) - self.max_archivos]:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "directorio": self.directorio,
+                "hits": self.hits,
+                "misses": self.misses,
+                "guardados": self.guardados,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0
+            }
+
+# Instancia global de la caché
+cache_pdf_tickets = CachePDF()
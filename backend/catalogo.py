@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Versión del catálogo de productos y validación condicional (ETag)
+Sistema de Inventario - Empresa de Maquinados
+
+La tabla catalogo_version guarda un contador que los triggers de productos
+incrementan en cada INSERT/UPDATE/DELETE (migración 3). Los endpoints que
+solo dependen de productos usan ese número como ETag fuerte: si la tablet
+manda el mismo ETag en If-None-Match se responde 304 sin consultar ni
+serializar nada.
+
+SnapshotCatalogo guarda el catálogo ya serializado de la versión actual
+(uno por combinación de campos) y de él se cortan las páginas, que se
+comprimen (gzip y brotli) una vez; solo se reconstruye cuando una
+escritura a productos cambia la versión.
+
+El hilo escritor publica la versión después de cada COMMIT
+(publicar_version_catalogo); los índices en memoria la usan para saber si
+siguen al día sin consultar SQLite.
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import Request, Response
+
+# Brotli es opcional: sin el paquete solo se ofrece gzip
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    brotli = None
+    BROTLI_AVAILABLE = False
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+def leer_version_catalogo(conn) -> int:
+    """Versión actual del catálogo (una lectura por clave primaria)"""
+    row = conn.execute("SELECT version FROM catalogo_version WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+# Versión publicada por el hilo escritor; otros procesos (scripts) también
+# pueden cambiar productos, así que se vuelve a leer de SQLite si es vieja
+VERSION_LOCAL_MAX_EDAD = 5.0
+_version_local: Optional[int] = None
+_version_local_leida = 0.0
+_version_local_lock = threading.Lock()
+
+def publicar_version_catalogo(version: int):
+    """Registrar la versión vista en la base (nunca retrocede)"""
+    global _version_local, _version_local_leida
+    with _version_local_lock:
+        if _version_local is None or version >= _version_local:
+            _version_local = version
+        _version_local_leida = time.monotonic()
+
+def version_local_vigente() -> Optional[int]:
+    """Última versión publicada si es reciente, o None si hay que leerla de SQLite"""
+    with _version_local_lock:
+        if _version_local is None or time.monotonic() - _version_local_leida > VERSION_LOCAL_MAX_EDAD:
+            return None
+        return _version_local
+
+def leer_cambios_catalogo(conn, desde: Optional[int], columnas: str) -> Tuple[int, list, list]:
+    """(versión, filas, ids eliminados) desde una versión, o todo si desde es None
+
+    Todo sale del mismo snapshot de lectura.
+    """
+    conn.execute("BEGIN")
+    try:
+        version = leer_version_catalogo(conn)
+        if desde is None:
+            return version, conn.execute(f"SELECT {columnas} FROM productos").fetchall(), []
+        if desde >= version:
+            return version, [], []
+        filas = conn.execute(
+            f"SELECT {columnas} FROM productos WHERE version_cambio > ? ORDER BY version_cambio", (desde,)
+        ).fetchall()
+        eliminados = [row[0] for row in conn.execute(
+            "SELECT producto_id FROM productos_eliminados WHERE version_cambio > ? ORDER BY version_cambio", (desde,)
+        )]
+        return version, filas, eliminados
+    finally:
+        conn.rollback()
+
+def etag_catalogo(version: int, recurso: str, codificacion: str = "identity") -> str:
+    """ETag fuerte para un recurso derivado del catálogo
+
+    Cada Content-Encoding es otra representación (RFC 9110 §8.8.3): gzip y
+    br llevan su propio ETag para que un 304 no valide la copia de otra.
+    """
+    if codificacion == "identity":
+        return f'"{recurso}-v{version}"'
+    return f'"{recurso}-v{version}-{codificacion}"'
+
+def if_none_match_coincide(request: Request, etag: str) -> bool:
+    """Comparación débil de If-None-Match (RFC 9110), incluye '*'"""
+    encabezado = request.headers.get("if-none-match")
+    if not encabezado:
+        return False
+    etiquetas = [e.strip() for e in encabezado.split(",")]
+    if "*" in etiquetas:
+        return True
+    return etag in (e[2:] if e.startswith("W/") else e for e in etiquetas)
+
+def encabezados_catalogo(version: int, etag: str) -> dict:
+    """Encabezados comunes: las tablets deben revalidar siempre (no-cache)"""
+    return {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "X-Catalogo-Version": str(version)
+    }
+
+def respuesta_no_modificada(request: Request, version: int, recurso: str,
+                            codificacion: str = "identity") -> Optional[Response]:
+    """Devolver un 304 si el cliente ya tiene esta versión (en esa codificación), o None"""
+    etag = etag_catalogo(version, recurso, codificacion)
+    if if_none_match_coincide(request, etag):
+        return Response(status_code=304, headers=encabezados_catalogo(version, etag))
+    return None
+
+# Un solo codificador: json.dumps con opciones crea uno en cada llamada
+_CODIFICADOR_JSON = json.JSONEncoder(ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"))
+
+def serializar_json(contenido) -> bytes:
+    """Mismo formato que JSONResponse de FastAPI"""
+    return _CODIFICADOR_JSON.encode(contenido).encode("utf-8")
+
+def elegir_codificacion(accept_encoding: Optional[str]) -> str:
+    """Mejor Content-Encoding aceptado por el cliente: br, gzip o identity"""
+    aceptadas = {}
+    for parte in (accept_encoding or "").split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        if not nombre:
+            continue
+        calidad = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith("q="):
+            try:
+                calidad = float(parametros[2:])
+            except ValueError:
+                calidad = 0.0
+        aceptadas[nombre.strip().lower()] = calidad
+
+    opciones = ["br", "gzip"] if BROTLI_AVAILABLE else ["gzip"]
+    for codificacion in opciones:
+        calidad = aceptadas.get(codificacion, aceptadas.get("*", 0.0))
+        if calidad > 0:
+            return codificacion
+    return "identity"
+
+class EntradaSnapshot:
+    """Una respuesta serializada y sus variantes comprimidas"""
+
+    def __init__(self, version: int, cuerpo: bytes):
+        self.version = version
+        self.cuerpos: Dict[str, bytes] = {
+            "identity": cuerpo,
+            "gzip": gzip.compress(cuerpo, compresslevel=6)
+        }
+        if BROTLI_AVAILABLE:
+            self.cuerpos["br"] = brotli.compress(cuerpo, quality=5)
+
+# Páginas comprimidas que se guardan por catálogo (recorrer 50k productos
+# con limit=500 son 100)
+PAGINAS_MAX = 1024
+
+class CatalogoSerializado:
+    """Todos los productos de una versión, ya serializados, en el orden (nombre, id)
+
+    Cada producto es un fragmento JSON; una página se arma uniendo los
+    fragmentos de su tramo, así que todas las páginas (y la respuesta sin
+    limit) salen de la misma entrada. Las páginas ya comprimidas se
+    guardan aquí mismo y se van con la versión.
+    """
+
+    def __init__(self, version: int, claves: List[Tuple[str, int]], fragmentos: List[bytes]):
+        self.version = version
+        self.claves = claves
+        self.fragmentos = fragmentos
+        self._paginas: Dict[Tuple[int, int], EntradaSnapshot] = {}
+        self._lock = threading.Lock()
+
+    def _tramo(self, limit: Optional[int], posicion: Optional[Tuple[str, int]]) -> Tuple[int, int]:
+        # Mismo criterio que WHERE (nombre, id) > (?, ?) ORDER BY nombre, id
+        inicio = bisect_right(self.claves, posicion) if posicion else 0
+        fin = len(self.claves) if limit is None else min(inicio + limit, len(self.claves))
+        return inicio, fin
+
+    def pagina_guardada(self, limit: Optional[int], posicion: Optional[Tuple[str, int]]) -> Optional[EntradaSnapshot]:
+        """Página ya comprimida, o None"""
+        with self._lock:
+            return self._paginas.get(self._tramo(limit, posicion))
+
+    def pagina(self, limit: Optional[int], posicion: Optional[Tuple[str, int]],
+               codificar_cursor: Callable[[str, int], str]) -> EntradaSnapshot:
+        """Armar y comprimir una página (bloqueante: usar run_blocking)"""
+        tramo = self._tramo(limit, posicion)
+        with self._lock:
+            entrada = self._paginas.get(tramo)
+        if entrada is not None:
+            return entrada
+
+        inicio, fin = tramo
+        siguiente_cursor = codificar_cursor(*self.claves[fin - 1]) if fin < len(self.claves) else None
+        cuerpo = b"".join((
+            b'{"productos":[', b",".join(self.fragmentos[inicio:fin]),
+            b'],"siguiente_cursor":', serializar_json(siguiente_cursor), b"}"
+        ))
+        entrada = EntradaSnapshot(self.version, cuerpo)
+        with self._lock:
+            if len(self._paginas) < PAGINAS_MAX:
+                self._paginas[tramo] = entrada
+        return entrada
+
+    def paginas(self) -> List[EntradaSnapshot]:
+        with self._lock:
+            return list(self._paginas.values())
+
+class SnapshotCatalogo:
+    """Caché en memoria del catálogo serializado por versión
+
+    La clave identifica la consulta (los campos, no la página); la entrada
+    solo se usa si su versión coincide con la versión actual del catálogo.
+    Si muchas tablets piden lo mismo justo después de un cambio, una sola
+    reconstruye y las demás esperan su resultado.
+    """
+
+    def __init__(self, max_entradas: int = 8):
+        self.max_entradas = max_entradas
+        self._entradas: "OrderedDict[Tuple, CatalogoSerializado]" = OrderedDict()
+        self._locks: Dict[Tuple, asyncio.Lock] = {}
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reconstrucciones = 0
+        self.tiempo_reconstruccion_total = 0.0
+        self.tiempo_reconstruccion_max = 0.0
+        self.ultima_reconstruccion_ms = 0.0
+
+    def _vigente(self, clave: Tuple, version: int) -> Optional[CatalogoSerializado]:
+        entrada = self._entradas.get(clave)
+        if entrada is not None and entrada.version >= version:
+            self._entradas.move_to_end(clave)
+            return entrada
+        return None
+
+    async def obtener(self, clave: Tuple, version: int,
+                      construir: Callable[[], Awaitable[CatalogoSerializado]]) -> CatalogoSerializado:
+        """Entrada vigente para la versión dada, construyéndola si hace falta"""
+        entrada = self._vigente(clave, version)
+        if entrada is not None:
+            self._contar(hit=True)
+            return entrada
+
+        lock = self._locks.setdefault(clave, asyncio.Lock())
+        try:
+            async with lock:
+                # Otra petición pudo reconstruirla mientras esperábamos
+                entrada = self._vigente(clave, version)
+                if entrada is not None:
+                    self._contar(hit=True)
+                    return entrada
+
+                self._contar(hit=False)
+                inicio = time.perf_counter()
+                entrada = await construir()
+                duracion = time.perf_counter() - inicio
+
+                self._entradas[clave] = entrada
+                self._entradas.move_to_end(clave)
+                while len(self._entradas) > self.max_entradas:
+                    clave_vieja, _ = self._entradas.popitem(last=False)
+                    self._locks.pop(clave_vieja, None)
+
+                with self._stats_lock:
+                    self.reconstrucciones += 1
+                    self.tiempo_reconstruccion_total += duracion
+                    self.tiempo_reconstruccion_max = max(self.tiempo_reconstruccion_max, duracion)
+                    self.ultima_reconstruccion_ms = duracion * 1000
+                logger.debug(f"Snapshot del catálogo v{entrada.version} reconstruido en {duracion * 1000:.1f} ms")
+                return entrada
+        finally:
+            # Si no quedó entrada (falló la construcción) el lock no se guarda:
+            # si no, claves que nunca se construyen harían crecer _locks sin límite
+            if clave not in self._entradas and self._locks.get(clave) is lock and not lock.locked():
+                del self._locks[clave]
+
+    def _contar(self, hit: bool):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> Dict:
+        """Métricas de aciertos y reconstrucciones"""
+        with self._stats_lock:
+            total = self.hits + self.misses
+            entradas = list(self._entradas.values())
+            paginas = [pagina for entrada in entradas for pagina in entrada.paginas()]
+            return {
+                "entradas": len(entradas),
+                "max_entradas": self.max_entradas,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "reconstrucciones": self.reconstrucciones,
+                "reconstruccion_promedio_ms": round(self.tiempo_reconstruccion_total * 1000 / self.reconstrucciones, 2) if self.reconstrucciones else 0.0,
+                "reconstruccion_max_ms": round(self.tiempo_reconstruccion_max * 1000, 2),
+                "ultima_reconstruccion_ms": round(self.ultima_reconstruccion_ms, 2),
+                "brotli_disponible": BROTLI_AVAILABLE,
+                "productos": sum(len(e.claves) for e in entradas),
+                "paginas": len(paginas),
+                "bytes": {
+                    codificacion: sum(len(p.cuerpos.get(codificacion, b"")) for p in paginas)
+                    for codificacion in ("identity", "gzip", "br")
+                }
+            }
+
+# Instancia global del snapshot de /api/productos
+snapshot_productos = SnapshotCatalogo()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Códigos QR y de barras de los productos
+Sistema de Inventario - Empresa de Maquinados
+
+Funciones puras: reciben el texto a codificar y devuelven los bytes de la
+imagen (PNG o SVG). No tocan la base de datos ni el event loop, así que se
+pueden llamar desde el ejecutor de render o desde otro proceso.
+"""
+
+from io import BytesIO
+from typing import List, Optional, Tuple
+
+import barcode
+import qrcode
+import qrcode.image.svg
+from barcode.writer import ImageWriter, SVGWriter
+
+from imagenes import hash_imagen
+
+# Formatos de imagen y su tipo MIME
+FORMATOS_CODIGO = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+# Opciones del Code128 (las mismas para PNG y SVG)
+OPCIONES_BARRAS = {
+    'text_distance': 1.0,
+    'font_size': 12,
+    'module_height': 15.0,
+    'module_width': 0.2,
+    'quiet_zone': 6.0,
+    'background': 'white',
+    'foreground': 'black'
+}
+
+def contenido_qr(producto_id: int, nombre: str, codigo_barras: str = None) -> str:
+    """Texto codificado en el QR de un producto"""
+    contenido = f"ID:{producto_id}|Nombre:{nombre}"
+    if codigo_barras:
+        contenido += f"|Codigo:{codigo_barras}"
+    return contenido
+
+def codigo_barras_producto(producto_id: int, codigo_barras: str = None) -> str:
+    """Código del Code128: el del producto o uno de 12 dígitos basado en el ID"""
+    if codigo_barras and codigo_barras.strip():
+        return codigo_barras
+    return f"{producto_id:012d}"
+
+def _qr(contenido: str, **kwargs) -> qrcode.QRCode:
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+        **kwargs
+    )
+    qr.add_data(contenido)
+    qr.make(fit=True)
+    return qr
+
+def generar_qr_png(contenido: str) -> bytes:
+    """Generar la imagen PNG de un código QR"""
+    img = _qr(contenido).make_image(fill_color="black", back_color="white")
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def generar_qr_svg(contenido: str) -> bytes:
+    """Código QR como SVG (un solo path, escala sin perder nitidez)"""
+    img = _qr(contenido, image_factory=qrcode.image.svg.SvgPathImage).make_image()
+    buffer = BytesIO()
+    img.save(buffer)
+    return buffer.getvalue()
+
+def generar_barras_png(codigo: str) -> bytes:
+    """Code128 (más común y legible) como PNG"""
+    buffer = BytesIO()
+    barcode.get('code128', codigo, writer=ImageWriter()).write(buffer, OPCIONES_BARRAS)
+    return buffer.getvalue()
+
+def generar_barras_svg(codigo: str) -> bytes:
+    buffer = BytesIO()
+    barcode.get('code128', codigo, writer=SVGWriter()).write(buffer, OPCIONES_BARRAS)
+    return buffer.getvalue()
+
+# (tipo de código, formato) -> (tipo en el almacén de imágenes, generador)
+# Los QR en PNG conservan el tipo "qr" con el que ya están guardados
+GENERADORES_CODIGO = {
+    ("qr", "png"): ("qr", generar_qr_png),
+    ("qr", "svg"): ("qr-svg", generar_qr_svg),
+    ("barcode", "png"): ("barcode", generar_barras_png),
+    ("barcode", "svg"): ("barcode-svg", generar_barras_svg),
+}
+
+# Imágenes que se generan por adelantado para cada producto
+CODIGOS_PREGENERADOS = (("qr", "png"), ("barcode", "png"))
+
+def trabajos_producto(producto_id: int, nombre: str, codigo_barras: str = None) -> List[Tuple[str, str, str, str]]:
+    """[(clave, tipo, media_type, contenido)] de las imágenes pregeneradas de un producto"""
+    trabajos = []
+    for codigo, formato in CODIGOS_PREGENERADOS:
+        if codigo == "qr":
+            contenido = contenido_qr(producto_id, nombre, codigo_barras)
+        else:
+            contenido = codigo_barras_producto(producto_id, codigo_barras)
+        tipo, _ = GENERADORES_CODIGO[(codigo, formato)]
+        trabajos.append((hash_imagen(tipo, contenido), tipo, FORMATOS_CODIGO[formato], contenido))
+    return trabajos
+
+_GENERADOR_POR_TIPO = {tipo: generar for tipo, generar in GENERADORES_CODIGO.values()}
+
+def renderizar_codigos(trabajos: List[Tuple[str, str, str]]) -> List[Tuple[str, Optional[bytes], Optional[str]]]:
+    """Generar varias imágenes [(clave, tipo, contenido)] -> [(clave, datos, error)]
+
+    Pensada para un proceso aparte: recibe y devuelve solo datos simples, y
+    un error en una imagen no detiene a las demás.
+    """
+    resultados = []
+    for clave, tipo, contenido in trabajos:
+        try:
+            resultados.append((clave, _GENERADOR_POR_TIPO[tipo](contenido), None))
+        except Exception as e:
+            resultados.append((clave, None, str(e) or type(e).__name__))
+    return resultados
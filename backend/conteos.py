@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Conteos cíclicos de inventario
+Sistema de Inventario - Empresa de Maquinados
+
+Una sesión de conteo junta las lecturas (código, cantidad contada) de la
+tablet en conteo_items sin tocar productos. Al aplicarla, las diferencias
+se calculan en SQL y todos los ajustes de stock, junto con su historial,
+se escriben en una sola transacción. Los productos que no se leyeron en
+la sesión no se modifican.
+"""
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Lecturas aceptadas por petición
+CONTEO_MAX_LECTURAS = 5000
+
+class ErrorConteo(Exception):
+    """Operación no válida sobre una sesión de conteo"""
+
+    def __init__(self, mensaje: str, status_code: int = 400):
+        super().__init__(mensaje)
+        self.status_code = status_code
+
+def parsear_lecturas(lecturas) -> List[Tuple[str, int]]:
+    """Validar [{"codigo": ..., "cantidad": n}] y devolver pares (codigo, cantidad)"""
+    if not isinstance(lecturas, list) or not lecturas:
+        raise ErrorConteo("Se requiere al menos una lectura")
+    if len(lecturas) > CONTEO_MAX_LECTURAS:
+        raise ErrorConteo(f"Máximo {CONTEO_MAX_LECTURAS} lecturas por envío")
+    pares = []
+    for i, lectura in enumerate(lecturas, start=1):
+        if not isinstance(lectura, dict):
+            raise ErrorConteo(f"Lectura {i} no válida")
+        codigo = str(lectura.get("codigo") or "").strip()
+        if not codigo:
+            raise ErrorConteo(f"Lectura {i}: el código es obligatorio")
+        try:
+            cantidad = int(lectura.get("cantidad", 1))
+        except (ValueError, TypeError):
+            raise ErrorConteo(f"Lectura {i}: cantidad no válida")
+        if cantidad < 0:
+            raise ErrorConteo(f"Lectura {i}: la cantidad no puede ser negativa")
+        pares.append((codigo, cantidad))
+    return pares
+
+def _id_de_qr(codigo: str) -> Optional[int]:
+    """Id del contenido de un QR "ID:8|Nombre:..." o None"""
+    if not codigo.startswith("ID:"):
+        return None
+    try:
+        return int(codigo.split("|")[0][3:])
+    except ValueError:
+        return None
+
+def resolver_codigos(conn, codigos: List[str]) -> Dict[str, int]:
+    """Código leído -> id de producto (código de barras exacto o QR)
+
+    A diferencia de /api/productos/buscar no hay coincidencias parciales:
+    en un conteo un producto equivocado ajustaría el stock de otro.
+    """
+    resueltos: Dict[str, int] = {}
+    por_id: Dict[int, List[str]] = {}
+    barras = []
+    for codigo in set(codigos):
+        producto_id = _id_de_qr(codigo)
+        if producto_id is not None:
+            por_id.setdefault(producto_id, []).append(codigo)
+        else:
+            barras.append(codigo)
+
+    # Respetar el límite de parámetros de SQLite
+    for i in range(0, len(barras), 500):
+        parte = barras[i:i + 500]
+        marcadores = ",".join("?" * len(parte))
+        for row in conn.execute(f"SELECT id, codigo_barras FROM productos WHERE codigo_barras IN ({marcadores})", parte):
+            resueltos[row[1]] = row[0]
+    ids = list(por_id)
+    for i in range(0, len(ids), 500):
+        parte = ids[i:i + 500]
+        marcadores = ",".join("?" * len(parte))
+        for row in conn.execute(f"SELECT id FROM productos WHERE id IN ({marcadores})", parte):
+            for codigo in por_id[row[0]]:
+                resueltos[codigo] = row[0]
+    return resueltos
+
+def obtener_conteo(conn, conteo_id: int) -> dict:
+    row = conn.execute("SELECT * FROM conteos WHERE id = ?", (conteo_id,)).fetchone()
+    if not row:
+        raise ErrorConteo("Conteo no encontrado", 404)
+    return dict(row)
+
+def _conteo_abierto(conn, conteo_id: int) -> dict:
+    conteo = obtener_conteo(conn, conteo_id)
+    if conteo["estado"] != "abierto":
+        raise ErrorConteo(f"El conteo ya está {conteo['estado']}", 409)
+    return conteo
+
+def abrir_conteo(conn, usuario: dict, notas: Optional[str] = None) -> int:
+    cursor = conn.execute("""
+        INSERT INTO conteos (notas, usuario_id, usuario_nombre)
+        VALUES (?, ?, ?)
+    """, (notas, usuario["id"], usuario["nombre_completo"]))
+    return cursor.lastrowid
+
+def registrar_lecturas(conn, conteo_id: int, pares: List[Tuple[str, int]], acumular: bool = False) -> dict:
+    """Guardar un lote de lecturas en la sesión
+
+    Por defecto la última lectura de un producto reemplaza a las anteriores
+    (se captura la cantidad contada); con acumular=True se suman (una
+    lectura por pieza).
+    """
+    _conteo_abierto(conn, conteo_id)
+    resueltos = resolver_codigos(conn, [codigo for codigo, _ in pares])
+
+    filas = []
+    no_encontrados = []
+    for codigo, cantidad in pares:
+        producto_id = resueltos.get(codigo)
+        if producto_id is None:
+            no_encontrados.append(codigo)
+        else:
+            filas.append((conteo_id, producto_id, cantidad))
+
+    nuevo_valor = "conteo_items.cantidad_contada + excluded.cantidad_contada" if acumular else "excluded.cantidad_contada"
+    conn.executemany(f"""
+        INSERT INTO conteo_items (conteo_id, producto_id, cantidad_contada)
+        VALUES (?, ?, ?)
+        ON CONFLICT (conteo_id, producto_id) DO UPDATE SET
+            cantidad_contada = {nuevo_valor},
+            lecturas = conteo_items.lecturas + 1,
+            fecha_lectura = CURRENT_TIMESTAMP
+    """, filas)
+
+    return {
+        "registradas": len(filas),
+        "no_encontrados": list(dict.fromkeys(no_encontrados))
+    }
+
+def diferencias_conteo(conn, conteo_id: int, solo_diferencias: bool = True) -> dict:
+    """Diferencias entre lo contado y el stock (actual o el fijado al aplicar)"""
+    conteo = obtener_conteo(conn, conteo_id)
+    filtro = "AND diferencia != 0" if solo_diferencias else ""
+    rows = conn.execute(f"""
+        SELECT * FROM (
+            SELECT c.producto_id, p.codigo_barras, p.nombre, p.ubicacion, p.precio_unitario,
+                   COALESCE(c.cantidad_sistema, p.cantidad) AS cantidad_sistema,
+                   c.cantidad_contada, c.lecturas,
+                   c.cantidad_contada - COALESCE(c.cantidad_sistema, p.cantidad) AS diferencia
+            FROM conteo_items c
+            JOIN productos p ON p.id = c.producto_id
+            WHERE c.conteo_id = ?
+        )
+        WHERE 1 = 1 {filtro}
+        ORDER BY ABS(diferencia) DESC, nombre
+    """, (conteo_id,)).fetchall()
+
+    resumen = conn.execute("""
+        SELECT COUNT(*) AS contados,
+               COALESCE(SUM(d.diferencia != 0), 0) AS con_diferencia,
+               COALESCE(SUM(CASE WHEN d.diferencia < 0 THEN -d.diferencia ELSE 0 END), 0) AS faltantes,
+               COALESCE(SUM(CASE WHEN d.diferencia > 0 THEN d.diferencia ELSE 0 END), 0) AS sobrantes,
+               COALESCE(SUM(d.diferencia * COALESCE(d.precio_unitario, 0)), 0) AS valor_diferencia
+        FROM (
+            SELECT c.cantidad_contada - COALESCE(c.cantidad_sistema, p.cantidad) AS diferencia, p.precio_unitario
+            FROM conteo_items c
+            JOIN productos p ON p.id = c.producto_id
+            WHERE c.conteo_id = ?
+        ) d
+    """, (conteo_id,)).fetchone()
+
+    return {
+        "conteo": conteo,
+        "resumen": dict(resumen),
+        "diferencias": [dict(row) for row in rows]
+    }
+
+def aplicar_conteo(conn, conteo_id: int, usuario: dict) -> dict:
+    """Aplicar todos los ajustes de la sesión en la transacción del escritor"""
+    _conteo_abierto(conn, conteo_id)
+    cursor = conn.cursor()
+
+    # Fijar el stock contra el que se compara (queda guardado en la sesión)
+    cursor.execute("""
+        UPDATE conteo_items
+        SET cantidad_sistema = (SELECT cantidad FROM productos p WHERE p.id = conteo_items.producto_id)
+        WHERE conteo_id = ?
+    """, (conteo_id,))
+    # Productos eliminados después de leerlos
+    cursor.execute("DELETE FROM conteo_items WHERE conteo_id = ? AND cantidad_sistema IS NULL", (conteo_id,))
+
+    detalles = f"conteo #{conteo_id}"
+    cursor.execute("""
+        INSERT INTO historial (accion, producto_id, cantidad_anterior, cantidad_nueva, usuario_id, usuario_nombre, detalles)
+        SELECT 'conteo', producto_id, cantidad_sistema, cantidad_contada, ?, ?, ?
+        FROM conteo_items
+        WHERE conteo_id = ? AND cantidad_contada != cantidad_sistema
+    """, (usuario["id"], usuario["nombre_completo"], detalles, conteo_id))
+    ajustados = cursor.rowcount
+
+    cursor.execute("""
+        UPDATE productos
+        SET cantidad = (
+                SELECT c.cantidad_contada FROM conteo_items c
+                WHERE c.conteo_id = ? AND c.producto_id = productos.id
+            ),
+            fecha_actualizacion = CURRENT_TIMESTAMP
+        WHERE id IN (
+            SELECT producto_id FROM conteo_items
+            WHERE conteo_id = ? AND cantidad_contada != cantidad_sistema
+        )
+    """, (conteo_id, conteo_id))
+
+    contados = cursor.execute("SELECT COUNT(*) FROM conteo_items WHERE conteo_id = ?", (conteo_id,)).fetchone()[0]
+    cursor.execute("""
+        UPDATE conteos
+        SET estado = 'aplicado', fecha_cierre = CURRENT_TIMESTAMP,
+            productos_contados = ?, productos_ajustados = ?
+        WHERE id = ?
+    """, (contados, ajustados, conteo_id))
+
+    logger.info(f"📋 Conteo #{conteo_id} aplicado: {contados} productos contados, {ajustados} ajustados")
+    return {"productos_contados": contados, "productos_ajustados": ajustados}
+
+def cancelar_conteo(conn, conteo_id: int):
+    _conteo_abierto(conn, conteo_id)
+    conn.execute("""
+        UPDATE conteos SET estado = 'cancelado', fecha_cierre = CURRENT_TIMESTAMP
+        WHERE id = ?
+    """, (conteo_id,))
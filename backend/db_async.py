@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Capa de acceso a datos no bloqueante
+Sistema de Inventario - Empresa de Maquinados
+
+Los endpoints son `async def`, así que cualquier llamada bloqueante
+(sqlite3, reportlab, qrcode, python-barcode) detiene a todas las tablets.
+Este módulo ejecuta ese trabajo en pools de hilos acotados:
+
+- lecturas: tantos hilos como conexiones de lectura tiene el pool
+- escrituras: el hilo escritor de db_writer (commit agrupado)
+- render: generación de imágenes y PDFs (CPU)
+- procesos: trabajo de CPU largo (lotes de códigos, hojas de etiquetas,
+  PDFs de tickets) en procesos aparte, para que no compita por el GIL con
+  las peticiones; reporta la espera en cola y la duración por tarea
+
+Las funciones de lectura/escritura reciben la conexión como primer
+argumento. run_write() confirma la operación si termina sin errores y la
+revierte (solo esa operación) si lanza una excepción, así que la función
+no debe hacer commit.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Optional
+
+from db_pool import get_pool, init_pool
+from db_writer import get_write_queue, init_write_queue, close_write_queue
+from settings import get_settings
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+class _ExecutorStats:
+    """Contadores de trabajos en cola y en ejecución de un ejecutor"""
+
+    def __init__(self, nombre: str, max_workers: int):
+        self.nombre = nombre
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self.pendientes = 0
+        self.en_ejecucion = 0
+        self.completados = 0
+        self.errores = 0
+
+    def encolado(self):
+        with self._lock:
+            self.pendientes += 1
+
+    def iniciado(self):
+        with self._lock:
+            self.pendientes -= 1
+            self.en_ejecucion += 1
+
+    def terminado(self, ok: bool):
+        with self._lock:
+            self.en_ejecucion -= 1
+            self.completados += 1
+            if not ok:
+                self.errores += 1
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "hilos": self.max_workers,
+                "en_cola": self.pendientes,
+                "en_ejecucion": self.en_ejecucion,
+                "completados": self.completados,
+                "errores": self.errores
+            }
+
+class _ProcesosStats(_ExecutorStats):
+    """Contadores del pool de procesos, con tiempos por tipo de tarea
+
+    El inicio real de un trabajo ocurre en otro proceso: en ejecución son
+    los primeros max_workers pendientes (el pool es FIFO) y el resto está
+    en cola. La espera y la duración las mide el proceso hijo.
+    """
+
+    def __init__(self, nombre: str, max_workers: int):
+        super().__init__(nombre, max_workers)
+        self.tareas: Dict[str, Dict] = {}
+
+    def terminado(self, ok: bool, tarea: str = None, espera: float = 0.0, duracion: float = None):
+        with self._lock:
+            self.pendientes -= 1
+            self.completados += 1
+            if not ok:
+                self.errores += 1
+            if duracion is None:
+                return
+            t = self.tareas.setdefault(tarea, {"completados": 0, "espera_total": 0.0, "espera_max": 0.0,
+                                               "duracion_total": 0.0, "duracion_max": 0.0, "duracion_ultima": 0.0})
+            t["completados"] += 1
+            t["espera_total"] += espera
+            t["espera_max"] = max(t["espera_max"], espera)
+            t["duracion_total"] += duracion
+            t["duracion_max"] = max(t["duracion_max"], duracion)
+            t["duracion_ultima"] = duracion
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            en_ejecucion = min(self.pendientes, self.max_workers)
+            return {
+                "procesos": self.max_workers,
+                "en_cola": self.pendientes - en_ejecucion,
+                "en_ejecucion": en_ejecucion,
+                "completados": self.completados,
+                "errores": self.errores,
+                "tareas": {
+                    nombre: {
+                        "completados": t["completados"],
+                        "espera_promedio_ms": round(t["espera_total"] / t["completados"] * 1000, 1),
+                        "espera_max_ms": round(t["espera_max"] * 1000, 1),
+                        "duracion_promedio_ms": round(t["duracion_total"] / t["completados"] * 1000, 1),
+                        "duracion_max_ms": round(t["duracion_max"] * 1000, 1),
+                        "duracion_ultima_ms": round(t["duracion_ultima"] * 1000, 1)
+                    }
+                    for nombre, t in self.tareas.items()
+                }
+            }
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_stats: Dict[str, _ExecutorStats] = {}
+_executors_lock = threading.Lock()
+# El pool de procesos se crea hasta que se usa (arrancar procesos es caro)
+_procesos: Optional[ProcessPoolExecutor] = None
+_procesos_workers = 1
+
+def ensure_pool():
+    """Obtener el pool global, creándolo con la configuración si no existe"""
+    pool = get_pool()
+    if pool is None:
+        settings = get_settings()
+        pool = init_pool(settings.db_path, settings.db_pool_readers, settings.db_pool_timeout)
+    return pool
+
+def ensure_write_queue():
+    """Obtener el hilo escritor global, creándolo con la configuración si no existe"""
+    write_queue = get_write_queue()
+    if write_queue is None:
+        settings = get_settings()
+        write_queue = init_write_queue(ensure_pool(), settings.write_batch_max, settings.write_batch_window_ms)
+    return write_queue
+
+def init_executors(max_readers: int, render_workers: int = None, process_workers: int = None):
+    """Crear los pools de hilos (se llama una vez en lifespan)"""
+    global _procesos_workers
+    shutdown_executors()
+    if render_workers is None:
+        render_workers = min(4, os.cpu_count() or 1)
+    if process_workers is None:
+        # Dejar un núcleo para el servidor
+        process_workers = max(1, min(4, (os.cpu_count() or 1) - 1))
+    _procesos_workers = process_workers
+
+    hilos_por_ejecutor = {"lectura": max(1, max_readers), "render": max(1, render_workers)}
+    with _executors_lock:
+        for nombre, hilos in hilos_por_ejecutor.items():
+            _executors[nombre] = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix=f"db-{nombre}")
+            _stats[nombre] = _ExecutorStats(nombre, hilos)
+        _stats["procesos"] = _ProcesosStats("procesos", process_workers)
+    logger.info(f"✅ Ejecutores inicializados: {hilos_por_ejecutor} (procesos: {process_workers})")
+
+def shutdown_executors():
+    """Detener los pools de hilos y procesos esperando los trabajos en curso"""
+    global _procesos
+    with _executors_lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=True)
+        _executors.clear()
+        _stats.clear()
+        if _procesos is not None:
+            _procesos.shutdown(wait=True, cancel_futures=True)
+            _procesos = None
+    close_write_queue()
+
+def executor_stats() -> Dict:
+    """Estado de las colas de cada ejecutor y del hilo escritor"""
+    with _executors_lock:
+        estadisticas = {nombre: stats.to_dict() for nombre, stats in _stats.items()}
+    write_queue = get_write_queue()
+    if write_queue is not None:
+        estadisticas["escritura"] = write_queue.stats()
+    return estadisticas
+
+def _get_executor(nombre: str) -> ThreadPoolExecutor:
+    with _executors_lock:
+        executor = _executors.get(nombre)
+    if executor is None:
+        init_executors(ensure_pool().max_readers)
+        with _executors_lock:
+            executor = _executors[nombre]
+    return executor
+
+def _instrumentado(nombre: str, fn):
+    stats = _stats.get(nombre)
+
+    def ejecutar():
+        if stats is None:
+            return fn()
+        stats.iniciado()
+        ok = False
+        try:
+            resultado = fn()
+            ok = True
+            return resultado
+        finally:
+            stats.terminado(ok)
+
+    if stats is not None:
+        stats.encolado()
+    return ejecutar
+
+async def _submit(nombre: str, fn):
+    executor = _get_executor(nombre)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, _instrumentado(nombre, fn))
+
+def _ejecutar_lectura(fn, args, kwargs):
+    with ensure_pool().reader() as conn:
+        return fn(conn, *args, **kwargs)
+
+async def run_read(fn, *args, **kwargs):
+    """Ejecutar fn(conn, ...) con una conexión de lectura en el pool de hilos"""
+    return await _submit("lectura", partial(_ejecutar_lectura, fn, args, kwargs))
+
+async def run_write(fn, *args, **kwargs):
+    """Encolar fn(conn, ...) en el hilo escritor y esperar a que su lote se confirme"""
+    return await asyncio.wrap_future(ensure_write_queue().submit(fn, *args, **kwargs))
+
+async def run_blocking(fn, *args, **kwargs):
+    """Ejecutar trabajo de CPU corto (QR, códigos de barras) fuera del event loop"""
+    return await _submit("render", partial(fn, *args, **kwargs))
+
+def _get_procesos() -> ProcessPoolExecutor:
+    global _procesos
+    with _executors_lock:
+        if _procesos is None:
+            # spawn: los hijos no heredan hilos ni conexiones sqlite3 abiertas
+            _procesos = ProcessPoolExecutor(max_workers=_procesos_workers,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _procesos
+
+def procesos_workers() -> int:
+    """Procesos del pool (para repartir un trabajo grande en partes)"""
+    return _procesos_workers
+
+def _ejecutar_medido(fn, args, enviado: float):
+    """Corre en el proceso hijo: resultado, espera en la cola y duración"""
+    inicio = time.time()
+    t0 = time.perf_counter()
+    resultado = fn(*args)
+    return resultado, max(0.0, inicio - enviado), time.perf_counter() - t0
+
+async def run_process(fn, *args):
+    """Ejecutar fn(*args) en un proceso aparte (fn y argumentos deben poder serializarse)"""
+    stats = _stats.get("procesos")
+    if stats is not None:
+        stats.encolado()
+    ok = False
+    espera = duracion = None
+    try:
+        loop = asyncio.get_running_loop()
+        resultado, espera, duracion = await loop.run_in_executor(
+            _get_procesos(), partial(_ejecutar_medido, fn, args, time.time()))
+        ok = True
+        return resultado
+    finally:
+        if stats is not None:
+            stats.terminado(ok, fn.__name__, espera, duracion)
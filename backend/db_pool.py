@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pool de conexiones SQLite
+Sistema de Inventario - Empresa de Maquinados
+
+Mantiene un conjunto acotado de conexiones de lectura y una conexión
+dedicada de escritura. Cada conexión se configura una sola vez (PRAGMAs)
+y se reutiliza entre peticiones, así la caché de páginas se conserva.
+"""
+
+import sqlite3
+import threading
+import time
+import queue
+import logging
+from typing import Dict, List, Optional
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# PRAGMAs que antes se ejecutaban en cada get_db_connection()
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=20000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=60000",
+    "PRAGMA wal_autocheckpoint=1000",
+)
+
+class ConnectionInfo:
+    """Datos de vida de una conexión física del pool"""
+
+    def __init__(self, conn_id: int, tipo: str):
+        self.id = conn_id
+        self.tipo = tipo
+        self.creada = time.time()
+        self.usos = 0
+        self.en_uso = False
+        self.ultimo_uso: Optional[float] = None
+
+    def to_dict(self) -> Dict:
+        ahora = time.time()
+        return {
+            "id": self.id,
+            "tipo": self.tipo,
+            "edad_segundos": round(ahora - self.creada, 1),
+            "usos": self.usos,
+            "en_uso": self.en_uso,
+            "inactiva_segundos": round(ahora - self.ultimo_uso, 1) if self.ultimo_uso and not self.en_uso else None
+        }
+
+class PooledConnection:
+    """Conexión prestada por el pool
+
+    Se comporta como sqlite3.Connection. Al llamar close() (o al salir de un
+    bloque with) la conexión regresa al pool en lugar de cerrarse.
+    """
+
+    def __init__(self, pool: "ConnectionPool", conn: sqlite3.Connection, info: ConnectionInfo):
+        self._pool = pool
+        self._conn = conn
+        self._info = info
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("La conexión ya fue devuelta al pool")
+        return getattr(self._conn, name)
+
+    def close(self):
+        """Devolver la conexión al pool (es seguro llamarlo varias veces)"""
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool._release(conn, self._info)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+class _PoolCounters:
+    """Contadores de préstamos y esperas para un tipo de conexión"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.esperas = 0
+        self.timeouts = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+
+    def registrar(self, espera: float):
+        self.checkouts += 1
+        if espera > 0:
+            self.esperas += 1
+            self.espera_total += espera
+            self.espera_max = max(self.espera_max, espera)
+
+    def to_dict(self) -> Dict:
+        return {
+            "checkouts": self.checkouts,
+            "esperas": self.esperas,
+            "timeouts": self.timeouts,
+            "espera_total_ms": round(self.espera_total * 1000, 2),
+            "espera_promedio_ms": round(self.espera_total * 1000 / self.esperas, 2) if self.esperas else 0.0,
+            "espera_max_ms": round(self.espera_max * 1000, 2)
+        }
+
+class ConnectionPool:
+    """Pool con N conexiones de lectura y una conexión de escritura"""
+
+    def __init__(self, db_path: str, max_readers: int = 4, timeout: float = 30.0):
+        self.db_path = db_path
+        self.max_readers = max(1, max_readers)
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        # LIFO: la conexión usada más recientemente tiene la caché más caliente
+        self._idle_readers: "queue.LifoQueue" = queue.LifoQueue()
+        self._connections: List[ConnectionInfo] = []
+        self._next_id = 1
+        self._closed = False
+
+        self._writer_lock = threading.Lock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._writer_info: Optional[ConnectionInfo] = None
+
+        self._reader_counters = _PoolCounters()
+        self._writer_counters = _PoolCounters()
+        self._lectores_creados = 0
+
+    def _open(self, tipo: str):
+        """Abrir y configurar una conexión física (una sola vez)"""
+        conn = sqlite3.connect(self.db_path, timeout=60.0, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        if tipo == "lector":
+            # Evita que un endpoint escriba por error con una conexión de lectura
+            conn.execute("PRAGMA query_only=ON")
+
+        with self._lock:
+            info = ConnectionInfo(self._next_id, tipo)
+            self._next_id += 1
+            self._connections.append(info)
+
+        logger.info(f"🔌 Nueva conexión {tipo} #{info.id} a {self.db_path}")
+        return conn, info
+
+    def _checkout(self, conn: sqlite3.Connection, info: ConnectionInfo) -> PooledConnection:
+        info.en_uso = True
+        info.usos += 1
+        info.ultimo_uso = time.time()
+        return PooledConnection(self, conn, info)
+
+    def reader(self) -> PooledConnection:
+        """Obtener una conexión de solo lectura"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("El pool de conexiones está cerrado")
+
+        inicio = time.perf_counter()
+        espera = 0.0
+        try:
+            conn, info = self._idle_readers.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                crear = self._lectores_creados < self.max_readers
+                if crear:
+                    self._lectores_creados += 1
+
+            if crear:
+                try:
+                    conn, info = self._open("lector")
+                except Exception:
+                    with self._lock:
+                        self._lectores_creados -= 1
+                    raise
+            else:
+                # Todas las conexiones están prestadas: esperar a que se libere una
+                try:
+                    conn, info = self._idle_readers.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._reader_counters.timeouts += 1
+                    raise sqlite3.OperationalError(
+                        f"Sin conexiones de lectura disponibles después de {self.timeout}s"
+                    )
+                espera = time.perf_counter() - inicio
+
+        with self._lock:
+            self._reader_counters.registrar(espera)
+        return self._checkout(conn, info)
+
+    def writer(self) -> PooledConnection:
+        """Obtener la conexión dedicada de escritura (exclusiva)"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("El pool de conexiones está cerrado")
+
+        inicio = time.perf_counter()
+        espera = 0.0
+        if not self._writer_lock.acquire(blocking=False):
+            if not self._writer_lock.acquire(timeout=self.timeout):
+                with self._lock:
+                    self._writer_counters.timeouts += 1
+                raise sqlite3.OperationalError(
+                    f"La conexión de escritura sigue ocupada después de {self.timeout}s"
+                )
+            espera = time.perf_counter() - inicio
+
+        try:
+            if self._writer is None:
+                self._writer, self._writer_info = self._open("escritor")
+        except Exception:
+            self._writer_lock.release()
+            raise
+
+        with self._lock:
+            self._writer_counters.registrar(espera)
+        return self._checkout(self._writer, self._writer_info)
+
+    def _release(self, conn: sqlite3.Connection, info: ConnectionInfo):
+        """Regresar una conexión al pool descartando transacciones abiertas"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            logger.warning(f"Error revirtiendo transacción de conexión #{info.id}: {e}")
+
+        info.en_uso = False
+        info.ultimo_uso = time.time()
+
+        if info.tipo == "escritor":
+            self._writer_lock.release()
+        elif self._closed:
+            conn.close()
+        else:
+            self._idle_readers.put((conn, info))
+
+    def stats(self) -> Dict:
+        """Estadísticas del pool para dimensionarlo"""
+        with self._lock:
+            conexiones = [info.to_dict() for info in self._connections]
+            lectores_en_uso = sum(1 for c in conexiones if c["tipo"] == "lector" and c["en_uso"])
+            return {
+                "db_path": self.db_path,
+                "lectores": {
+                    "maximo": self.max_readers,
+                    "creados": self._lectores_creados,
+                    "en_uso": lectores_en_uso,
+                    "disponibles": self._idle_readers.qsize(),
+                    **self._reader_counters.to_dict()
+                },
+                "escritor": {
+                    "abierto": self._writer is not None,
+                    "en_uso": self._writer_lock.locked(),
+                    **self._writer_counters.to_dict()
+                },
+                "conexiones": conexiones
+            }
+
+    def close(self):
+        """Cerrar todas las conexiones inactivas del pool"""
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle_readers.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+        if self._writer is not None and self._writer_lock.acquire(timeout=5):
+            try:
+                self._writer.close()
+                self._writer = None
+            finally:
+                self._writer_lock.release()
+        logger.info("🔌 Pool de conexiones cerrado")
+
+# Instancia global del pool
+pool = None
+
+def init_pool(db_path: str, max_readers: int = 4, timeout: float = 30.0) -> ConnectionPool:
+    """Inicializar el pool global de conexiones"""
+    global pool
+    if pool is not None:
+        pool.close()
+    pool = ConnectionPool(db_path, max_readers, timeout)
+    logger.info(f"✅ Pool de conexiones inicializado ({max_readers} lectores + 1 escritor) para {db_path}")
+    return pool
+
+def get_pool() -> Optional[ConnectionPool]:
+    """Obtener el pool global (None si no se ha inicializado)"""
+    return pool
+
+def close_pool():
+    """Cerrar el pool global"""
+    global pool
+    if pool is not None:
+        pool.close()
+        pool = None
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cola de escritura con commit agrupado
+Sistema de Inventario - Empresa de Maquinados
+
+Un único hilo escritor toma las operaciones de una cola. Las que llegan
+casi al mismo tiempo se ejecutan dentro de una sola transacción
+(BEGIN IMMEDIATE ... COMMIT), cada una protegida por su propio SAVEPOINT:
+si una operación falla solo se revierte esa operación y el resto del lote
+se confirma. Los resultados se entregan con futures cuando el COMMIT ya
+se realizó, así nadie recibe un resultado que luego se pierda.
+
+Como solo este hilo escribe, las peticiones ya no compiten por el candado
+de escritura de SQLite ni dependen del busy_timeout.
+"""
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+from db_pool import ConnectionPool
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+class _Operacion:
+    """Una función de escritura pendiente y el future de su resultado"""
+
+    __slots__ = ("fn", "args", "kwargs", "future", "encolada")
+
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future: Future = Future()
+        self.encolada = time.perf_counter()
+
+class _WriteCounters:
+    """Contadores de lotes y operaciones del hilo escritor"""
+
+    def __init__(self):
+        self.operaciones = 0
+        self.errores = 0
+        self.lotes = 0
+        self.lote_max = 0
+        self.commits_fallidos = 0
+        self.reintentos_bloqueo = 0
+        self.espera_total = 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "operaciones": self.operaciones,
+            "errores": self.errores,
+            "lotes": self.lotes,
+            "lote_promedio": round(self.operaciones / self.lotes, 2) if self.lotes else 0.0,
+            "lote_max": self.lote_max,
+            "commits_fallidos": self.commits_fallidos,
+            "reintentos_bloqueo": self.reintentos_bloqueo,
+            "espera_promedio_ms": round(self.espera_total * 1000 / self.operaciones, 2) if self.operaciones else 0.0
+        }
+
+_DETENER = object()
+
+class WriteQueue:
+    """Hilo escritor único con commit agrupado"""
+
+    def __init__(self, pool: ConnectionPool, batch_max: int = 64, batch_window_ms: float = 2.0):
+        self.pool = pool
+        self.batch_max = max(1, batch_max)
+        self.batch_window = max(0.0, batch_window_ms) / 1000
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._counters = _WriteCounters()
+        self._en_ejecucion = 0
+        self._closed = False
+        self._observadores: List[Callable] = []
+
+        self._thread = threading.Thread(target=self._run, name="db-escritor", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Encolar fn(conn, ...) y devolver el future con su resultado"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("La cola de escritura está cerrada")
+        operacion = _Operacion(fn, args, kwargs)
+        self._queue.put(operacion)
+        return operacion.future
+
+    def agregar_observador(self, fn: Callable):
+        """fn(conn) se llama en el hilo escritor después de cada COMMIT,
+        antes de entregar los resultados (p. ej. para publicar la versión
+        del catálogo)"""
+        self._observadores.append(fn)
+
+    def _notificar(self, conn):
+        for fn in self._observadores:
+            try:
+                fn(conn)
+            except Exception as e:
+                # El lote ya se confirmó: un observador no puede hacerlo fallar
+                logger.warning(f"⚠️ Observador de escrituras falló: {e}")
+
+    def _siguiente_lote(self) -> Optional[List[_Operacion]]:
+        """Esperar la primera operación y juntar las que lleguen en la ventana"""
+        primera = self._queue.get()
+        if primera is _DETENER:
+            return None
+
+        lote = [primera]
+        limite = time.perf_counter() + self.batch_window
+        while len(lote) < self.batch_max:
+            restante = limite - time.perf_counter()
+            try:
+                operacion = self._queue.get(timeout=restante) if restante > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if operacion is _DETENER:
+                # Procesar lo ya tomado y detenerse en la siguiente vuelta
+                self._queue.put(_DETENER)
+                break
+            lote.append(operacion)
+        return lote
+
+    def _run(self):
+        while True:
+            lote = self._siguiente_lote()
+            if lote is None:
+                break
+            # Descartar operaciones cuyo await ya se canceló
+            lote = [op for op in lote if op.future.set_running_or_notify_cancel()]
+            if not lote:
+                continue
+            with self._lock:
+                self._en_ejecucion = len(lote)
+            try:
+                self._ejecutar_lote(lote)
+            except BaseException as e:
+                logger.error(f"❌ Error inesperado en el hilo escritor: {e}")
+                for op in lote:
+                    if not op.future.done():
+                        op.future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._en_ejecucion = 0
+
+    def _begin(self, conn):
+        """BEGIN IMMEDIATE reintentando si otro proceso tiene la base bloqueada"""
+        espera = 0.05
+        while True:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) and "busy" not in str(e):
+                    raise
+                with self._lock:
+                    self._counters.reintentos_bloqueo += 1
+                logger.warning(f"⚠️ Base de datos bloqueada por otro proceso, reintentando en {espera:.2f}s")
+                time.sleep(espera)
+                espera = min(espera * 2, 1.0)
+
+    def _ejecutar_lote(self, lote: List[_Operacion]):
+        inicio = time.perf_counter()
+        resultados = []
+
+        with self.pool.writer() as conn:
+            self._begin(conn)
+            try:
+                for i, op in enumerate(lote):
+                    savepoint = f"op_{i}"
+                    conn.execute(f"SAVEPOINT {savepoint}")
+                    try:
+                        valor = op.fn(conn, *op.args, **op.kwargs)
+                    except Exception as e:
+                        conn.execute(f"ROLLBACK TO {savepoint}")
+                        conn.execute(f"RELEASE {savepoint}")
+                        resultados.append((op, False, e))
+                    else:
+                        conn.execute(f"RELEASE {savepoint}")
+                        resultados.append((op, True, valor))
+                conn.commit()
+            except BaseException as e:
+                try:
+                    conn.rollback()
+                except sqlite3.Error:
+                    pass
+                with self._lock:
+                    self._counters.commits_fallidos += 1
+                logger.error(f"❌ Lote de {len(lote)} escrituras revertido: {e}")
+                for op in lote:
+                    op.future.set_exception(e)
+                return
+            self._notificar(conn)
+
+        # Entregar resultados solo después del COMMIT
+        errores = 0
+        for op, ok, valor in resultados:
+            if ok:
+                op.future.set_result(valor)
+            else:
+                errores += 1
+                op.future.set_exception(valor)
+
+        with self._lock:
+            self._counters.lotes += 1
+            self._counters.operaciones += len(lote)
+            self._counters.errores += errores
+            self._counters.lote_max = max(self._counters.lote_max, len(lote))
+            self._counters.espera_total += sum(inicio - op.encolada for op in lote)
+
+    def stats(self) -> Dict:
+        """Estadísticas de la cola para dimensionar la ventana de agrupación"""
+        with self._lock:
+            return {
+                "en_cola": self._queue.qsize(),
+                "en_ejecucion": self._en_ejecucion,
+                "lote_maximo_configurado": self.batch_max,
+                "ventana_ms": round(self.batch_window * 1000, 2),
+                **self._counters.to_dict()
+            }
+
+    def close(self, timeout: float = 30.0):
+        """Procesar lo pendiente y detener el hilo escritor"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_DETENER)
+        self._thread.join(timeout)
+        logger.info("✍️ Cola de escritura detenida")
+
+# Instancia global de la cola de escritura
+write_queue = None
+
+def init_write_queue(pool: ConnectionPool, batch_max: int = 64, batch_window_ms: float = 2.0) -> WriteQueue:
+    """Inicializar el hilo escritor global"""
+    global write_queue
+    if write_queue is not None:
+        write_queue.close()
+    write_queue = WriteQueue(pool, batch_max, batch_window_ms)
+    logger.info(f"✅ Cola de escritura inicializada (lotes de hasta {batch_max}, ventana {batch_window_ms} ms)")
+    return write_queue
+
+def get_write_queue() -> Optional[WriteQueue]:
+    """Obtener la cola global (None si no se ha inicializado)"""
+    return write_queue
+
+def close_write_queue():
+    """Detener el hilo escritor global"""
+    global write_queue
+    if write_queue is not None:
+        write_queue.close()
+        write_queue = None
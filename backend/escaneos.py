@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Resolución de códigos escaneados (código de barras o QR)
+Sistema de Inventario - Empresa de Maquinados
+
+Índice en memoria compartido por /api/productos/buscar y la devolución de
+tickets: código de barras -> producto, id -> producto y nombre normalizado
+-> producto (para QR "ID:8|Nombre:...|Codigo:..." de productos que ya no
+existen con ese id). Guarda las columnas que devuelve la búsqueda por
+código, así que un escaneo normal no toca SQLite.
+
+Se mantiene al día con la versión del catálogo: el hilo escritor la
+publica después de cada COMMIT y, si cambió, se aplican solo los productos
+cambiados y eliminados desde la versión del índice (como trigramas.py).
+"""
+
+import logging
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from catalogo import leer_cambios_catalogo, leer_version_catalogo, publicar_version_catalogo, version_local_vigente
+from trigramas import normalizar
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Columnas que devuelve la búsqueda por código (la primera es el id)
+COLUMNAS_ESCANEO = (
+    "id", "codigo_barras", "nombre", "descripcion", "cantidad",
+    "cantidad_minima", "ubicacion", "categoria", "precio_unitario"
+)
+
+# Códigos aceptados por /api/productos/buscar-lote
+ESCANEO_LOTE_MAX = 500
+
+_CAMPO_QR = re.compile(r"^\s*(ID|Nombre|Codigo)\s*:(.*)$", re.IGNORECASE)
+
+def limpiar_codigo(codigo: str) -> str:
+    """Quitar espacios y caracteres de control que agregan algunos lectores"""
+    return "".join(c for c in str(codigo or "") if c.isprintable()).strip()
+
+def campos_qr(codigo: str) -> Dict[str, str]:
+    """Campos de un QR "ID:8|Nombre:Popote|Codigo:..." (claves en minúsculas)"""
+    campos: Dict[str, str] = {}
+    for parte in codigo.split("|"):
+        coincidencia = _CAMPO_QR.match(parte)
+        if coincidencia:
+            campos.setdefault(coincidencia.group(1).lower(), coincidencia.group(2).strip())
+    return campos
+
+class ResolvedorEscaneos:
+    """Índices código de barras / id / nombre -> fila del producto"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._por_id: Dict[int, tuple] = {}
+        self._por_codigo: Dict[str, int] = {}
+        self._por_nombre: Dict[str, Set[int]] = {}
+        self.version: Optional[int] = None
+        self.cargas_completas = 0
+        self.actualizaciones = 0
+        self.aciertos = 0
+        self.fallos = 0
+
+    def _quitar(self, producto_id: int):
+        fila = self._por_id.pop(producto_id, None)
+        if fila is None:
+            return
+        codigo = fila[1]
+        if codigo and self._por_codigo.get(codigo) == producto_id:
+            del self._por_codigo[codigo]
+        nombre = normalizar(fila[2])
+        ids = self._por_nombre.get(nombre)
+        if ids is not None:
+            ids.discard(producto_id)
+            if not ids:
+                del self._por_nombre[nombre]
+
+    def _agregar(self, fila: tuple):
+        producto_id = fila[0]
+        self._quitar(producto_id)
+        self._por_id[producto_id] = fila
+        if fila[1]:
+            self._por_codigo[fila[1]] = producto_id
+        self._por_nombre.setdefault(normalizar(fila[2]), set()).add(producto_id)
+
+    def al_dia(self) -> bool:
+        """¿El índice tiene la versión publicada por el escritor? (sin SQLite)"""
+        version = version_local_vigente()
+        return version is not None and self.version is not None and self.version >= version
+
+    def actualizar(self, conn):
+        """Cargar o aplicar los cambios del catálogo desde la última versión"""
+        version_actual = leer_version_catalogo(conn)
+        publicar_version_catalogo(version_actual)
+        if self.version is not None and self.version >= version_actual:
+            return
+
+        with self._lock:
+            if self.version is not None and self.version >= version_actual:
+                return
+            inicio = time.perf_counter()
+            version, filas, eliminados = leer_cambios_catalogo(conn, self.version, ", ".join(COLUMNAS_ESCANEO))
+
+            for producto_id in eliminados:
+                self._quitar(producto_id)
+            for row in filas:
+                self._agregar(tuple(row))
+
+            if self.version is None:
+                self.cargas_completas += 1
+                logger.info(f"🔖 Índice de escaneos cargado: {len(self._por_id)} productos "
+                            f"en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+            else:
+                self.actualizaciones += 1
+            self.version = version
+
+    def _buscar_id(self, codigo: str) -> Optional[int]:
+        # Código de barras exacto
+        producto_id = self._por_codigo.get(codigo)
+        if producto_id is not None:
+            return producto_id
+
+        campos = campos_qr(codigo)
+        if "id" in campos:
+            try:
+                producto_id = int(campos["id"])
+            except ValueError:
+                producto_id = None
+            if producto_id in self._por_id:
+                return producto_id
+        if campos.get("codigo") in self._por_codigo:
+            return self._por_codigo[campos["codigo"]]
+        if campos.get("nombre"):
+            # Solo si el nombre identifica a un único producto
+            ids = self._por_nombre.get(normalizar(campos["nombre"]))
+            if ids and len(ids) == 1:
+                return next(iter(ids))
+        return None
+
+    def resolver(self, codigo: str) -> Optional[dict]:
+        """Producto del código escaneado con COLUMNAS_ESCANEO, o None"""
+        codigo = limpiar_codigo(codigo)
+        if not codigo:
+            return None
+        with self._lock:
+            producto_id = self._buscar_id(codigo)
+            fila = self._por_id.get(producto_id) if producto_id is not None else None
+            if fila is None:
+                self.fallos += 1
+                return None
+            self.aciertos += 1
+        return dict(zip(COLUMNAS_ESCANEO, fila))
+
+    def producto(self, producto_id: int) -> Optional[dict]:
+        """Fila de un producto por id (sin SQLite), o None"""
+        with self._lock:
+            fila = self._por_id.get(producto_id)
+        return dict(zip(COLUMNAS_ESCANEO, fila)) if fila is not None else None
+
+    def resolver_lote(self, codigos: List[str]) -> Tuple[List[dict], List[str]]:
+        """Resolver varios códigos de una vez: ([{codigo, producto}], no encontrados)
+
+        Cada código distinto aparece una sola vez, en el orden en que llegó.
+        """
+        encontrados: List[dict] = []
+        no_encontrados: List[str] = []
+        with self._lock:
+            for codigo in dict.fromkeys(filter(None, map(limpiar_codigo, codigos))):
+                producto_id = self._buscar_id(codigo)
+                fila = self._por_id.get(producto_id) if producto_id is not None else None
+                if fila is None:
+                    no_encontrados.append(codigo)
+                else:
+                    encontrados.append({"codigo": codigo, "producto": dict(zip(COLUMNAS_ESCANEO, fila))})
+            self.aciertos += len(encontrados)
+            self.fallos += len(no_encontrados)
+        return encontrados, no_encontrados
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "version": self.version,
+                "productos": len(self._por_id),
+                "codigos": len(self._por_codigo),
+                "cargas_completas": self.cargas_completas,
+                "actualizaciones": self.actualizaciones,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos
+            }
+
+# Instancia global del resolvedor de escaneos
+resolvedor_escaneos = ResolvedorEscaneos()
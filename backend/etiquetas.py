@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Etiquetas ZPL para impresoras térmicas (Zebra y compatibles)
+Sistema de Inventario - Empresa de Maquinados
+
+En lugar de mandar el QR y el código de barras como imágenes, la etiqueta
+se describe en ZPL y la impresora dibuja los códigos: unos cientos de
+bytes por etiqueta y nada que renderizar en el servidor. Funciones puras,
+la salida depende solo de los datos del producto.
+
+Etiqueta de 2" x 1" a 203 dpi: QR a la izquierda; nombre, ubicación y
+Code128 a la derecha.
+"""
+
+from typing import Iterable
+
+from codigos import codigo_barras_producto, contenido_qr
+
+# Starlette agrega "; charset=utf-8"
+MEDIA_TYPE_ZPL = "text/plain"
+
+# Etiquetas aceptadas por /api/productos/etiquetas
+ETIQUETAS_LOTE_MAX = 500
+ETIQUETAS_COPIAS_MAX = 100
+
+# Medidas en puntos (203 dpi = 8 puntos por mm)
+ETIQUETA_ANCHO = 406
+ETIQUETA_ALTO = 203
+MARGEN = 10
+QR_AMPLIACION = 3
+TEXTO_X = 140
+TEXTO_ANCHO = ETIQUETA_ANCHO - TEXTO_X - MARGEN
+BARRAS_Y = 110
+BARRAS_ALTO = 50
+
+def campo_zpl(texto) -> str:
+    """Escapar un texto para ^FD (se usa con ^FH_: _XX es un byte en hexadecimal)
+
+    ^ y ~ son prefijos de comandos y _ es el indicador de ^FH.
+    """
+    texto = " ".join(str(texto or "").split())
+    return texto.replace("_", "_5F").replace("^", "_5E").replace("~", "_7E")
+
+def etiqueta_zpl(producto: dict, copias: int = 1) -> str:
+    """ZPL de la etiqueta de un producto (id, nombre, codigo_barras, ubicacion)"""
+    qr = contenido_qr(producto["id"], producto["nombre"], producto.get("codigo_barras"))
+    barras = codigo_barras_producto(producto["id"], producto.get("codigo_barras"))
+    ubicacion = producto.get("ubicacion") or "-"
+    lineas = [
+        "^XA",
+        "^CI28",
+        f"^PW{ETIQUETA_ANCHO}",
+        f"^LL{ETIQUETA_ALTO}",
+        f"^FO{MARGEN},{MARGEN}^BQN,2,{QR_AMPLIACION}^FH_^FDLA,{campo_zpl(qr)}^FS",
+        f"^FO{TEXTO_X},{MARGEN}^A0N,22,22^FB{TEXTO_ANCHO},2,0,L^FH_^FD{campo_zpl(producto['nombre'])}^FS",
+        f"^FO{TEXTO_X},62^A0N,30,30^FH_^FDUbic: {campo_zpl(ubicacion)}^FS",
+        f"^FO{TEXTO_X},{BARRAS_Y}^BY1,2,{BARRAS_ALTO}^BCN,{BARRAS_ALTO},Y,N,N^FH_^FD{campo_zpl(barras)}^FS",
+    ]
+    if copias > 1:
+        lineas.append(f"^PQ{copias}")
+    lineas.append("^XZ")
+    return "\n".join(lineas) + "\n"
+
+def etiquetas_zpl(productos: Iterable[dict], copias: int = 1) -> str:
+    """Varias etiquetas en un solo documento (la impresora las toma en orden)"""
+    return "".join(etiqueta_zpl(producto, copias) for producto in productos)
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exportación de productos e historial a CSV y Excel (XLSX), y de PDFs de tickets en ZIP
+Sistema de Inventario - Empresa de Maquinados
+
+Las filas se leen por bloques con paginación por id (keyset) y cada bloque
+se codifica y se envía antes de leer el siguiente, así la memoria usada no
+depende del tamaño de la tabla. El XLSX se escribe a mano (es un ZIP con
+XML) sobre un flujo que se vacía después de cada bloque, sin necesitar
+openpyxl ni un archivo temporal. El ZIP de PDFs de tickets se escribe
+igual, un PDF a la vez.
+"""
+
+import csv
+import io
+import re
+import zipfile
+from typing import Iterable, List, Sequence, Tuple
+from xml.sax.saxutils import escape
+
+# Filas por bloque leído de la base
+EXPORT_BLOQUE = 1000
+
+# (columna SQL, título) de cada exportación
+COLUMNAS_PRODUCTOS: List[Tuple[str, str]] = [
+    ("id", "ID"),
+    ("codigo_barras", "Código de barras"),
+    ("nombre", "Nombre"),
+    ("descripcion", "Descripción"),
+    ("cantidad", "Cantidad"),
+    ("cantidad_minima", "Cantidad mínima"),
+    ("ubicacion", "Ubicación"),
+    ("categoria", "Categoría"),
+    ("precio_unitario", "Precio unitario"),
+    ("fecha_creacion", "Fecha de creación"),
+    ("fecha_actualizacion", "Última actualización"),
+]
+COLUMNAS_HISTORIAL: List[Tuple[str, str]] = [
+    ("id", "ID"),
+    ("fecha", "Fecha"),
+    ("accion", "Acción"),
+    ("producto_id", "ID producto"),
+    ("producto_nombre", "Producto"),
+    ("cantidad_anterior", "Cantidad anterior"),
+    ("cantidad_nueva", "Cantidad nueva"),
+    ("usuario_nombre", "Usuario"),
+    ("detalles", "Detalles"),
+]
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+def leer_bloque_productos(conn, despues_de: int) -> list:
+    columnas = ", ".join(c for c, _ in COLUMNAS_PRODUCTOS)
+    return conn.execute(f"""
+        SELECT {columnas} FROM productos
+        WHERE id > ? ORDER BY id LIMIT ?
+    """, (despues_de, EXPORT_BLOQUE)).fetchall()
+
+def leer_bloque_historial(conn, despues_de: int, desde: str = None, hasta: str = None) -> list:
+    """Historial en orden de id; desde/hasta filtran por fecha (YYYY-MM-DD)"""
+    condiciones = ["h.id > ?"]
+    params: list = [despues_de]
+    if desde:
+        condiciones.append("h.fecha >= ?")
+        params.append(desde)
+    if hasta:
+        condiciones.append("h.fecha < date(?, '+1 day')")
+        params.append(hasta)
+    params.append(EXPORT_BLOQUE)
+    return conn.execute(f"""
+        SELECT h.id, h.fecha, h.accion, h.producto_id, p.nombre AS producto_nombre,
+               h.cantidad_anterior, h.cantidad_nueva, h.usuario_nombre, h.detalles
+        FROM historial h
+        LEFT JOIN productos p ON h.producto_id = p.id
+        WHERE {" AND ".join(condiciones)}
+        ORDER BY h.id LIMIT ?
+    """, params).fetchall()
+
+# Estados de ticket que acepta la exportación de PDFs
+ESTADOS_TICKET = ("pendiente", "entregado", "devuelto")
+
+def leer_bloque_tickets(conn, despues_de: int, desde: str = None, hasta: str = None, estado: str = None) -> list:
+    """Tickets en orden de id con lo que necesita la caché de PDFs; filtra por fecha de solicitud y estado"""
+    condiciones = ["id > ?"]
+    params: list = [despues_de]
+    if desde:
+        condiciones.append("fecha_solicitud >= ?")
+        params.append(desde)
+    if hasta:
+        condiciones.append("fecha_solicitud < date(?, '+1 day')")
+        params.append(hasta)
+    if estado:
+        condiciones.append("estado = ?")
+        params.append(estado)
+    params.append(EXPORT_BLOQUE)
+    return conn.execute(f"""
+        SELECT id, numero_ticket, solicitante_id, version,
+               COALESCE(fecha_version, fecha_solicitud) AS fecha_version
+        FROM tickets_compra
+        WHERE {" AND ".join(condiciones)}
+        ORDER BY id LIMIT ?
+    """, params).fetchall()
+
+class EscritorCsv:
+    """CSV en UTF-8 con BOM (Excel lo abre con acentos correctos)"""
+
+    def __init__(self, titulos: Sequence[str]):
+        self.titulos = titulos
+
+    def inicio(self) -> bytes:
+        return "\ufeff".encode("utf-8") + self.filas([self.titulos])
+
+    def filas(self, filas: Iterable[Sequence]) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(filas)
+        return buffer.getvalue().encode("utf-8")
+
+    def fin(self) -> bytes:
+        return b""
+
+class _Sumidero(io.RawIOBase):
+    """Flujo sin seek donde escribe zipfile; se vacía después de cada bloque"""
+
+    def __init__(self):
+        self._partes: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, datos) -> int:
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def vaciar(self) -> bytes:
+        datos = b"".join(self._partes)
+        self._partes = []
+        return datos
+
+# Caracteres no permitidos en XML 1.0
+_CONTROL_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_XLSX_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+</Types>"""
+_XLSX_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+_XLSX_WORKBOOK = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="{hoja}" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+_XLSX_WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>"""
+# Estilo 1: encabezado en negritas
+_XLSX_STYLES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/><xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>"""
+_XLSX_HOJA_INICIO = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/></sheetView></sheetViews>
+<sheetData>"""
+_XLSX_HOJA_FIN = "</sheetData></worksheet>"
+
+class EscritorXlsx:
+    """Libro de Excel de una hoja escrito por partes
+
+    Las celdas de texto van como inlineStr (sin tabla de cadenas
+    compartidas, que obligaría a tener todo el texto en memoria).
+    """
+
+    def __init__(self, titulos: Sequence[str], hoja: str = "Datos"):
+        self.titulos = titulos
+        self.hoja = hoja
+        self._sumidero = _Sumidero()
+        self._zip = None
+        self._entrada = None
+
+    @staticmethod
+    def _celda(valor, estilo: str = "") -> str:
+        if valor is None:
+            return "<c/>"
+        if isinstance(valor, bool):
+            valor = int(valor)
+        if isinstance(valor, (int, float)):
+            return f"<c{estilo}><v>{valor!r}</v></c>"
+        texto = escape(_CONTROL_XML.sub("", str(valor)))
+        return f'<c t="inlineStr"{estilo}><is><t xml:space="preserve">{texto}</t></is></c>'
+
+    def _fila(self, valores, estilo: str = "") -> str:
+        return "<row>" + "".join(self._celda(v, estilo) for v in valores) + "</row>"
+
+    def inicio(self) -> bytes:
+        self._zip = zipfile.ZipFile(self._sumidero, "w", compression=zipfile.ZIP_DEFLATED)
+        self._zip.writestr("[Content_Types].xml", _XLSX_CONTENT_TYPES)
+        self._zip.writestr("_rels/.rels", _XLSX_RELS)
+        self._zip.writestr("xl/workbook.xml", _XLSX_WORKBOOK.format(hoja=escape(self.hoja)))
+        self._zip.writestr("xl/_rels/workbook.xml.rels", _XLSX_WORKBOOK_RELS)
+        self._zip.writestr("xl/styles.xml", _XLSX_STYLES)
+        self._entrada = self._zip.open("xl/worksheets/sheet1.xml", "w", force_zip64=True)
+        self._entrada.write((_XLSX_HOJA_INICIO + self._fila(self.titulos, ' s="1"')).encode("utf-8"))
+        return self._sumidero.vaciar()
+
+    def filas(self, filas: Iterable[Sequence]) -> bytes:
+        self._entrada.write("".join(self._fila(f) for f in filas).encode("utf-8"))
+        return self._sumidero.vaciar()
+
+    def fin(self) -> bytes:
+        self._entrada.write(_XLSX_HOJA_FIN.encode("utf-8"))
+        self._entrada.close()
+        self._zip.close()
+        return self._sumidero.vaciar()
+
+class ArchivoZip:
+    """ZIP escrito por partes: cada archivo sale en cuanto se agrega
+
+    Sin compresión: los archivos (PDFs) ya vienen comprimidos. Solo el
+    índice del final queda en memoria.
+    """
+
+    def __init__(self):
+        self._sumidero = _Sumidero()
+        self._zip = zipfile.ZipFile(self._sumidero, "w", compression=zipfile.ZIP_STORED)
+
+    def agregar(self, nombre: str, datos: bytes) -> bytes:
+        self._zip.writestr(nombre, datos)
+        return self._sumidero.vaciar()
+
+    def fin(self) -> bytes:
+        self._zip.close()
+        return self._sumidero.vaciar()
+
+def crear_escritor(formato: str, titulos: Sequence[str], hoja: str):
+    if formato == "xlsx":
+        return EscritorXlsx(titulos, hoja)
+    return EscritorCsv(titulos)
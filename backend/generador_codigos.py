@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Generación de QR y códigos de barras en segundo plano
+Sistema de Inventario - Empresa de Maquinados
+
+Crear, importar o renombrar productos solo los deja en la cola
+codigos_pendientes (triggers de la migración 9); la petición ya no espera
+a que se dibujen las imágenes. Este generador vacía la cola por lotes:
+lee los pendientes, dibuja en el pool de procesos las imágenes que aún no
+están en la tabla imagenes y las guarda en una sola escritura junto con la
+salida de la cola. Un producto que falla se reintenta hasta
+CODIGOS_MAX_INTENTOS veces y después queda en estado 'error'.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from codigos import renderizar_codigos, trabajos_producto
+from db_async import run_process, run_read, run_write
+from imagenes import guardar_imagenes, url_imagen
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Productos por lote
+CODIGOS_LOTE = 50
+CODIGOS_MAX_INTENTOS = 3
+# Cada cuánto revisar la cola aunque nadie avise (scripts que escriben directo)
+CODIGOS_INTERVALO = 10.0
+
+def leer_pendientes(conn, limite: int) -> list:
+    return conn.execute("""
+        SELECT c.producto_id, c.solicitud, p.nombre, p.codigo_barras
+        FROM codigos_pendientes c
+        JOIN productos p ON p.id = c.producto_id
+        WHERE c.estado = 'pendiente'
+        ORDER BY c.fecha_solicitud, c.producto_id
+        LIMIT ?
+    """, (limite,)).fetchall()
+
+def claves_existentes(conn, claves: List[str]) -> set:
+    existentes = set()
+    for i in range(0, len(claves), 500):
+        parte = claves[i:i + 500]
+        marcadores = ",".join("?" * len(parte))
+        existentes.update(row[0] for row in conn.execute(f"SELECT hash FROM imagenes WHERE hash IN ({marcadores})", parte))
+    return existentes
+
+def completar_pendientes(conn, imagenes: List[tuple], hechos: List[tuple], fallidos: List[tuple]):
+    """Guardar las imágenes y sacar de la cola (o marcar el error) en la misma transacción
+
+    hechos: [(producto_id, solicitud)]; fallidos: [(error, producto_id, solicitud)].
+    Si el producto se volvió a encolar mientras tanto, su solicitud cambió y
+    la fila se queda para el siguiente lote.
+    """
+    guardar_imagenes(conn, imagenes)
+    conn.executemany("DELETE FROM codigos_pendientes WHERE producto_id = ? AND solicitud = ?", hechos)
+    conn.executemany(f"""
+        UPDATE codigos_pendientes
+        SET intentos = intentos + 1, error = ?,
+            estado = CASE WHEN intentos + 1 >= {CODIGOS_MAX_INTENTOS} THEN 'error' ELSE 'pendiente' END
+        WHERE producto_id = ? AND solicitud = ?
+    """, fallidos)
+
+def estado_codigos(conn, producto_id: int) -> Optional[dict]:
+    """Estado de las imágenes de un producto ('listo', 'pendiente' o 'error'), o None si no existe"""
+    producto = conn.execute("SELECT id, nombre, codigo_barras FROM productos WHERE id = ?", (producto_id,)).fetchone()
+    if producto is None:
+        return None
+    pendiente = conn.execute("""
+        SELECT estado, intentos, error, fecha_solicitud
+        FROM codigos_pendientes WHERE producto_id = ?
+    """, (producto_id,)).fetchone()
+    imagenes = {tipo: url_imagen(clave) for clave, tipo, _, _ in
+                trabajos_producto(producto["id"], producto["nombre"], producto["codigo_barras"])}
+    if pendiente is None:
+        return {"producto_id": producto_id, "estado": "listo", "imagenes": imagenes}
+    return {
+        "producto_id": producto_id,
+        "estado": pendiente["estado"],
+        "intentos": pendiente["intentos"],
+        "error": pendiente["error"],
+        "fecha_solicitud": pendiente["fecha_solicitud"]
+    }
+
+def resumen_pendientes(conn) -> Dict[str, int]:
+    conteos = {"pendiente": 0, "error": 0}
+    for row in conn.execute("SELECT estado, COUNT(*) FROM codigos_pendientes GROUP BY estado"):
+        conteos[row[0]] = row[1]
+    return conteos
+
+class GeneradorCodigos:
+    """Tarea del event loop que vacía codigos_pendientes por lotes"""
+
+    def __init__(self, lote: int = CODIGOS_LOTE, intervalo: float = CODIGOS_INTERVALO):
+        self.lote = lote
+        self.intervalo = intervalo
+        self._evento: Optional[asyncio.Event] = None
+        self._tarea: Optional[asyncio.Task] = None
+        self.lotes = 0
+        self.productos = 0
+        self.imagenes = 0
+        self.errores = 0
+        self.ultimo_lote_ms = 0.0
+
+    def iniciar(self):
+        """Arrancar en el event loop actual (lifespan); revisa la cola de inmediato"""
+        self._evento = asyncio.Event()
+        self._tarea = asyncio.create_task(self._ejecutar())
+        self.despertar()
+        logger.info("✅ Generador de códigos en segundo plano iniciado")
+
+    async def detener(self):
+        if self._tarea is None:
+            return
+        self._tarea.cancel()
+        try:
+            await self._tarea
+        except asyncio.CancelledError:
+            pass
+        self._tarea = None
+
+    def despertar(self):
+        """Avisar que hay productos nuevos en la cola"""
+        if self._evento is not None:
+            self._evento.set()
+
+    async def _ejecutar(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._evento.wait(), timeout=self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._evento.clear()
+            try:
+                # Seguir mientras salgan lotes llenos
+                while await self.procesar_lote() >= self.lote:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Error generando códigos pendientes: {e}")
+
+    async def procesar_lote(self) -> int:
+        """Procesar un lote de la cola y devolver cuántos productos tenía"""
+        pendientes = await run_read(leer_pendientes, self.lote)
+        if not pendientes:
+            return 0
+        inicio = time.perf_counter()
+
+        trabajos = {row["producto_id"]: trabajos_producto(row["producto_id"], row["nombre"], row["codigo_barras"])
+                    for row in pendientes}
+        por_clave = {t[0]: t for lista in trabajos.values() for t in lista}
+        existentes = await run_read(claves_existentes, list(por_clave))
+        faltantes = [(clave, tipo, contenido) for clave, (_, tipo, _, contenido) in por_clave.items()
+                     if clave not in existentes]
+
+        errores: Dict[str, str] = {}
+        imagenes = []
+        if faltantes:
+            for clave, datos, error in await run_process(renderizar_codigos, faltantes):
+                if error is not None:
+                    errores[clave] = error
+                else:
+                    _, tipo, media_type, _ = por_clave[clave]
+                    imagenes.append((clave, tipo, media_type, datos))
+
+        hechos = []
+        fallidos = []
+        for row in pendientes:
+            error = next((errores[t[0]] for t in trabajos[row["producto_id"]] if t[0] in errores), None)
+            if error is None:
+                hechos.append((row["producto_id"], row["solicitud"]))
+            else:
+                fallidos.append((error, row["producto_id"], row["solicitud"]))
+                logger.warning(f"⚠️ No se pudieron generar los códigos del producto {row['producto_id']}: {error}")
+
+        await run_write(completar_pendientes, imagenes, hechos, fallidos)
+
+        self.lotes += 1
+        self.productos += len(hechos)
+        self.imagenes += len(imagenes)
+        self.errores += len(fallidos)
+        self.ultimo_lote_ms = (time.perf_counter() - inicio) * 1000
+        logger.info(f"🏷️ Códigos generados: {len(hechos)} productos, {len(imagenes)} imágenes "
+                    f"en {self.ultimo_lote_ms:.0f} ms")
+        return len(pendientes)
+
+    def stats(self) -> Dict:
+        return {
+            "activo": self._tarea is not None and not self._tarea.done(),
+            "lotes": self.lotes,
+            "productos": self.productos,
+            "imagenes": self.imagenes,
+            "errores": self.errores,
+            "ultimo_lote_ms": round(self.ultimo_lote_ms, 1)
+        }
+
+# Instancia global del generador
+generador_codigos = GeneradorCodigos()
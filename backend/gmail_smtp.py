@@ -109,10 +109,13 @@ class AlertSystem:
     """Sistema de alertas automáticas"""
     
     def __init__(self, gmail_email: str, gmail_password: str, 
-                 alert_emails: List[str], db_path: str = "../data/almacen_main.db"):
+                 alert_emails: List[str], db_path: str = "../data/almacen_main.db",
+                 settings=None):
         self.gmail_client = GmailSMTP(gmail_email, gmail_password)
         self.alert_emails = alert_emails
-        self.db_path = db_path
+        # Si se recibe la configuración del servidor, usar su base de datos
+        self.settings = settings
+        self.db_path = settings.db_path if settings is not None else db_path
         self.last_alert_dates: Dict[str, float] = {}
         
     def get_products_with_low_stock(self) -> List[Dict]:
@@ -243,11 +246,12 @@ Sistema de Almacén - Empresa de Maquinados
 # Instancia global del sistema de alertas
 alert_system = None
 
-def init_alert_system(gmail_email: str, gmail_password: str, alert_emails: List[str], db_path: str = "../data/almacen_main.db") -> bool:
+def init_alert_system(gmail_email: str, gmail_password: str, alert_emails: List[str],
+                      db_path: str = "../data/almacen_main.db", settings=None) -> bool:
     """Inicializar el sistema de alertas"""
     global alert_system
     try:
-        alert_system = AlertSystem(gmail_email, gmail_password, alert_emails, db_path)
+        alert_system = AlertSystem(gmail_email, gmail_password, alert_emails, db_path, settings)
         if alert_system.test_system():
             logger.info("✅ Sistema de alertas inicializado correctamente")
             return True
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Hojas de etiquetas en PDF para reetiquetar anaqueles
+Sistema de Inventario - Empresa de Maquinados
+
+Una sola petición produce el PDF con las etiquetas de muchos productos
+(hoja carta de 2 x 5 etiquetas de 4" x 2", tipo Avery 5163): QR, nombre,
+ubicación y código de barras.
+
+Lo caro es dibujar el QR y el Code128 de cada producto. Las imágenes que
+ya están en la tabla imagenes (el generador de códigos las deja listas)
+se reutilizan; las que faltan se reparten en partes iguales entre los
+procesos del pool y se guardan para la siguiente vez. El acomodo en el PDF
+solo coloca imágenes ya hechas y corre en un proceso aparte.
+"""
+
+import asyncio
+import logging
+import time
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+from reportlab import rl_config
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
+from reportlab.lib.utils import ImageReader, simpleSplit
+from reportlab.pdfgen import canvas
+
+from codigos import renderizar_codigos, trabajos_producto
+from db_async import procesos_workers, run_process, run_read, run_write
+from imagenes import guardar_imagenes, leer_imagenes
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Etiquetas aceptadas por /api/etiquetas/lote
+HOJA_ETIQUETAS_MAX = 2000
+
+# Acomodo de la hoja (Avery 5163)
+COLUMNAS = 2
+FILAS = 5
+ETIQUETA_ANCHO = 4 * inch
+ETIQUETA_ALTO = 2 * inch
+MARGEN_IZQUIERDO = 0.15625 * inch
+MARGEN_SUPERIOR = 0.5 * inch
+SEPARACION = 0.1875 * inch
+RELLENO = 0.1 * inch
+QR_LADO = 1.6 * inch
+
+# Una etiqueta ya lista para acomodar: (nombre, ubicación, QR PNG, código de barras PNG)
+Etiqueta = Tuple[str, str, Optional[bytes], Optional[bytes]]
+
+def leer_productos_ubicacion(conn, prefijo: str, limite: int) -> list:
+    """Productos cuya ubicación empieza con el prefijo, en orden de anaquel"""
+    patron = prefijo.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    return [dict(row) for row in conn.execute("""
+        SELECT id, nombre, codigo_barras, ubicacion FROM productos
+        WHERE ubicacion LIKE ? ESCAPE '\\'
+        ORDER BY ubicacion, nombre, id
+        LIMIT ?
+    """, (patron, limite))]
+
+def _dibujar_imagen(pdf, datos: Optional[bytes], x: float, y: float, ancho: float, alto: float):
+    if datos:
+        # En escala de grises: un tercio de los bytes que comprimir que en RGB
+        imagen = ImageReader(Image.open(BytesIO(datos)).convert("L"))
+        pdf.drawImage(imagen, x, y, ancho, alto, preserveAspectRatio=True, anchor='c')
+
+def dibujar_hoja_etiquetas(etiquetas: List[Etiqueta]) -> bytes:
+    """PDF con las etiquetas acomodadas en hojas carta (se ejecuta en otro proceso)"""
+    # Imágenes en binario: codificarlas en ASCII85 (en Python) tardaba más que el resto
+    use_a85 = rl_config.useA85
+    rl_config.useA85 = 0
+    try:
+        return _dibujar_hoja(etiquetas)
+    finally:
+        rl_config.useA85 = use_a85
+
+def _dibujar_hoja(etiquetas: List[Etiqueta]) -> bytes:
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=letter, pageCompression=1)
+    pdf.setTitle("Etiquetas de productos")
+    _, alto_pagina = letter
+    por_hoja = COLUMNAS * FILAS
+    texto_x = RELLENO + QR_LADO + RELLENO
+    texto_ancho = ETIQUETA_ANCHO - texto_x - RELLENO
+
+    for i, (nombre, ubicacion, qr, barras) in enumerate(etiquetas):
+        if i and i % por_hoja == 0:
+            pdf.showPage()
+        fila, columna = divmod(i % por_hoja, COLUMNAS)
+        x = MARGEN_IZQUIERDO + columna * (ETIQUETA_ANCHO + SEPARACION)
+        y = alto_pagina - MARGEN_SUPERIOR - (fila + 1) * ETIQUETA_ALTO
+
+        _dibujar_imagen(pdf, qr, x + RELLENO, y + (ETIQUETA_ALTO - QR_LADO) / 2, QR_LADO, QR_LADO)
+
+        texto_y = y + ETIQUETA_ALTO - RELLENO - 11
+        pdf.setFont("Helvetica-Bold", 11)
+        for linea in simpleSplit(nombre, "Helvetica-Bold", 11, texto_ancho)[:2]:
+            pdf.drawString(x + texto_x, texto_y, linea)
+            texto_y -= 13
+        pdf.setFont("Helvetica", 14)
+        pdf.drawString(x + texto_x, texto_y - 6, f"Ubic: {ubicacion or '-'}")
+
+        _dibujar_imagen(pdf, barras, x + texto_x, y + RELLENO, texto_ancho, 0.8 * inch)
+
+    pdf.save()
+    return buffer.getvalue()
+
+def repartir(elementos: list, partes: int) -> List[list]:
+    """Dividir en hasta `partes` listas de tamaño parecido"""
+    partes = max(1, min(partes, len(elementos)))
+    tamano = -(-len(elementos) // partes)
+    return [elementos[i:i + tamano] for i in range(0, len(elementos), tamano)]
+
+async def generar_hoja_etiquetas(productos: List[dict]) -> Tuple[bytes, Dict]:
+    """PDF de etiquetas de los productos (id, nombre, codigo_barras, ubicacion) y métricas"""
+    inicio = time.perf_counter()
+    trabajos = [trabajos_producto(p["id"], p["nombre"], p.get("codigo_barras")) for p in productos]
+    por_clave = {t[0]: t for lista in trabajos for t in lista}
+
+    imagenes = await run_read(leer_imagenes, list(por_clave))
+    faltantes = [(clave, tipo, contenido) for clave, (_, tipo, _, contenido) in por_clave.items()
+                 if clave not in imagenes]
+
+    nuevas = []
+    errores = 0
+    if faltantes:
+        partes = repartir(faltantes, procesos_workers())
+        for resultados in await asyncio.gather(*(run_process(renderizar_codigos, parte) for parte in partes)):
+            for clave, datos, error in resultados:
+                if error is not None:
+                    errores += 1
+                    logger.warning(f"⚠️ No se pudo generar la imagen {por_clave[clave][3]!r}: {error}")
+                    continue
+                imagenes[clave] = datos
+                _, tipo, media_type, _ = por_clave[clave]
+                nuevas.append((clave, tipo, media_type, datos))
+        if nuevas:
+            await run_write(guardar_imagenes, nuevas)
+    renderizado = time.perf_counter()
+
+    # trabajos_producto devuelve [QR, código de barras] (CODIGOS_PREGENERADOS)
+    etiquetas = [(p["nombre"], p.get("ubicacion"), imagenes.get(qr[0]), imagenes.get(barras[0]))
+                 for p, (qr, barras) in zip(productos, trabajos)]
+    pdf = await run_process(dibujar_hoja_etiquetas, etiquetas)
+
+    metricas = {
+        "etiquetas": len(productos),
+        "paginas": -(-len(productos) // (COLUMNAS * FILAS)),
+        "imagenes_reutilizadas": len(por_clave) - len(faltantes),
+        "imagenes_generadas": len(nuevas),
+        "errores": errores,
+        "render_ms": round((renderizado - inicio) * 1000, 1),
+        "pdf_ms": round((time.perf_counter() - renderizado) * 1000, 1),
+    }
+    return pdf, metricas
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Almacén de imágenes direccionado por contenido
+Sistema de Inventario - Empresa de Maquinados
+
+Las imágenes generadas (códigos QR) se guardan en la tabla imagenes con
+la clave sha256 de lo que las produce (tipo + contenido codificado). El
+mismo contenido siempre produce la misma clave, así que una imagen nunca
+cambia: se sirve como image/png con caché inmutable y se genera una sola
+vez aunque la pidan muchas tablets.
+
+CacheImagenes guarda en memoria las más pedidas (LRU limitado por bytes)
+para que reimprimir etiquetas no lea la base de datos.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+# Caché del navegador: un año, la URL cambia si cambia el contenido
+CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+
+def hash_imagen(tipo: str, contenido: str) -> str:
+    """Clave de la imagen a partir de lo que se codifica en ella"""
+    return hashlib.sha256(f"{tipo}:{contenido}".encode("utf-8")).hexdigest()
+
+def url_imagen(clave: str) -> str:
+    return f"/api/imagenes/{clave}"
+
+def existe_imagen(conn, clave: str) -> bool:
+    return conn.execute("SELECT 1 FROM imagenes WHERE hash = ?", (clave,)).fetchone() is not None
+
+def leer_imagen(conn, clave: str) -> Optional[dict]:
+    """Datos y tipo MIME de una imagen, o None si no existe"""
+    row = conn.execute("SELECT media_type, datos FROM imagenes WHERE hash = ?", (clave,)).fetchone()
+    if row is None:
+        return None
+    return {"media_type": row["media_type"], "datos": bytes(row["datos"])}
+
+def leer_imagenes(conn, claves) -> Dict[str, bytes]:
+    """Datos de varias imágenes {clave: datos} (las que no existen no aparecen)"""
+    claves = list(claves)
+    imagenes = {}
+    for i in range(0, len(claves), 500):
+        parte = claves[i:i + 500]
+        marcadores = ",".join("?" * len(parte))
+        for row in conn.execute(f"SELECT hash, datos FROM imagenes WHERE hash IN ({marcadores})", parte):
+            imagenes[row[0]] = bytes(row[1])
+    return imagenes
+
+def guardar_imagen(conn, clave: str, tipo: str, media_type: str, datos: bytes):
+    """Guardar una imagen (si otra petición ya la guardó no hace nada)"""
+    conn.execute("""
+        INSERT OR IGNORE INTO imagenes (hash, tipo, media_type, datos, bytes)
+        VALUES (?, ?, ?, ?, ?)
+    """, (clave, tipo, media_type, datos, len(datos)))
+
+def guardar_imagenes(conn, imagenes):
+    """Guardar varias imágenes [(clave, tipo, media_type, datos)]"""
+    for clave, tipo, media_type, datos in imagenes:
+        guardar_imagen(conn, clave, tipo, media_type, datos)
+
+class CacheImagenes:
+    """LRU en memoria de imágenes por clave, limitado por bytes"""
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entradas: "OrderedDict[str, Tuple[str, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def obtener(self, clave: str) -> Optional[dict]:
+        """{media_type, datos} o None si no está en memoria"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.hits += 1
+        return {"media_type": entrada[0], "datos": entrada[1]}
+
+    def guardar(self, clave: str, media_type: str, datos: bytes):
+        if len(datos) > self.max_bytes:
+            return
+        with self._lock:
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self._bytes -= len(anterior[1])
+            self._entradas[clave] = (media_type, datos)
+            self._bytes += len(datos)
+            while self._bytes > self.max_bytes:
+                _, (_, viejos) = self._entradas.popitem(last=False)
+                self._bytes -= len(viejos)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entradas": len(self._entradas),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0
+            }
+
+# Instancia global de la caché de imágenes
+cache_imagenes = CacheImagenes()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Importación masiva de productos (CSV o NDJSON)
+Sistema de Inventario - Empresa de Maquinados
+
+Las filas se validan en una sola pasada mientras se leen; si todas son
+válidas se insertan con executemany dentro de una sola operación de la
+cola de escritura. Los códigos de barras y las ubicaciones que falten se
+asignan después con un UPDATE por columna (no uno por producto) y el
+historial se registra con un INSERT ... SELECT. Los QR no se generan aquí:
+se encolan para después de responder.
+"""
+
+import csv
+import json
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Columnas aceptadas (mismos nombres que el JSON de POST /api/productos)
+COLUMNAS_IMPORTACION = (
+    "codigo_barras", "nombre", "descripcion", "cantidad",
+    "cantidad_minima", "ubicacion", "categoria", "precio_unitario"
+)
+IMPORTACION_MAX_BYTES = 20 * 1024 * 1024
+IMPORTACION_MAX_ERRORES = 50
+
+class ErrorImportacion(Exception):
+    """Formato del archivo no válido (no se puede leer ninguna fila)"""
+
+def detectar_formato(content_type: Optional[str], formato: Optional[str]) -> str:
+    """csv o ndjson según el parámetro formato= o el Content-Type"""
+    if formato:
+        formato = formato.strip().lower()
+        if formato in ("csv", "ndjson"):
+            return formato
+        raise ErrorImportacion(f"Formato no soportado: {formato} (usar csv o ndjson)")
+    tipo = (content_type or "").split(";")[0].strip().lower()
+    if tipo in ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json"):
+        return "ndjson"
+    return "csv"
+
+def leer_filas_csv(lineas: Iterable[str]) -> Iterator[Tuple[int, dict]]:
+    """(número de fila, dict) por cada línea de datos; la primera línea es el encabezado"""
+    lector = csv.DictReader(lineas)
+    if not lector.fieldnames or "nombre" not in [c.strip() for c in lector.fieldnames]:
+        raise ErrorImportacion("El CSV debe tener encabezado con al menos la columna 'nombre'")
+    lector.fieldnames = [c.strip() for c in lector.fieldnames]
+    for fila in lector:
+        if not any((v or "").strip() for v in fila.values() if isinstance(v, str)):
+            continue
+        yield lector.line_num, fila
+
+def leer_filas_ndjson(lineas: Iterable[str]) -> Iterator[Tuple[int, dict]]:
+    """(número de línea, dict) por cada objeto JSON; las líneas vacías se ignoran"""
+    for numero, linea in enumerate(lineas, start=1):
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError:
+            yield numero, None
+            continue
+        yield numero, fila if isinstance(fila, dict) else None
+
+def _texto(valor) -> Optional[str]:
+    if valor is None:
+        return None
+    return str(valor).strip() or None
+
+def normalizar_fila(fila: Optional[dict]) -> Tuple[Optional[tuple], Optional[str]]:
+    """Convertir una fila con las mismas reglas que crear_producto
+
+    Devuelve (valores en el orden de COLUMNAS_IMPORTACION, None) o
+    (None, motivo del error).
+    """
+    if fila is None:
+        return None, "Línea no es un objeto JSON válido"
+
+    nombre = _texto(fila.get("nombre"))
+    if not nombre:
+        return None, "El nombre es obligatorio"
+
+    try:
+        cantidad = int(fila["cantidad"]) if _texto(fila.get("cantidad")) else 0
+    except (ValueError, TypeError):
+        return None, f"Cantidad no válida: {fila.get('cantidad')}"
+    if cantidad < 0:
+        return None, "La cantidad no puede ser negativa"
+
+    try:
+        cantidad_minima = int(fila["cantidad_minima"]) if _texto(fila.get("cantidad_minima")) else 0
+    except (ValueError, TypeError):
+        return None, f"Cantidad mínima no válida: {fila.get('cantidad_minima')}"
+
+    try:
+        precio_unitario = float(fila["precio_unitario"]) if _texto(fila.get("precio_unitario")) else None
+    except (ValueError, TypeError):
+        return None, f"Precio no válido: {fila.get('precio_unitario')}"
+
+    return (
+        _texto(fila.get("codigo_barras")),
+        nombre,
+        _texto(fila.get("descripcion")),
+        cantidad,
+        cantidad_minima,
+        _texto(fila.get("ubicacion")),
+        _texto(fila.get("categoria")),
+        precio_unitario
+    ), None
+
+def validar_filas(filas: Iterable[Tuple[int, dict]]) -> Tuple[List[tuple], List[Dict]]:
+    """Una pasada: filas válidas y errores (con número de fila)
+
+    También detecta códigos de barras repetidos dentro del mismo archivo;
+    los que ya existen en la base se revisan en insertar_productos.
+    """
+    validas: List[tuple] = []
+    errores: List[Dict] = []
+    vistos: Dict[str, int] = {}
+    for numero, fila in filas:
+        valores, error = normalizar_fila(fila)
+        if error is None and valores[0]:
+            if valores[0] in vistos:
+                error = f"Código de barras {valores[0]} repetido (fila {vistos[valores[0]]})"
+            else:
+                vistos[valores[0]] = numero
+        if error:
+            errores.append({"fila": numero, "error": error})
+            continue
+        validas.append((numero,) + valores)
+    return validas, errores
+
+def codigos_existentes(conn, filas: List[tuple]) -> Dict[str, int]:
+    """Códigos de barras del archivo que ya existen en productos -> número de fila"""
+    por_codigo = {f[1]: f[0] for f in filas if f[1]}
+    existentes = {}
+    codigos = list(por_codigo)
+    # Respetar el límite de parámetros de SQLite
+    for i in range(0, len(codigos), 500):
+        parte = codigos[i:i + 500]
+        marcadores = ",".join("?" * len(parte))
+        for row in conn.execute(f"SELECT codigo_barras FROM productos WHERE codigo_barras IN ({marcadores})", parte):
+            existentes[row[0]] = por_codigo[row[0]]
+    return existentes
+
+def insertar_productos(conn, filas: List[tuple], usuario: dict) -> List[tuple]:
+    """Insertar las filas validadas en la transacción del escritor
+
+    Devuelve [(id, nombre, codigo_barras)] de los productos creados.
+    """
+    cursor = conn.cursor()
+    # Con AUTOINCREMENT y un solo escritor los nuevos id son mayores que este
+    id_anterior = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM productos").fetchone()[0]
+
+    cursor.executemany("""
+        INSERT INTO productos (codigo_barras, nombre, descripcion, cantidad,
+                              cantidad_minima, ubicacion, categoria, precio_unitario)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, [f[1:] for f in filas])
+
+    # Mismo formato que crear_producto: código de 12 dígitos con el id
+    cursor.execute("""
+        UPDATE productos SET codigo_barras = printf('%012d', id)
+        WHERE id > ? AND codigo_barras IS NULL
+    """, (id_anterior,))
+    # Igual que generar_ubicacion_automatica: A01-A10, B01-B10...
+    cursor.execute("""
+        UPDATE productos SET ubicacion = char(65 + (id - 1) / 10) || printf('%02d', (id - 1) % 10 + 1)
+        WHERE id > ? AND ubicacion IS NULL
+    """, (id_anterior,))
+
+    cursor.execute("""
+        INSERT INTO historial (accion, producto_id, cantidad_anterior, cantidad_nueva, usuario_id, usuario_nombre, detalles)
+        SELECT 'crear', id, 0, cantidad, ?, ?, 'importación masiva'
+        FROM productos WHERE id > ?
+    """, (usuario["id"], usuario["nombre_completo"], id_anterior))
+
+    creados = cursor.execute(
+        "SELECT id, nombre, codigo_barras FROM productos WHERE id > ? ORDER BY id", (id_anterior,)
+    ).fetchall()
+    logger.info(f"📥 Importados {len(creados)} productos")
+    return [tuple(row) for row in creados]
@@ -1,31 +1,23 @@
 from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse, Response
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import sqlite3
 import uvicorn
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional
+from typing import Iterator, List, Optional
 import os
 import logging
 import hashlib
 import secrets
+import codecs
 import time
-import qrcode
 import base64
-from io import BytesIO
-import barcode
-from barcode.writer import ImageWriter
 import ipaddress
-import tempfile
 import socket
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+from email.utils import format_datetime, parsedate_to_datetime
 
 import time
 import json
@@ -80,6 +72,38 @@ except ImportError as e:
     ALERT_SYSTEM_AVAILABLE = False
     logger.warning(f"⚠️ Sistema de alertas no disponible: {e}")
 
+from settings import init_settings, get_settings
+from db_pool import init_pool, get_pool, close_pool
+from db_async import ensure_pool, init_executors, shutdown_executors, executor_stats, run_read, run_write, run_blocking, run_process, procesos_workers
+from db_writer import init_write_queue
+from migrations import aplicar_migraciones
+from imagenes import hash_imagen, leer_imagen, guardar_imagen, cache_imagenes, CACHE_INMUTABLE
+from codigos import contenido_qr, codigo_barras_producto, GENERADORES_CODIGO, FORMATOS_CODIGO
+from generador_codigos import generador_codigos, estado_codigos, resumen_pendientes
+from etiquetas import etiqueta_zpl, etiquetas_zpl, MEDIA_TYPE_ZPL, ETIQUETAS_LOTE_MAX, ETIQUETAS_COPIAS_MAX
+from hojas_etiquetas import generar_hoja_etiquetas, leer_productos_ubicacion, HOJA_ETIQUETAS_MAX
+from pdf_tickets import generar_pdf_ticket, PDF_TICKET_FORMATO
+from cache_pdf import cache_pdf_tickets
+from importacion import (
+    detectar_formato, leer_filas_csv, leer_filas_ndjson, validar_filas, codigos_existentes,
+    insertar_productos, ErrorImportacion, IMPORTACION_MAX_BYTES, IMPORTACION_MAX_ERRORES
+)
+from conteos import (
+    parsear_lecturas, abrir_conteo, registrar_lecturas, diferencias_conteo, aplicar_conteo,
+    cancelar_conteo, ErrorConteo
+)
+from exportacion import (
+    COLUMNAS_PRODUCTOS, COLUMNAS_HISTORIAL, MEDIA_TYPES, ESTADOS_TICKET, ArchivoZip, crear_escritor,
+    leer_bloque_productos, leer_bloque_historial, leer_bloque_tickets
+)
+from busqueda import buscar_productos, buscar_ids, leer_productos_ordenados, BUSQUEDA_LIMIT_DEFAULT, BUSQUEDA_LIMIT_MAX
+from trigramas import indice_nombres
+from escaneos import resolvedor_escaneos, limpiar_codigo, COLUMNAS_ESCANEO, ESCANEO_LOTE_MAX
+from catalogo import (
+    leer_version_catalogo, publicar_version_catalogo, etag_catalogo, if_none_match_coincide, encabezados_catalogo, respuesta_no_modificada,
+    serializar_json, elegir_codificacion, CatalogoSerializado, snapshot_productos
+)
+
 # Crear directorio de datos si no existe
 os.makedirs("../data", exist_ok=True)
 
@@ -113,29 +137,32 @@ ALERT_CONFIG = load_alert_config()
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    init_database()
+    # Resolver rama y base de datos una sola vez (sin ejecutar git en cada conexión)
+    settings = init_settings()
     
-    # Obtener información de la rama y base de datos
-    branch = os.getenv("BRANCH")
-    if not branch:
-        branch = get_current_git_branch()
+    # Crear el pool una sola vez; todas las conexiones quedan configuradas
+    init_pool(settings.db_path, settings.db_pool_readers, settings.db_pool_timeout)
+    init_database()
     
-    if branch.lower() == "desarrollo":
-        db_name = "almacen_desarrollo.db"
-    else:
-        db_name = "almacen_main.db"
+    # Hilos para sqlite3 y render de imágenes/PDF, fuera del event loop
+    init_executors(settings.db_pool_readers)
+    # Hilo escritor único: todas las escrituras pasan por su cola (commit agrupado)
+    write_queue = init_write_queue(get_pool(), settings.write_batch_max, settings.write_batch_window_ms)
+    # Publicar la versión del catálogo en cada COMMIT (invalida los índices en memoria)
+    write_queue.agregar_observador(lambda conn: publicar_version_catalogo(leer_version_catalogo(conn)))
+    # QR y códigos de barras de productos nuevos o renombrados
+    generador_codigos.iniciar()
+    # PDFs de tickets ya generados, por versión del ticket
+    cache_pdf_tickets.configurar(settings.pdf_cache_dir)
     
     # Inicializar sistema de alertas
     if ALERT_SYSTEM_AVAILABLE and ALERT_CONFIG["enabled"]:
         try:
-            # Construir ruta correcta de la base de datos
-            db_path = f"../data/{db_name}"
-            
             success = init_alert_system(
                 ALERT_CONFIG["gmail_email"],
                 ALERT_CONFIG["gmail_password"],
                 ALERT_CONFIG["alert_emails"],
-                db_path
+                settings=settings
             )
             if success:
                 logger.info("✅ Sistema de alertas por email inicializado")
@@ -154,8 +181,8 @@ async def lifespan(app: FastAPI):
         logger.info("⚠️ Sistema de alertas deshabilitado")
     
     print("✅ Base de datos inicializada")
-    print(f"🌿 Rama configurada: {branch}")
-    print(f"🗄️  Base de datos: {db_name}")
+    print(f"🌿 Rama configurada: {settings.branch}")
+    print(f"🗄️  Base de datos: {settings.db_name}")
     print("🚀 Servidor listo en http://localhost:8000")
     
     yield
@@ -165,6 +192,9 @@ async def lifespan(app: FastAPI):
     if alert_thread and alert_thread.is_alive():
         logger.info("🛑 Deteniendo thread de alertas automáticas...")
         alert_thread.join(timeout=5)
+    await generador_codigos.detener()
+    shutdown_executors()
+    close_pool()
     print("🛑 Servidor detenido")
 
 app = FastAPI(
@@ -196,40 +226,6 @@ SESSION_CONFIG = {
 
 # Sistema de alertas por email (WhatsApp eliminado)
 
-# Función para detectar la rama Git actual
-def get_current_git_branch():
-    """Detecta la rama Git actual"""
-    try:
-        import subprocess
-        import os
-        
-        # Intentar desde el directorio actual
-        result = subprocess.run(['git', 'branch', '--show-current'], 
-                              capture_output=True, text=True, cwd='.')
-        if result.returncode == 0 and result.stdout.strip():
-            return result.stdout.strip()
-        
-        # Intentar desde el directorio padre
-        result = subprocess.run(['git', 'branch', '--show-current'], 
-                              capture_output=True, text=True, cwd='..')
-        if result.returncode == 0 and result.stdout.strip():
-            return result.stdout.strip()
-        
-        # Fallback: intentar con git rev-parse desde directorio actual
-        result = subprocess.run(['git', 'rev-parse', '--abbrev-ref', 'HEAD'], 
-                              capture_output=True, text=True, cwd='.')
-        if result.returncode == 0 and result.stdout.strip():
-            return result.stdout.strip()
-        
-        # Fallback: intentar con git rev-parse desde directorio padre
-        result = subprocess.run(['git', 'rev-parse', '--abbrev-ref', 'HEAD'], 
-                              capture_output=True, text=True, cwd='..')
-        if result.returncode == 0 and result.stdout.strip():
-            return result.stdout.strip()
-            
-    except Exception as e:
-        logger.warning(f"No se pudo detectar la rama Git: {e}")
-    
 def get_local_ipv4_addresses() -> list:
     """Obtiene direcciones IPv4 locales relevantes para el SAN del certificado.
 
@@ -284,106 +280,32 @@ def get_local_ipv4_addresses() -> list:
 
     return sorted(set(valid_ipv4))
 
-    return "main"  # Rama por defecto
-
 # Función para obtener conexión a la base de datos
-def get_db_connection():
+def get_db_connection(write: bool = False):
+    """Obtener una conexión del pool
+    
+    Por defecto se presta una conexión de solo lectura; con write=True se
+    presta la conexión dedicada de escritura. Usar siempre dentro de un
+    bloque with (o llamar close()) para regresarla al pool.
+    """
     try:
-        # Priorizar variable de entorno BRANCH sobre detección automática
-        branch = os.getenv("BRANCH")
-        if not branch:
-            # Si no hay variable de entorno, detectar rama Git actual
-            branch = get_current_git_branch()
-        
-        # Definir nombre de base de datos según la rama
-        if branch.lower() == "desarrollo":
-            db_name = "almacen_desarrollo.db"
-        else:
-            db_name = "almacen_main.db"
-        
-        db_path = f"../data/{db_name}"
-        logger.info(f"Conectando a base de datos: {db_path} (rama: {branch})")
-        conn = sqlite3.connect(db_path, timeout=60.0)  # Aumentar timeout a 60 segundos
-        conn.row_factory = sqlite3.Row  # Permite acceso por nombre de columna
-        # Configurar para mejor rendimiento y evitar bloqueos
-        conn.execute("PRAGMA journal_mode=WAL")
-        conn.execute("PRAGMA synchronous=NORMAL")
-        conn.execute("PRAGMA cache_size=20000")  # Aumentar cache
-        conn.execute("PRAGMA temp_store=MEMORY")
-        conn.execute("PRAGMA busy_timeout=60000")  # 60 segundos de timeout
-        conn.execute("PRAGMA wal_autocheckpoint=1000")  # Checkpoint cada 1000 páginas
-        return conn
+        pool = ensure_pool()
+        return pool.writer() if write else pool.reader()
     except Exception as e:
         logger.error(f"Error conectando a la base de datos: {e}")
         raise
 
-def generar_codigo_qr(producto_id: int, nombre: str, codigo_barras: str = None) -> str:
-    """Generar código QR para un producto y devolverlo como base64"""
-    try:
-        # Crear contenido del QR con información del producto
-        contenido = f"ID:{producto_id}|Nombre:{nombre}"
-        if codigo_barras:
-            contenido += f"|Codigo:{codigo_barras}"
-        
-        # Generar QR
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(contenido)
-        qr.make(fit=True)
-        
-        # Crear imagen
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convertir a base64
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        img_str = base64.b64encode(buffer.getvalue()).decode()
-        
-        return f"data:image/png;base64,{img_str}"
-    except Exception as e:
-        logger.error(f"Error generando QR para producto {producto_id}: {e}")
-        return None
-
-def generar_codigo_barras(producto_id: int, nombre: str, codigo_barras: str = None) -> str:
-    """Generar código de barras imprimible para un producto y devolverlo como base64"""
-    try:
-        # Usar el código de barras existente o generar uno basado en el ID
-        if codigo_barras and codigo_barras.strip():
-            codigo = codigo_barras
-        else:
-            # Generar código de barras basado en ID (formato: 123456789012)
-            codigo = f"{producto_id:012d}"
-        
-        # Crear código de barras Code128 (más común y legible)
-        codigo_barras_obj = barcode.get('code128', codigo, writer=ImageWriter())
-        
-        # Configurar opciones de imagen
-        options = {
-            'text_distance': 1.0,
-            'font_size': 12,
-            'module_height': 15.0,
-            'module_width': 0.2,
-            'quiet_zone': 6.0,
-            'background': 'white',
-            'foreground': 'black'
-        }
-        
-        # Generar imagen
-        buffer = BytesIO()
-        codigo_barras_obj.write(buffer, options)
-        buffer.seek(0)
-        
-        # Convertir a base64
-        img_str = base64.b64encode(buffer.getvalue()).decode()
-        
-        return f"data:image/png;base64,{img_str}"
-    except Exception as e:
-        logger.error(f"Error generando código de barras para producto {producto_id}: {e}")
-        return None
+async def obtener_imagen(clave: str, tipo: str, media_type: str, generar, contenido: str) -> dict:
+    """{media_type, datos} de una imagen: memoria, después tabla imagenes y solo al final se genera"""
+    imagen = cache_imagenes.obtener(clave)
+    if imagen is None:
+        imagen = await run_read(leer_imagen, clave)
+        if imagen is None:
+            datos = await run_blocking(generar, contenido)
+            await run_write(guardar_imagen, clave, tipo, media_type, datos)
+            imagen = {"media_type": media_type, "datos": datos}
+        cache_imagenes.guardar(clave, imagen["media_type"], imagen["datos"])
+    return imagen
 
 def generar_ubicacion_automatica(producto_id: int) -> str:
     """Generar ubicación automática para un producto basada en su ID"""
@@ -402,179 +324,10 @@ def generar_ubicacion_automatica(producto_id: int) -> str:
 
 # Inicializar base de datos
 def init_database():
+    """Aplicar las migraciones pendientes (con el esquema al día solo lee PRAGMA user_version)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Crear tabla de usuarios
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS usuarios (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                nombre_completo TEXT NOT NULL,
-                email TEXT,
-                rol TEXT NOT NULL CHECK (rol IN ('admin', 'supervisor', 'operador')),
-                activo BOOLEAN DEFAULT 1,
-                fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                ultimo_acceso TIMESTAMP
-            )
-        ''')
-        
-        # Crear tabla de sesiones
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sesiones (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                usuario_id INTEGER NOT NULL,
-                token TEXT UNIQUE NOT NULL,
-                fecha_inicio TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                fecha_expiracion TIMESTAMP NOT NULL,
-                ip_address TEXT,
-                user_agent TEXT,
-                activa BOOLEAN DEFAULT 1,
-                FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
-            )
-        ''')
-        
-        # Crear tabla de productos
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS productos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                codigo_barras TEXT UNIQUE,
-                nombre TEXT NOT NULL,
-                descripcion TEXT,
-                cantidad INTEGER DEFAULT 0 CHECK (cantidad >= 0),
-                cantidad_minima INTEGER DEFAULT 0,
-                ubicacion TEXT,
-                categoria TEXT,
-                precio_unitario REAL,
-                codigo_qr TEXT,
-                fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Crear tabla de historial
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS historial (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                accion TEXT NOT NULL,
-                producto_id INTEGER,
-                cantidad_anterior INTEGER,
-                cantidad_nueva INTEGER,
-                usuario_id INTEGER,
-                usuario_nombre TEXT,
-                fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                detalles TEXT,
-                FOREIGN KEY (producto_id) REFERENCES productos (id),
-                FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
-            )
-        ''')
-        
-        # Verificar si las columnas existen, si no, agregarlas
-        cursor.execute("PRAGMA table_info(historial)")
-        columns = [column[1] for column in cursor.fetchall()]
-        
-        if 'usuario_id' not in columns:
-            cursor.execute("ALTER TABLE historial ADD COLUMN usuario_id INTEGER")
-            logger.info("Columna usuario_id agregada a tabla historial")
-        
-        if 'usuario_nombre' not in columns:
-            cursor.execute("ALTER TABLE historial ADD COLUMN usuario_nombre TEXT")
-            logger.info("Columna usuario_nombre agregada a tabla historial")
-        
-        if 'detalles' not in columns:
-            cursor.execute("ALTER TABLE historial ADD COLUMN detalles TEXT")
-            logger.info("Columna detalles agregada a tabla historial")
-        
-        # Verificar si la columna codigo_qr existe en productos, si no, agregarla
-        cursor.execute("PRAGMA table_info(productos)")
-        columnas_productos = [column[1] for column in cursor.fetchall()]
-        
-        if 'codigo_qr' not in columnas_productos:
-            cursor.execute("ALTER TABLE productos ADD COLUMN codigo_qr TEXT")
-            logger.info("Columna codigo_qr agregada a tabla productos")
-        
-        # Crear índices para rendimiento (solo para tablas que ya existen)
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_productos_nombre ON productos(nombre)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_productos_ubicacion ON productos(ubicacion)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_historial_producto ON historial(producto_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_usuarios_username ON usuarios(username)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sesiones_token ON sesiones(token)')
-        
-        # Crear tabla de tickets de compra
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tickets_compra (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                numero_ticket TEXT UNIQUE NOT NULL,
-                orden_produccion TEXT NOT NULL,
-                justificacion TEXT NOT NULL,
-                solicitante_id INTEGER NOT NULL,
-                solicitante_nombre TEXT NOT NULL,
-                solicitante_rol TEXT NOT NULL,
-                estado TEXT DEFAULT 'pendiente' CHECK (estado IN ('pendiente', 'entregado', 'devuelto')),
-                fecha_solicitud TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-
-                fecha_entrega TIMESTAMP,
-                entregado_por_id INTEGER,
-                entregado_por_nombre TEXT,
-                FOREIGN KEY (solicitante_id) REFERENCES usuarios (id),
-                FOREIGN KEY (aprobador_id) REFERENCES usuarios (id),
-                FOREIGN KEY (entregado_por_id) REFERENCES usuarios (id)
-            )
-        ''')
-        
-        # Crear tabla de items del ticket
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ticket_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                ticket_id INTEGER NOT NULL,
-                producto_id INTEGER NOT NULL,
-                producto_nombre TEXT NOT NULL,
-                cantidad_solicitada INTEGER NOT NULL,
-                cantidad_entregada INTEGER DEFAULT 0,
-                cantidad_devuelta INTEGER DEFAULT 0,
-                precio_unitario REAL,
-                FOREIGN KEY (ticket_id) REFERENCES tickets_compra (id) ON DELETE CASCADE,
-                FOREIGN KEY (producto_id) REFERENCES productos (id)
-            )
-        ''')
-        
-        # Verificar si la columna cantidad_devuelta existe, si no, agregarla
-        cursor.execute("PRAGMA table_info(ticket_items)")
-        columnas_ticket_items = [column[1] for column in cursor.fetchall()]
-        
-        if 'cantidad_devuelta' not in columnas_ticket_items:
-            cursor.execute("ALTER TABLE ticket_items ADD COLUMN cantidad_devuelta INTEGER DEFAULT 0")
-            logger.info("Columna cantidad_devuelta agregada a tabla ticket_items")
-            
-        # Crear índices para tablas de tickets (después de crear las tablas)
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tickets_solicitante ON tickets_compra(solicitante_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tickets_estado ON tickets_compra(estado)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tickets_fecha ON tickets_compra(fecha_solicitud)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_ticket_items_ticket ON ticket_items(ticket_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_ticket_items_producto ON ticket_items(producto_id)')
-        
-        # Crear índices para tickets (después de crear las tablas)
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tickets_solicitante ON tickets_compra(solicitante_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tickets_estado ON tickets_compra(estado)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tickets_fecha ON tickets_compra(fecha_solicitud)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_ticket_items_ticket ON ticket_items(ticket_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_ticket_items_producto ON ticket_items(producto_id)')
-        
-        # Crear usuario administrador por defecto si no existe
-        cursor.execute("SELECT COUNT(*) FROM usuarios WHERE username = 'admin'")
-        if cursor.fetchone()[0] == 0:
-            import hashlib
-            password_hash = hashlib.sha256('admin123'.encode()).hexdigest()
-            cursor.execute("""
-                INSERT INTO usuarios (username, password_hash, nombre_completo, email, rol)
-                VALUES (?, ?, ?, ?, ?)
-            """, ('admin', password_hash, 'Administrador del Sistema', 'admin@empresa.com', 'admin'))
-            logger.info("Usuario administrador creado: admin / admin123")
-        
-        conn.commit()
-        conn.close()
+        with get_db_connection(write=True) as conn:
+            aplicar_migraciones(conn)
         logger.info("Base de datos inicializada correctamente")
     except Exception as e:
         logger.error(f"Error inicializando base de datos: {e}")
@@ -585,7 +338,7 @@ def init_database():
 async def read_index(request: Request):
     """Servir la página principal o redirigir al login"""
     # Verificar si el usuario está autenticado
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return FileResponse("../frontend/static/login.html")
     
@@ -596,125 +349,479 @@ async def read_login():
     """Servir la página de login"""
     return FileResponse("../frontend/static/login.html")
 
+async def respuesta_codigo(request: Request, producto_id: int, codigo: str, formato: str) -> Response:
+    """Imagen del QR o código de barras de un producto (png o svg)
+    
+    El ETag es la clave del contenido codificado: una reimpresión con la
+    imagen ya en el navegador responde 304 sin tocar la base de datos.
+    """
+    formato = (formato or "png").lower()
+    if formato not in FORMATOS_CODIGO:
+        raise HTTPException(status_code=400, detail=f"Formato no válido. Disponibles: {', '.join(FORMATOS_CODIGO)}")
+    
+    producto = (await resolvedor_al_dia()).producto(producto_id)
+    if producto is None:
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
+    
+    if codigo == "qr":
+        contenido = contenido_qr(producto["id"], producto["nombre"], producto["codigo_barras"])
+    else:
+        contenido = codigo_barras_producto(producto["id"], producto["codigo_barras"])
+    tipo, generar = GENERADORES_CODIGO[(codigo, formato)]
+    clave = hash_imagen(tipo, contenido)
+    
+    # La URL es del producto, no del contenido: revalidar siempre con el ETag
+    encabezados = {"ETag": f'"{clave}"', "Cache-Control": "no-cache"}
+    if if_none_match_coincide(request, encabezados["ETag"]):
+        return Response(status_code=304, headers=encabezados)
+    
+    imagen = await obtener_imagen(clave, tipo, FORMATOS_CODIGO[formato], generar, contenido)
+    return Response(content=imagen["datos"], media_type=imagen["media_type"], headers=encabezados)
+
+@app.get("/api/productos/{producto_id}/qr")
+async def get_qr_producto(producto_id: int, request: Request, formato: str = "png"):
+    """Código QR de un producto como imagen (formato=png o svg)"""
+    try:
+        return await respuesta_codigo(request, producto_id, "qr", formato)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener código QR: {str(e)}")
+
 @app.get("/api/productos/{producto_id}/barcode")
-async def get_barcode_producto(producto_id: int):
-    """Obtener código de barras de un producto específico"""
+async def get_barcode_producto(producto_id: int, request: Request, formato: str = "png"):
+    """Código de barras (Code128) de un producto como imagen (formato=png o svg)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, nombre, codigo_barras
-            FROM productos 
-            WHERE id = ?
-        """, (producto_id,))
-        producto = cursor.fetchone()
-        conn.close()
-        
-        if not producto:
+        return await respuesta_codigo(request, producto_id, "barcode", formato)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener código de barras: {str(e)}")
+
+@app.get("/api/productos/{producto_id}/codigos")
+async def get_estado_codigos(producto_id: int):
+    """Estado de la generación del QR y código de barras de un producto
+    
+    estado: 'listo' (con las URLs de las imágenes), 'pendiente' o 'error'.
+    La tablet puede consultarlo hasta que deje de estar pendiente.
+    """
+    try:
+        estado = await run_read(estado_codigos, producto_id)
+        if estado is None:
+            raise HTTPException(status_code=404, detail="Producto no encontrado")
+        return estado
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener estado de códigos: {str(e)}")
+
+def validar_copias(copias: int) -> int:
+    if not 1 <= copias <= ETIQUETAS_COPIAS_MAX:
+        raise HTTPException(status_code=400, detail=f"Las copias deben estar entre 1 y {ETIQUETAS_COPIAS_MAX}")
+    return copias
+
+@app.get("/api/productos/{producto_id}/etiqueta")
+async def get_etiqueta_producto(producto_id: int, copias: int = 1):
+    """Etiqueta ZPL (QR, código de barras, nombre y ubicación) para impresora térmica"""
+    try:
+        validar_copias(copias)
+        producto = (await resolvedor_al_dia()).producto(producto_id)
+        if producto is None:
             raise HTTPException(status_code=404, detail="Producto no encontrado")
+        return Response(
+            content=etiqueta_zpl(producto, copias),
+            media_type=MEDIA_TYPE_ZPL,
+            headers={"Content-Disposition": f'inline; filename="etiqueta_{producto_id}.zpl"'}
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al generar etiqueta: {str(e)}")
+
+@app.post("/api/productos/etiquetas")
+async def post_etiquetas_productos(datos: dict, request: Request):
+    """Etiquetas ZPL de varios productos en un solo documento
+    
+    Body: {"ids": [12, 8, ...], "copias": 1}. Las etiquetas salen en el
+    orden de ids; si algún producto no existe no se imprime ninguna.
+    """
+    try:
+        current_user = await get_current_user(request)
+        require_auth(current_user)
         
-        # Generar código de barras
-        codigo_barras = generar_codigo_barras(
-            producto['id'], 
-            producto['nombre'], 
-            producto['codigo_barras']
+        ids = datos.get("ids")
+        if not isinstance(ids, list) or not ids:
+            raise HTTPException(status_code=400, detail="Se requiere la lista de ids")
+        if len(ids) > ETIQUETAS_LOTE_MAX:
+            raise HTTPException(status_code=400, detail=f"Máximo {ETIQUETAS_LOTE_MAX} etiquetas por envío")
+        try:
+            ids = [int(i) for i in ids]
+            copias = validar_copias(int(datos.get("copias", 1)))
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Los ids y las copias deben ser números")
+        
+        resolvedor = await resolvedor_al_dia()
+        productos = [resolvedor.producto(i) for i in ids]
+        faltantes = [i for i, producto in zip(ids, productos) if producto is None]
+        if faltantes:
+            raise HTTPException(status_code=404, detail=f"Productos no encontrados: {', '.join(map(str, faltantes))}")
+        
+        logger.info(f"🏷️ {current_user['username']} generando {len(productos)} etiquetas ZPL")
+        return Response(
+            content=etiquetas_zpl(productos, copias),
+            media_type=MEDIA_TYPE_ZPL,
+            headers={"Content-Disposition": 'inline; filename="etiquetas.zpl"'}
         )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error generando etiquetas: {e}")
+        raise HTTPException(status_code=500, detail=f"Error al generar etiquetas: {str(e)}")
+
+@app.post("/api/etiquetas/lote")
+async def post_hoja_etiquetas(datos: dict, request: Request):
+    """Hoja de etiquetas en PDF (QR, código de barras, nombre y ubicación)
+    
+    Body: {"ids": [12, 8, ...]} o {"ubicacion": "C0"} (prefijo: todo un
+    anaquel, en orden de ubicación). Máximo HOJA_ETIQUETAS_MAX etiquetas.
+    """
+    try:
+        current_user = await get_current_user(request)
+        require_auth(current_user)
         
-        if not codigo_barras:
-            raise HTTPException(status_code=500, detail="Error generando código de barras")
+        ids = datos.get("ids")
+        ubicacion = str(datos.get("ubicacion") or "").strip()
+        if bool(ids) == bool(ubicacion):
+            raise HTTPException(status_code=400, detail="Se requiere la lista de ids o un prefijo de ubicación (uno de los dos)")
         
-        return {"barcode": codigo_barras}
+        if ids:
+            if not isinstance(ids, list):
+                raise HTTPException(status_code=400, detail="ids debe ser una lista")
+            if len(ids) > HOJA_ETIQUETAS_MAX:
+                raise HTTPException(status_code=400, detail=f"Máximo {HOJA_ETIQUETAS_MAX} etiquetas por hoja")
+            try:
+                ids = [int(i) for i in ids]
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Los ids deben ser números")
+            resolvedor = await resolvedor_al_dia()
+            productos = [resolvedor.producto(i) for i in ids]
+            faltantes = [i for i, producto in zip(ids, productos) if producto is None]
+            if faltantes:
+                raise HTTPException(status_code=404, detail=f"Productos no encontrados: {', '.join(map(str, faltantes))}")
+        else:
+            productos = await run_read(leer_productos_ubicacion, ubicacion, HOJA_ETIQUETAS_MAX + 1)
+            if not productos:
+                raise HTTPException(status_code=404, detail=f"No hay productos en la ubicación {ubicacion}")
+            if len(productos) > HOJA_ETIQUETAS_MAX:
+                raise HTTPException(status_code=400, detail=f"Máximo {HOJA_ETIQUETAS_MAX} etiquetas por hoja: usa un prefijo más largo")
+        
+        pdf, metricas = await generar_hoja_etiquetas(productos)
+        logger.info(f"🏷️ {current_user['username']} generó hoja de etiquetas: {metricas}")
+        return Response(
+            content=pdf,
+            media_type="application/pdf",
+            headers={"Content-Disposition": 'attachment; filename="etiquetas.pdf"'}
+        )
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al obtener código de barras: {str(e)}")
+        logger.error(f"Error generando hoja de etiquetas: {e}")
+        raise HTTPException(status_code=500, detail=f"Error al generar hoja de etiquetas: {str(e)}")
+
+@app.get("/api/imagenes/{clave}")
+async def get_imagen(clave: str, request: Request):
+    """Imagen del almacén direccionado por contenido (caché inmutable)"""
+    etag = f'"{clave}"'
+    encabezados = {"ETag": etag, "Cache-Control": CACHE_INMUTABLE}
+    if if_none_match_coincide(request, etag):
+        return Response(status_code=304, headers=encabezados)
+    
+    imagen = cache_imagenes.obtener(clave)
+    if imagen is None:
+        imagen = await run_read(leer_imagen, clave)
+        if imagen is None:
+            raise HTTPException(status_code=404, detail="Imagen no encontrada")
+        cache_imagenes.guardar(clave, imagen["media_type"], imagen["datos"])
+    
+    return Response(content=imagen["datos"], media_type=imagen["media_type"], headers=encabezados)
+
+# Columnas que se pueden pedir con fields= en /api/productos
+PRODUCTO_CAMPOS = (
+    "id", "codigo_barras", "nombre", "descripcion", "cantidad",
+    "cantidad_minima", "ubicacion", "categoria", "precio_unitario",
+    "fecha_creacion", "fecha_actualizacion", "version_cambio"
+)
+# Los QR ya no están en productos: se piden a /api/productos/{id}/qr
+PRODUCTO_CAMPOS_DEFAULT = PRODUCTO_CAMPOS
+PRODUCTOS_LIMIT_MAX = 1000
+
+def parsear_campos_producto(fields: Optional[str]) -> tuple:
+    """Validar el parámetro fields= (lista separada por comas)"""
+    if not fields:
+        return PRODUCTO_CAMPOS_DEFAULT
+    campos = tuple(dict.fromkeys(c.strip() for c in fields.split(",") if c.strip()))
+    invalidos = [c for c in campos if c not in PRODUCTO_CAMPOS]
+    if invalidos or not campos:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Campos no válidos: {', '.join(invalidos) or fields}. Disponibles: {', '.join(PRODUCTO_CAMPOS)}"
+        )
+    return campos
+
+def codificar_cursor_productos(nombre: str, producto_id: int) -> str:
+    """Cursor opaco con la posición (nombre, id) del último producto de la página"""
+    return base64.urlsafe_b64encode(json.dumps([nombre, producto_id]).encode()).decode().rstrip("=")
+
+def decodificar_cursor_productos(cursor: str) -> tuple:
+    try:
+        nombre, producto_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(nombre), int(producto_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor de paginación no válido")
 
 @app.get("/api/productos")
-async def get_productos():
-    """Obtener todos los productos"""
+async def get_productos(request: Request, limit: int = None, cursor: str = None, fields: str = None):
+    """Obtener productos ordenados por nombre
+    
+    - limit: tamaño de página (sin limit se devuelven todos)
+    - cursor: siguiente_cursor de la página anterior (paginación por (nombre, id))
+    - fields: columnas separadas por comas; por defecto todas
+    
+    Responde 304 si If-None-Match coincide con la versión actual del catálogo
+    (el ETag incluye la codificación: identity, gzip o br).
+    Las respuestas salen del snapshot ya serializado y comprimido de la
+    versión actual; solo se consulta la base cuando el catálogo cambió.
+    """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, codigo_barras, nombre, descripcion, cantidad, 
-                   cantidad_minima, ubicacion, categoria, precio_unitario,
-                   codigo_qr, fecha_creacion, fecha_actualizacion
-            FROM productos 
-            ORDER BY nombre
-        """)
-        productos = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return {"productos": productos}
+        campos = parsear_campos_producto(fields)
+        if limit is not None and not 1 <= limit <= PRODUCTOS_LIMIT_MAX:
+            raise HTTPException(status_code=400, detail=f"limit debe estar entre 1 y {PRODUCTOS_LIMIT_MAX}")
+        posicion = decodificar_cursor_productos(cursor) if cursor else None
+        
+        # Cada codificación tiene su propio ETag (la elegida es la que se valida)
+        codificacion = elegir_codificacion(request.headers.get("accept-encoding"))
+        version = await run_read(leer_version_catalogo)
+        no_modificada = respuesta_no_modificada(request, version, "productos", codificacion)
+        if no_modificada is not None:
+            no_modificada.headers["Vary"] = "Accept-Encoding"
+            return no_modificada
+        
+        # nombre e id siempre se leen para construir el cursor
+        columnas = list(dict.fromkeys(("id", "nombre") + campos))
+        
+        def consultar(conn):
+            # Versión y filas del mismo snapshot de lectura; el catálogo completo
+            # se lee una vez por versión y las páginas se cortan de él
+            conn.execute("BEGIN")
+            try:
+                version_datos = leer_version_catalogo(conn)
+                cursor_db = conn.cursor()
+                cursor_db.execute(f"SELECT {', '.join(columnas)} FROM productos ORDER BY nombre, id")
+                return version_datos, cursor_db.fetchall()
+            finally:
+                conn.rollback()
+        
+        def serializar(version_datos, rows):
+            # Por posición: más rápido que por nombre con 50k filas
+            indices = [(campo, columnas.index(campo)) for campo in campos]
+            claves = [(row[1], row[0]) for row in rows]
+            fragmentos = [serializar_json({campo: row[i] for campo, i in indices}) for row in rows]
+            return CatalogoSerializado(version_datos, claves, fragmentos)
+        
+        async def construir():
+            version_datos, rows = await run_read(consultar)
+            return await run_blocking(serializar, version_datos, rows)
+        
+        catalogo = await snapshot_productos.obtener((campos,), version, construir)
+        entrada = catalogo.pagina_guardada(limit, posicion)
+        if entrada is None:
+            entrada = await run_blocking(catalogo.pagina, limit, posicion, codificar_cursor_productos)
+        
+        headers = encabezados_catalogo(entrada.version, etag_catalogo(entrada.version, "productos", codificacion))
+        headers["Vary"] = "Accept-Encoding"
+        if codificacion != "identity":
+            headers["Content-Encoding"] = codificacion
+        return Response(content=entrada.cuerpos[codificacion], media_type="application/json", headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener productos: {str(e)}")
 
+@app.get("/api/productos/cambios")
+async def get_cambios_productos(request: Request, desde: int = 0, fields: str = None):
+    """Productos modificados y eliminados después de la versión `desde`
+    
+    La tablet guarda la `version` de la respuesta y la envía como `desde`
+    la próxima vez; con eso aplica los cambios sobre su lista en memoria en
+    lugar de descargar todo el catálogo.
+    """
+    try:
+        campos = parsear_campos_producto(fields)
+        if desde < 0:
+            raise HTTPException(status_code=400, detail="desde debe ser mayor o igual a 0")
+        columnas = list(dict.fromkeys(("id",) + campos))
+        
+        def consultar(conn):
+            # Una sola transacción de lectura: versión, filas y lápidas del mismo snapshot
+            conn.execute("BEGIN")
+            try:
+                version = leer_version_catalogo(conn)
+                if desde >= version:
+                    return version, [], []
+                cursor = conn.cursor()
+                cursor.execute(f"""
+                    SELECT {', '.join(columnas)} FROM productos
+                    WHERE version_cambio > ?
+                    ORDER BY version_cambio
+                """, (desde,))
+                productos = [{campo: row[campo] for campo in campos} for row in cursor.fetchall()]
+                cursor.execute("""
+                    SELECT producto_id FROM productos_eliminados
+                    WHERE version_cambio > ?
+                    ORDER BY version_cambio
+                """, (desde,))
+                eliminados = [row["producto_id"] for row in cursor.fetchall()]
+                return version, productos, eliminados
+            finally:
+                conn.rollback()
+        
+        version, productos, eliminados = await run_read(consultar)
+        return JSONResponse(
+            content={
+                "version": version,
+                "desde": desde,
+                # desde mayor que la versión actual: la tablet viene de otra base de datos
+                "reiniciar": desde > version,
+                "productos": productos,
+                "eliminados": eliminados
+            },
+            headers={"X-Catalogo-Version": str(version), "Cache-Control": "no-cache"}
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener cambios de productos: {str(e)}")
+
+@app.get("/api/productos/facetas")
+async def get_facetas(request: Request):
+    """Categorías y ubicaciones con cantidad de productos, unidades y stock bajo
+
+    Los conteos los mantienen triggers en la tabla facetas (migración 8):
+    no se recorre productos. 304 si el catálogo no cambió.
+    """
+    try:
+        def consultar(conn):
+            version = leer_version_catalogo(conn)
+            if if_none_match_coincide(request, etag_catalogo(version, "facetas")):
+                return version, None
+            rows = conn.execute("""
+                SELECT tipo, valor, productos, unidades, stock_bajo
+                FROM facetas
+                ORDER BY tipo, valor
+            """).fetchall()
+            return version, rows
+
+        version, rows = await run_read(consultar)
+        if rows is None:
+            return respuesta_no_modificada(request, version, "facetas")
+
+        facetas = {"categorias": [], "ubicaciones": []}
+        for row in rows:
+            lista = facetas["categorias"] if row["tipo"] == "categoria" else facetas["ubicaciones"]
+            lista.append({
+                "valor": row["valor"] or None,  # '' = sin categoría / sin ubicación
+                "productos": row["productos"],
+                "unidades": row["unidades"],
+                "stock_bajo": row["stock_bajo"]
+            })
+        return JSONResponse(content=facetas, headers=encabezados_catalogo(version, etag_catalogo(version, "facetas")))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener facetas: {str(e)}")
+
+@app.get("/api/productos/buscar")
+async def buscar_productos_texto(q: str = "", limit: int = BUSQUEDA_LIMIT_DEFAULT, fields: str = None,
+                                 difusa: bool = True):
+    """Búsqueda por texto (prefijos de palabra) ordenada por relevancia
+    
+    - q: texto a buscar en nombre, descripción, categoría, ubicación y código
+    - limit: máximo de resultados (hasta 100)
+    - fields: columnas separadas por comas, como en /api/productos
+    - difusa: completar con nombres parecidos (errores de escritura)
+    """
+    try:
+        campos = parsear_campos_producto(fields)
+        limit = max(1, min(limit, BUSQUEDA_LIMIT_MAX))
+        
+        if not q.strip():
+            return {"productos": [], "total": 0, "difusos": 0}
+        
+        def consultar(conn):
+            ids, exactos = buscar_ids(conn, q, limit, difusa)
+            return [dict(row) for row in leer_productos_ordenados(conn, ids, campos)], len(ids) - exactos
+        
+        productos, difusos = await run_read(consultar)
+        # difusos: cuántos de los últimos resultados son nombres parecidos
+        return {"productos": productos, "total": len(productos), "difusos": difusos}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error en búsqueda de productos: {e}")
+        raise HTTPException(status_code=500, detail=f"Error buscando productos: {str(e)}")
+
+async def resolvedor_al_dia():
+    """Índice de escaneos con la versión actual del catálogo (solo lee SQLite si cambió)"""
+    if not resolvedor_escaneos.al_dia():
+        await run_read(resolvedor_escaneos.actualizar)
+    return resolvedor_escaneos
+
+async def resolver_escaneo(codigo: str) -> Optional[dict]:
+    """Producto de un código escaneado"""
+    return (await resolvedor_al_dia()).resolver(codigo)
+
 @app.post("/api/productos/buscar")
 async def buscar_producto_por_codigo(datos: dict):
     """Buscar un producto por su código de barras o QR"""
     try:
-        codigo = datos.get("codigo")
+        codigo = limpiar_codigo(datos.get("codigo"))
         if not codigo:
             raise HTTPException(status_code=400, detail="El código es obligatorio")
         
         logger.info(f"Buscando producto con código: {codigo}")
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        # Código de barras, ID del QR o nombre exacto: índice en memoria
+        producto = await resolver_escaneo(codigo)
         
-        # Buscar por código de barras exacto
-        cursor.execute("""
-            SELECT id, codigo_barras, nombre, descripcion, cantidad, 
-                   cantidad_minima, ubicacion, categoria, precio_unitario
-            FROM productos 
-            WHERE codigo_barras = ?
-        """, (codigo,))
-        producto = cursor.fetchone()
-        
-        # Si no se encuentra, buscar por ID si el código contiene "ID:"
-        if not producto and "ID:" in codigo:
-            try:
-                # Extraer el ID del formato "ID:8|Nombre:Popote"
-                id_part = codigo.split("|")[0]
-                producto_id = int(id_part.replace("ID:", ""))
-                
-                cursor.execute("""
-                    SELECT id, codigo_barras, nombre, descripcion, cantidad, 
-                           cantidad_minima, ubicacion, categoria, precio_unitario
-                    FROM productos 
-                    WHERE id = ?
-                """, (producto_id,))
-                producto = cursor.fetchone()
-                logger.info(f"Buscando por ID extraído: {producto_id}")
-            except (ValueError, IndexError) as e:
-                logger.warning(f"Error extrayendo ID del código QR: {e}")
-        
-        # Si aún no se encuentra, buscar por nombre en el contenido del QR
-        if not producto and "|" in codigo:
-            try:
-                # Extraer el nombre del formato "ID:8|Nombre:Popote"
-                nombre_part = codigo.split("|")[1]
-                nombre = nombre_part.replace("Nombre:", "").strip()
-                
-                cursor.execute("""
-                    SELECT id, codigo_barras, nombre, descripcion, cantidad, 
-                           cantidad_minima, ubicacion, categoria, precio_unitario
-                    FROM productos 
-                    WHERE nombre LIKE ?
-                """, (f"%{nombre}%",))
-                producto = cursor.fetchone()
-                logger.info(f"Buscando por nombre extraído: {nombre}")
-            except (IndexError, Exception) as e:
-                logger.warning(f"Error extrayendo nombre del código QR: {e}")
-        
-        # Si aún no se encuentra, buscar por cualquier parte del código en el nombre
-        if not producto:
-            cursor.execute("""
-                SELECT id, codigo_barras, nombre, descripcion, cantidad, 
-                       cantidad_minima, ubicacion, categoria, precio_unitario
-                FROM productos 
-                WHERE nombre LIKE ? OR codigo_barras LIKE ?
-            """, (f"%{codigo}%", f"%{codigo}%"))
-            producto = cursor.fetchone()
+        def consultar(conn):
+            cursor = conn.cursor()
+            producto = None
+            
+            # Si no se encuentra, buscar por nombre en el contenido del QR
+            if "|" in codigo:
+                try:
+                    # Extraer el nombre del formato "ID:8|Nombre:Popote"
+                    nombre_part = codigo.split("|")[1]
+                    nombre = nombre_part.replace("Nombre:", "").strip()
+                    
+                    cursor.execute("""
+                        SELECT id, codigo_barras, nombre, descripcion, cantidad, 
+                               cantidad_minima, ubicacion, categoria, precio_unitario
+                        FROM productos 
+                        WHERE nombre LIKE ?
+                    """, (f"%{nombre}%",))
+                    producto = cursor.fetchone()
+                    logger.info(f"Buscando por nombre extraído: {nombre}")
+                except (IndexError, Exception) as e:
+                    logger.warning(f"Error extrayendo nombre del código QR: {e}")
+            
+            # Si aún no se encuentra, el más relevante del índice de texto
+            if not producto:
+                # Sin búsqueda difusa: un escaneo no debe resolver a otra herramienta
+                resultados = buscar_productos(conn, codigo, 1, COLUMNAS_ESCANEO, difusa=False)
+                producto = resultados[0] if resultados else None
+            return producto
         
-        conn.close()
+        if not producto:
+            producto = await run_read(consultar)
         
         if not producto:
             raise HTTPException(status_code=404, detail="Producto no encontrado")
@@ -728,6 +835,35 @@ async def buscar_producto_por_codigo(datos: dict):
         logger.error(f"Error buscando producto: {e}")
         raise HTTPException(status_code=500, detail=f"Error buscando producto: {str(e)}")
 
+@app.post("/api/productos/buscar-lote")
+async def buscar_productos_por_codigos(datos: dict, request: Request):
+    """Resolver una tanda de códigos escaneados (charola de herramientas)
+    
+    Body: {"codigos": ["000000000012", "ID:8|Nombre:Popote", ...]}
+    Solo coincidencias exactas (código de barras o QR), sin búsqueda por texto:
+    en una tanda no hay quien confirme una coincidencia parcial.
+    """
+    try:
+        current_user = await get_current_user(request)
+        require_auth(current_user)
+        
+        codigos = datos.get("codigos")
+        if not isinstance(codigos, list) or not codigos:
+            raise HTTPException(status_code=400, detail="Se requiere la lista de códigos")
+        if len(codigos) > ESCANEO_LOTE_MAX:
+            raise HTTPException(status_code=400, detail=f"Máximo {ESCANEO_LOTE_MAX} códigos por envío")
+        
+        encontrados, no_encontrados = (await resolvedor_al_dia()).resolver_lote([str(c) for c in codigos if c is not None])
+        
+        logger.info(f"📦 Tanda de {len(codigos)} escaneos: {len(encontrados)} encontrados, {len(no_encontrados)} no encontrados")
+        return {"encontrados": encontrados, "no_encontrados": no_encontrados}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error resolviendo tanda de códigos: {e}")
+        raise HTTPException(status_code=500, detail=f"Error buscando productos: {str(e)}")
+
 def require_supervisor_or_operator(user):
     """Verificar que el usuario sea supervisor u operador"""
     if not user:
@@ -767,106 +903,100 @@ async def crear_producto(producto: dict, request: Request):
     """Crear un nuevo producto - Solo administradores"""
     try:
         # Verificar que el usuario sea administrador
-        current_user = get_current_user(request)
+        current_user = await get_current_user(request)
         require_admin(current_user)
         
         logger.info(f"Administrador {current_user['username']} creando producto: {producto}")
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Validar datos
-        if not producto.get("nombre"):
-            raise HTTPException(status_code=400, detail="El nombre es obligatorio")
-        
-        # Limpiar y convertir valores
-        codigo_barras = producto.get("codigo_barras", "").strip() or None
-        nombre = producto["nombre"].strip()
-        descripcion = producto.get("descripcion", "").strip() or None
-        ubicacion = producto.get("ubicacion", "").strip() or None
-        categoria = producto.get("categoria", "").strip() or None
-        
-        # Convertir valores numéricos con manejo de errores
-        try:
-            cantidad = int(producto.get("cantidad", 0)) if producto.get("cantidad") else 0
-        except (ValueError, TypeError):
-            cantidad = 0
+        def registrar(conn):
+            cursor = conn.cursor()
             
-        try:
-            cantidad_minima = int(producto.get("cantidad_minima", 0)) if producto.get("cantidad_minima") else 0
-        except (ValueError, TypeError):
-            cantidad_minima = 0
+            # Validar datos
+            if not producto.get("nombre"):
+                raise HTTPException(status_code=400, detail="El nombre es obligatorio")
             
-        try:
-            precio_unitario = float(producto.get("precio_unitario", 0)) if producto.get("precio_unitario") else None
-        except (ValueError, TypeError):
-            precio_unitario = None
-        
-        if cantidad < 0:
-            raise HTTPException(status_code=400, detail="La cantidad no puede ser negativa")
-        
-        logger.info(f"Datos procesados: nombre='{nombre}', cantidad={cantidad}, precio={precio_unitario}")
-        
-        # Insertar producto primero para obtener el ID
-        cursor.execute("""
-            INSERT INTO productos (codigo_barras, nombre, descripcion, cantidad, 
-                                  cantidad_minima, ubicacion, categoria, precio_unitario)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            codigo_barras,
-            nombre,
-            descripcion,
-            cantidad,
-            cantidad_minima,
-            ubicacion,
-            categoria,
-            precio_unitario
-        ))
-        
-        producto_id = cursor.lastrowid
-        
-        # Si no se proporcionó código de barras, generar uno automáticamente
-        if not codigo_barras:
-            codigo_barras = f"{producto_id:012d}"
-            cursor.execute("""
-                UPDATE productos SET codigo_barras = ? WHERE id = ?
-            """, (codigo_barras, producto_id))
-            logger.info(f"Código de barras generado automáticamente: {codigo_barras}")
-        
-        # Si no se proporcionó ubicación, generar una automáticamente
-        if not ubicacion:
-            ubicacion = generar_ubicacion_automatica(producto_id)
-            cursor.execute("""
-                UPDATE productos SET ubicacion = ? WHERE id = ?
-            """, (ubicacion, producto_id))
-            logger.info(f"Ubicación generada automáticamente: {ubicacion}")
-        
-        # Generar código QR automáticamente
-        codigo_qr = generar_codigo_qr(producto_id, nombre, codigo_barras)
-        
-        # Actualizar el producto con el código QR generado
-        if codigo_qr:
+            # Limpiar y convertir valores
+            codigo_barras = producto.get("codigo_barras", "").strip() or None
+            nombre = producto["nombre"].strip()
+            descripcion = producto.get("descripcion", "").strip() or None
+            ubicacion = producto.get("ubicacion", "").strip() or None
+            categoria = producto.get("categoria", "").strip() or None
+            
+            # Convertir valores numéricos con manejo de errores
+            try:
+                cantidad = int(producto.get("cantidad", 0)) if producto.get("cantidad") else 0
+            except (ValueError, TypeError):
+                cantidad = 0
+                
+            try:
+                cantidad_minima = int(producto.get("cantidad_minima", 0)) if producto.get("cantidad_minima") else 0
+            except (ValueError, TypeError):
+                cantidad_minima = 0
+                
+            try:
+                precio_unitario = float(producto.get("precio_unitario", 0)) if producto.get("precio_unitario") else None
+            except (ValueError, TypeError):
+                precio_unitario = None
+            
+            if cantidad < 0:
+                raise HTTPException(status_code=400, detail="La cantidad no puede ser negativa")
+            
+            logger.info(f"Datos procesados: nombre='{nombre}', cantidad={cantidad}, precio={precio_unitario}")
+            
+            # Insertar producto primero para obtener el ID
             cursor.execute("""
-                UPDATE productos SET codigo_qr = ? WHERE id = ?
-            """, (codigo_qr, producto_id))
-            logger.info(f"Código QR generado para producto {producto_id}")
+                INSERT INTO productos (codigo_barras, nombre, descripcion, cantidad, 
+                                      cantidad_minima, ubicacion, categoria, precio_unitario)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                codigo_barras,
+                nombre,
+                descripcion,
+                cantidad,
+                cantidad_minima,
+                ubicacion,
+                categoria,
+                precio_unitario
+            ))
+            
+            producto_id = cursor.lastrowid
+            
+            # Si no se proporcionó código de barras, generar uno automáticamente
+            if not codigo_barras:
+                codigo_barras = f"{producto_id:012d}"
+                cursor.execute("""
+                    UPDATE productos SET codigo_barras = ? WHERE id = ?
+                """, (codigo_barras, producto_id))
+                logger.info(f"Código de barras generado automáticamente: {codigo_barras}")
+            
+            # Si no se proporcionó ubicación, generar una automáticamente
+            if not ubicacion:
+                ubicacion = generar_ubicacion_automatica(producto_id)
+                cursor.execute("""
+                    UPDATE productos SET ubicacion = ? WHERE id = ?
+                """, (ubicacion, producto_id))
+                logger.info(f"Ubicación generada automáticamente: {ubicacion}")
+            
+            # Registrar en historial con usuario actual
+            try:
+                cursor.execute("""
+                    INSERT INTO historial (accion, producto_id, cantidad_anterior, cantidad_nueva, usuario_id, usuario_nombre)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, ("crear", producto_id, 0, cantidad, current_user["id"], current_user["nombre_completo"]))
+            except sqlite3.OperationalError as e:
+                # Si hay error con las columnas, registrar sin ellas
+                logger.warning(f"Error registrando en historial: {e}")
+                cursor.execute("""
+                    INSERT INTO historial (accion, producto_id, cantidad_anterior, cantidad_nueva)
+                    VALUES (?, ?, ?, ?)
+                """, ("crear", producto_id, 0, cantidad))
+            return producto_id
         
-        # Registrar en historial con usuario actual
-        try:
-            cursor.execute("""
-                INSERT INTO historial (accion, producto_id, cantidad_anterior, cantidad_nueva, usuario_id, usuario_nombre)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, ("crear", producto_id, 0, cantidad, current_user["id"], current_user["nombre_completo"]))
-        except sqlite3.OperationalError as e:
-            # Si hay error con las columnas, registrar sin ellas
-            logger.warning(f"Error registrando en historial: {e}")
-            cursor.execute("""
-                INSERT INTO historial (accion, producto_id, cantidad_anterior, cantidad_nueva)
-                VALUES (?, ?, ?, ?)
-            """, ("crear", producto_id, 0, cantidad))
+        producto_id = await run_write(registrar)
         
-        conn.commit()
-        conn.close()
+        # El QR y el código de barras los genera el trabajador en segundo plano
+        # (el trigger ya encoló el producto en codigos_pendientes)
+        generador_codigos.despertar()
         
         # Sistema de alertas automático cada 48 horas (no en cada operación)
         # Las alertas se ejecutan automáticamente en background, no aquí
@@ -880,67 +1010,299 @@ async def crear_producto(producto: dict, request: Request):
         logger.error(f"Error al crear producto: {e}")
         raise HTTPException(status_code=500, detail=f"Error al crear herramienta: {str(e)}")
 
-@app.put("/api/productos/{producto_id}")
-async def actualizar_producto(producto_id: int, producto: dict, request: Request):
-    """Actualizar un producto existente - Solo administradores"""
+def lineas_cuerpo(request: Request, loop) -> Iterator[str]:
+    """Líneas del cuerpo a medida que llegan (con límite de tamaño)
+
+    Se consume en un hilo: cada parte se pide al event loop, así que el
+    lector de filas y la validación avanzan con la subida y el archivo
+    nunca está completo en memoria, solo las filas válidas.
+    """
+    partes = request.stream().__aiter__()
+    decodificador = codecs.getincrementaldecoder("utf-8-sig")()
+    pendiente = ""
+    total = 0
+    while True:
+        try:
+            parte = asyncio.run_coroutine_threadsafe(partes.__anext__(), loop).result()
+        except StopAsyncIteration:
+            break
+        total += len(parte)
+        if total > IMPORTACION_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Archivo demasiado grande (máximo {IMPORTACION_MAX_BYTES // (1024 * 1024)} MB)")
+        try:
+            pendiente += decodificador.decode(parte)
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="El archivo debe estar en UTF-8")
+        *completas, pendiente = pendiente.split("\n")
+        for linea in completas:
+            yield linea + "\n"
+    pendiente += decodificador.decode(b"", final=True)
+    if pendiente:
+        yield pendiente
+
+@app.post("/api/productos/importar")
+async def importar_productos(request: Request, formato: str = None, omitir_errores: bool = False, solo_validar: bool = False):
+    """Importación masiva de productos desde CSV o NDJSON - Solo administradores
+    
+    - formato: csv o ndjson (por defecto según el Content-Type)
+    - omitir_errores: importar las filas válidas aunque otras tengan errores
+    - solo_validar: revisar el archivo sin insertar nada
+    """
     try:
-        # Verificar que el usuario sea administrador
-        current_user = get_current_user(request)
+        current_user = await get_current_user(request)
         require_admin(current_user)
         
-        logger.info(f"Administrador {current_user['username']} actualizando producto {producto_id}")
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        try:
+            formato = detectar_formato(request.headers.get("content-type"), formato)
+        except ErrorImportacion as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        # Obtener cantidad anterior
-        cursor.execute("SELECT cantidad FROM productos WHERE id = ?", (producto_id,))
-        result = cursor.fetchone()
-        if not result:
-            raise HTTPException(status_code=404, detail="Producto no encontrado")
+        # Lectura y validación (CPU) en una sola pasada fuera del event loop, mientras llega el cuerpo
+        lector = leer_filas_csv if formato == "csv" else leer_filas_ndjson
+        lineas = lineas_cuerpo(request, asyncio.get_running_loop())
+        try:
+            validas, errores = await run_blocking(lambda: validar_filas(lector(lineas)))
+        except ErrorImportacion as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        def quitar_existentes(conn):
+            existentes = codigos_existentes(conn, validas)
+            for codigo, fila in existentes.items():
+                errores.append({"fila": fila, "error": f"El código de barras {codigo} ya existe"})
+            return [f for f in validas if f[1] not in existentes]
+        
+        def responder_errores():
+            errores.sort(key=lambda e: e["fila"])
+            return JSONResponse(status_code=400, content={
+                "detail": f"{len(errores)} filas con errores; no se importó nada",
+                "total_errores": len(errores),
+                "errores": errores[:IMPORTACION_MAX_ERRORES]
+            })
+        
+        if solo_validar:
+            validas = await run_read(quitar_existentes)
+            errores.sort(key=lambda e: e["fila"])
+            return {
+                "mensaje": "Validación completada",
+                "validas": len(validas),
+                "total_errores": len(errores),
+                "errores": errores[:IMPORTACION_MAX_ERRORES]
+            }
         
-        cantidad_anterior = result["cantidad"]
+        if errores and not omitir_errores:
+            return responder_errores()
         
-        # Actualizar producto
-        cursor.execute("""
-            UPDATE productos 
-            SET nombre = ?, descripcion = ?, cantidad = ?, cantidad_minima = ?,
-                ubicacion = ?, categoria = ?, precio_unitario = ?, fecha_actualizacion = CURRENT_TIMESTAMP
-            WHERE id = ?
-        """, (
-            producto.get("nombre"),
-            producto.get("descripcion"),
-            producto.get("cantidad", 0),
-            producto.get("cantidad_minima", 0),
-            producto.get("ubicacion"),
-            producto.get("categoria"),
-            producto.get("precio_unitario"),
-            producto_id
-        ))
-        
-        # Registrar en historial
-        cursor.execute("""
-            INSERT INTO historial (accion, producto_id, cantidad_anterior, cantidad_nueva, usuario_id, usuario_nombre)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, ("actualizar", producto_id, cantidad_anterior, producto.get("cantidad", 0), current_user["id"], current_user["nombre_completo"]))
+        def registrar(conn):
+            # Los códigos existentes se revisan en la misma transacción del INSERT
+            filas = quitar_existentes(conn)
+            if len(filas) < len(validas) and not omitir_errores:
+                return None
+            if not filas:
+                return []
+            return insertar_productos(conn, filas, current_user)
         
-        conn.commit()
-        conn.close()
+        creados = await run_write(registrar)
+        if creados is None:
+            return responder_errores()
         
-        # Sistema de alertas automático cada 48 horas (no en cada operación)
-        # Las alertas se ejecutan automáticamente en background, no aquí
+        # Los códigos se generan en segundo plano (codigos_pendientes)
+        if creados:
+            generador_codigos.despertar()
         
-        return {"mensaje": "Herramienta actualizada exitosamente"}
+        errores.sort(key=lambda e: e["fila"])
+        logger.info(f"Administrador {current_user['username']} importó {len(creados)} productos ({len(errores)} filas omitidas)")
+        return {
+            "mensaje": f"{len(creados)} herramientas importadas exitosamente",
+            "importados": len(creados),
+            "omitidos": len(errores),
+            "errores": errores[:IMPORTACION_MAX_ERRORES]
+        }
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al actualizar herramienta: {str(e)}")
-
+        logger.error(f"Error en importación masiva: {e}")
+        raise HTTPException(status_code=500, detail=f"Error al importar herramientas: {str(e)}")
 
+@app.put("/api/productos/{producto_id}")
+async def actualizar_producto(producto_id: int, producto: dict, request: Request):
+    """Actualizar un producto existente - Solo administradores"""
+    try:
+        # Verificar que el usuario sea administrador
+        current_user = await get_current_user(request)
+        require_admin(current_user)
+        
+        logger.info(f"Administrador {current_user['username']} actualizando producto {producto_id}")
+        
+        def actualizar(conn):
+            cursor = conn.cursor()
+            
+            # Obtener cantidad anterior
+            cursor.execute("SELECT cantidad FROM productos WHERE id = ?", (producto_id,))
+            result = cursor.fetchone()
+            if not result:
+                raise HTTPException(status_code=404, detail="Producto no encontrado")
+            
+            cantidad_anterior = result["cantidad"]
+            
+            # Actualizar producto
+            cursor.execute("""
+                UPDATE productos 
+                SET nombre = ?, descripcion = ?, cantidad = ?, cantidad_minima = ?,
+                    ubicacion = ?, categoria = ?, precio_unitario = ?, fecha_actualizacion = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, (
+                producto.get("nombre"),
+                producto.get("descripcion"),
+                producto.get("cantidad", 0),
+                producto.get("cantidad_minima", 0),
+                producto.get("ubicacion"),
+                producto.get("categoria"),
+                producto.get("precio_unitario"),
+                producto_id
+            ))
+            
+            # Registrar en historial
+            cursor.execute("""
+                INSERT INTO historial (accion, producto_id, cantidad_anterior, cantidad_nueva, usuario_id, usuario_nombre)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, ("actualizar", producto_id, cantidad_anterior, producto.get("cantidad", 0), current_user["id"], current_user["nombre_completo"]))
+        
+        await run_write(actualizar)
+        # Si cambió el nombre, el trigger encoló el QR nuevo
+        generador_codigos.despertar()
+        
+        # Sistema de alertas automático cada 48 horas (no en cada operación)
+        # Las alertas se ejecutan automáticamente en background, no aquí
+        
+        return {"mensaje": "Herramienta actualizada exitosamente"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al actualizar herramienta: {str(e)}")
+
+
+
+# ==================== CONTEOS CÍCLICOS ====================
+
+@app.post("/api/conteos")
+async def crear_conteo(request: Request, datos: dict = None):
+    """Abrir una sesión de conteo cíclico - Solo administradores"""
+    try:
+        current_user = await get_current_user(request)
+        require_admin(current_user)
+        
+        notas = ((datos or {}).get("notas") or "").strip() or None
+        conteo_id = await run_write(abrir_conteo, current_user, notas)
+        
+        logger.info(f"Administrador {current_user['username']} abrió el conteo #{conteo_id}")
+        return {"mensaje": "Conteo iniciado", "id": conteo_id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al iniciar conteo: {str(e)}")
+
+@app.get("/api/conteos")
+async def listar_conteos(request: Request, estado: str = None, limit: int = 50):
+    """Listar sesiones de conteo - Solo administradores"""
+    try:
+        current_user = await get_current_user(request)
+        require_admin(current_user)
+        
+        def consultar(conn):
+            cursor = conn.cursor()
+            query = """
+                SELECT c.*, (SELECT COUNT(*) FROM conteo_items i WHERE i.conteo_id = c.id) AS lecturas
+                FROM conteos c
+            """
+            params = []
+            if estado:
+                query += " WHERE c.estado = ?"
+                params.append(estado)
+            query += " ORDER BY c.id DESC LIMIT ?"
+            params.append(limit)
+            cursor.execute(query, params)
+            return [dict(row) for row in cursor.fetchall()]
+        
+        return {"conteos": await run_read(consultar)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al listar conteos: {str(e)}")
+
+@app.get("/api/conteos/{conteo_id}")
+async def obtener_conteo_detalle(conteo_id: int, request: Request, todos: bool = False):
+    """Sesión de conteo con sus diferencias (todos=true incluye los que cuadran)"""
+    try:
+        current_user = await get_current_user(request)
+        require_admin(current_user)
+        
+        return await run_read(diferencias_conteo, conteo_id, not todos)
+    except ErrorConteo as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener conteo: {str(e)}")
+
+@app.post("/api/conteos/{conteo_id}/lecturas")
+async def agregar_lecturas_conteo(conteo_id: int, datos: dict, request: Request):
+    """Agregar lecturas {"lecturas": [{"codigo", "cantidad"}], "acumular": false}
+    
+    La tablet puede mandar las lecturas en varios envíos; nada cambia en
+    productos hasta aplicar el conteo.
+    """
+    try:
+        current_user = await get_current_user(request)
+        require_admin(current_user)
+        
+        pares = parsear_lecturas(datos.get("lecturas"))
+        resultado = await run_write(registrar_lecturas, conteo_id, pares, bool(datos.get("acumular")))
+        
+        return {"mensaje": f"{resultado['registradas']} lecturas registradas", **resultado}
+    except ErrorConteo as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al registrar lecturas: {str(e)}")
+
+@app.post("/api/conteos/{conteo_id}/aplicar")
+async def aplicar_conteo_endpoint(conteo_id: int, request: Request):
+    """Aplicar todos los ajustes del conteo en una sola transacción"""
+    try:
+        current_user = await get_current_user(request)
+        require_admin(current_user)
+        
+        resultado = await run_write(aplicar_conteo, conteo_id, current_user)
+        
+        logger.info(f"Administrador {current_user['username']} aplicó el conteo #{conteo_id}")
+        return {"mensaje": f"Conteo aplicado: {resultado['productos_ajustados']} herramientas ajustadas", **resultado}
+    except ErrorConteo as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al aplicar conteo: {str(e)}")
+
+@app.delete("/api/conteos/{conteo_id}")
+async def cancelar_conteo_endpoint(conteo_id: int, request: Request):
+    """Cancelar un conteo abierto sin modificar el stock"""
+    try:
+        current_user = await get_current_user(request)
+        require_admin(current_user)
+        
+        await run_write(cancelar_conteo, conteo_id)
+        return {"mensaje": "Conteo cancelado"}
+    except ErrorConteo as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al cancelar conteo: {str(e)}")
 
 @app.post("/api/alertas/probar")
 async def probar_sistema_alertas(request: Request):
     """Probar el sistema de alertas - Solo administradores"""
     try:
-        current_user = get_current_user(request)
+        current_user = await get_current_user(request)
         require_admin(current_user)
         
         if not ALERT_SYSTEM_AVAILABLE:
@@ -978,7 +1340,7 @@ async def probar_sistema_alertas(request: Request):
 async def obtener_estado_alertas(request: Request):
     """Obtener estado del sistema de alertas - Solo administradores"""
     try:
-        current_user = get_current_user(request)
+        current_user = await get_current_user(request)
         require_admin(current_user)
         
         return {
@@ -996,35 +1358,103 @@ async def obtener_estado_alertas(request: Request):
         logger.error(f"Error obteniendo estado de alertas: {e}")
         raise HTTPException(status_code=500, detail=f"Error obteniendo estado: {str(e)}")
 
+@app.get("/api/sistema/configuracion")
+async def obtener_configuracion_sistema(request: Request):
+    """Obtener la configuración resuelta al arrancar (rama y base de datos) - Solo administradores"""
+    try:
+        current_user = await get_current_user(request)
+        require_admin(current_user)
+        
+        return get_settings().to_dict()
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error obteniendo configuración del sistema: {e}")
+        raise HTTPException(status_code=500, detail=f"Error obteniendo configuración: {str(e)}")
+
+@app.get("/api/sistema/pool")
+async def obtener_estadisticas_pool(request: Request):
+    """Obtener estadísticas del pool de conexiones - Solo administradores"""
+    try:
+        current_user = await get_current_user(request)
+        require_admin(current_user)
+        
+        pool = get_pool()
+        if pool is None:
+            raise HTTPException(status_code=503, detail="Pool de conexiones no inicializado")
+        
+        estadisticas = pool.stats()
+        estadisticas["ejecutores"] = executor_stats()
+        return estadisticas
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error obteniendo estadísticas del pool: {e}")
+        raise HTTPException(status_code=500, detail=f"Error obteniendo estadísticas: {str(e)}")
+
+@app.get("/api/sistema/cache")
+async def obtener_estadisticas_cache(request: Request):
+    """Métricas de las cachés (en memoria y PDFs en disco) - Solo administradores"""
+    try:
+        current_user = await get_current_user(request)
+        require_admin(current_user)
+        
+        return {"catalogo": snapshot_productos.stats(), "trigramas": indice_nombres.stats(),
+                "escaneos": resolvedor_escaneos.stats(), "imagenes": cache_imagenes.stats(),
+                "pdf_tickets": cache_pdf_tickets.stats()}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error obteniendo estadísticas de caché: {e}")
+        raise HTTPException(status_code=500, detail=f"Error obteniendo estadísticas: {str(e)}")
+
+@app.get("/api/sistema/codigos")
+async def obtener_estado_generador_codigos(request: Request):
+    """Cola de generación de QR y códigos de barras - Solo administradores"""
+    try:
+        current_user = await get_current_user(request)
+        require_admin(current_user)
+        
+        cola = await run_read(resumen_pendientes)
+        return {"cola": cola, "generador": generador_codigos.stats()}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error obteniendo estado del generador de códigos: {e}")
+        raise HTTPException(status_code=500, detail=f"Error obteniendo estadísticas: {str(e)}")
+
 @app.delete("/api/productos/{producto_id}")
 async def eliminar_producto(producto_id: int, request: Request):
     """Eliminar un producto - Solo administradores"""
     try:
         # Verificar que el usuario sea administrador
-        current_user = get_current_user(request)
+        current_user = await get_current_user(request)
         require_admin(current_user)
         
         logger.info(f"Administrador {current_user['username']} eliminando producto {producto_id}")
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Verificar si existe
-        cursor.execute("SELECT id FROM productos WHERE id = ?", (producto_id,))
-        if not cursor.fetchone():
-            raise HTTPException(status_code=404, detail="Herramienta no encontrada")
-        
-        # Eliminar producto
-        cursor.execute("DELETE FROM productos WHERE id = ?", (producto_id,))
-        
-        # Registrar en historial
-        cursor.execute("""
-            INSERT INTO historial (accion, producto_id, cantidad_anterior, cantidad_nueva, usuario_id, usuario_nombre)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, ("eliminar", producto_id, 0, 0, current_user["id"], current_user["nombre_completo"]))
+        def eliminar(conn):
+            cursor = conn.cursor()
+            
+            # Verificar si existe
+            cursor.execute("SELECT id FROM productos WHERE id = ?", (producto_id,))
+            if not cursor.fetchone():
+                raise HTTPException(status_code=404, detail="Herramienta no encontrada")
+            
+            # Eliminar producto
+            cursor.execute("DELETE FROM productos WHERE id = ?", (producto_id,))
+            
+            # Registrar en historial
+            cursor.execute("""
+                INSERT INTO historial (accion, producto_id, cantidad_anterior, cantidad_nueva, usuario_id, usuario_nombre)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, ("eliminar", producto_id, 0, 0, current_user["id"], current_user["nombre_completo"]))
         
-        conn.commit()
-        conn.close()
+        await run_write(eliminar)
         
         return {"mensaje": "Herramienta eliminada exitosamente"}
     except Exception as e:
@@ -1034,54 +1464,199 @@ async def eliminar_producto(producto_id: int, request: Request):
 async def get_historial():
     """Obtener historial de acciones"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT h.*, p.nombre as producto_nombre
-            FROM historial h
-            LEFT JOIN productos p ON h.producto_id = p.id
-            ORDER BY h.fecha DESC
-            LIMIT 100
-        """)
-        historial = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        def consultar(conn):
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT h.*, p.nombre as producto_nombre
+                FROM historial h
+                LEFT JOIN productos p ON h.producto_id = p.id
+                ORDER BY h.fecha DESC
+                LIMIT 100
+            """)
+            return [dict(row) for row in cursor.fetchall()]
+        
+        historial = await run_read(consultar)
         return {"historial": historial}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener historial: {str(e)}")
 
-@app.get("/api/estadisticas")
-async def get_estadisticas():
-    """Obtener estadísticas del almacén"""
+# ==================== EXPORTACIÓN ====================
+
+async def generar_exportacion(formato: str, columnas, hoja: str, leer_bloque, **filtros):
+    """Enviar el archivo por bloques: leer y codificar cada bloque en el pool de lectura"""
+    escritor = crear_escritor(formato, [titulo for _, titulo in columnas], hoja)
+    yield escritor.inicio()
+    
+    ultimo_id = 0
+    while True:
+        def bloque(conn, despues_de=ultimo_id):
+            filas = leer_bloque(conn, despues_de, **filtros)
+            if not filas:
+                return None, b""
+            return filas[-1]["id"], escritor.filas(tuple(fila) for fila in filas)
+        
+        ultimo_id, datos = await run_read(bloque)
+        if datos:
+            yield datos
+        if ultimo_id is None:
+            break
+    
+    yield escritor.fin()
+
+def respuesta_exportacion(formato: str, nombre: str, columnas, leer_bloque, **filtros) -> StreamingResponse:
+    formato = (formato or "csv").lower()
+    if formato not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Formato no soportado (usar csv o xlsx)")
+    archivo = f"{nombre}_{datetime.now().strftime('%Y%m%d_%H%M')}.{formato}"
+    return StreamingResponse(
+        generar_exportacion(formato, columnas, nombre.capitalize(), leer_bloque, **filtros),
+        media_type=MEDIA_TYPES[formato],
+        headers={"Content-Disposition": f'attachment; filename="{archivo}"'}
+    )
+
+def validar_fechas_exportacion(*fechas):
+    for fecha in fechas:
+        if fecha:
+            try:
+                datetime.strptime(fecha, "%Y-%m-%d")
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Las fechas deben tener formato YYYY-MM-DD")
+
+@app.get("/api/export/productos")
+async def exportar_productos(request: Request, formato: str = "csv"):
+    """Exportar el catálogo completo a CSV o Excel - Solo administradores"""
+    current_user = await get_current_user(request)
+    require_admin(current_user)
+    logger.info(f"Administrador {current_user['username']} exportando productos ({formato})")
+    return respuesta_exportacion(formato, "productos", COLUMNAS_PRODUCTOS, leer_bloque_productos)
+
+@app.get("/api/export/historial")
+async def exportar_historial(request: Request, formato: str = "csv", desde: str = None, hasta: str = None):
+    """Exportar el historial a CSV o Excel (desde/hasta: YYYY-MM-DD) - Solo administradores"""
+    current_user = await get_current_user(request)
+    require_admin(current_user)
+    validar_fechas_exportacion(desde, hasta)
+    logger.info(f"Administrador {current_user['username']} exportando historial ({formato})")
+    return respuesta_exportacion(formato, "historial", COLUMNAS_HISTORIAL, leer_bloque_historial,
+                                 desde=desde, hasta=hasta)
+
+async def pdf_para_zip(fila) -> tuple:
+    """(nombre en el ZIP, PDF, None) de un ticket, o (nombre, None, error) si no se pudo generar"""
+    nombre = f"ticket_{fila['numero_ticket']}.pdf"
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Total de productos
-        cursor.execute("SELECT COUNT(*) as total FROM productos")
-        total_productos = cursor.fetchone()["total"]
-        
-        # Productos con stock bajo
-        cursor.execute("""
-            SELECT COUNT(*) as stock_bajo 
-            FROM productos 
-            WHERE cantidad <= cantidad_minima AND cantidad_minima > 0
-        """)
-        stock_bajo = cursor.fetchone()["stock_bajo"]
-        
-        # Valor total del inventario
-        cursor.execute("""
-            SELECT SUM(cantidad * COALESCE(precio_unitario, 0)) as valor_total 
-            FROM productos
-        """)
-        valor_total = cursor.fetchone()["valor_total"] or 0
-        
-        conn.close()
+        return nombre, await obtener_pdf_ticket(fila), None
+    except HTTPException as e:
+        return nombre, None, e.detail
+    except Exception as e:
+        return nombre, None, str(e)
+
+async def generar_zip_tickets(**filtros):
+    """Enviar el ZIP por partes: los PDFs se generan en paralelo y cada uno se
+    escribe en cuanto está listo (en el orden en que terminan)
+    
+    Solo hay unos cuantos PDFs en curso a la vez (el doble de procesos), así
+    que la memoria no depende de cuántos tickets entren en el filtro.
+    """
+    archivo = ArchivoZip()
+    limite = 2 * procesos_workers() + 2
+    siguientes = []
+    en_curso = set()
+    ultimo_id = 0
+    agotado = False
+    errores = []
+    try:
+        while True:
+            while not agotado and len(en_curso) < limite:
+                if not siguientes:
+                    siguientes = list(await run_read(leer_bloque_tickets, ultimo_id, **filtros))
+                    if not siguientes:
+                        agotado = True
+                        break
+                    ultimo_id = siguientes[-1]["id"]
+                    siguientes.reverse()
+                en_curso.add(asyncio.ensure_future(pdf_para_zip(siguientes.pop())))
+            if not en_curso:
+                break
+            
+            terminados, en_curso = await asyncio.wait(en_curso, return_when=asyncio.FIRST_COMPLETED)
+            for tarea in terminados:
+                nombre, datos, error = tarea.result()
+                if error is not None:
+                    errores.append(f"{nombre}: {error}")
+                    continue
+                yield archivo.agregar(nombre, datos)
         
-        return {
-            "total_productos": total_productos,
-            "stock_bajo": stock_bajo,
-            "valor_total": round(valor_total, 2)
-        }
+        # La respuesta ya empezó: los tickets que fallaron se reportan dentro del ZIP
+        if errores:
+            logger.warning(f"⚠️ {len(errores)} PDFs no se pudieron agregar a la exportación")
+            yield archivo.agregar("errores.txt", "\n".join(errores).encode("utf-8"))
+        yield archivo.fin()
+    finally:
+        # Cliente desconectado a medias
+        for tarea in en_curso:
+            tarea.cancel()
+
+@app.get("/api/export/tickets")
+async def exportar_tickets(request: Request, desde: str = None, hasta: str = None, estado: str = None):
+    """Exportar los PDFs de los tickets en un ZIP (desde/hasta: YYYY-MM-DD de la solicitud,
+    estado: pendiente, entregado o devuelto) - Solo administradores"""
+    current_user = await get_current_user(request)
+    require_admin(current_user)
+    validar_fechas_exportacion(desde, hasta)
+    if estado and estado not in ESTADOS_TICKET:
+        raise HTTPException(status_code=400, detail=f"Estado no válido (usar {', '.join(ESTADOS_TICKET)})")
+    logger.info(f"Administrador {current_user['username']} exportando PDFs de tickets (desde={desde}, hasta={hasta}, estado={estado})")
+    archivo = f"tickets_{datetime.now().strftime('%Y%m%d_%H%M')}.zip"
+    return StreamingResponse(
+        generar_zip_tickets(desde=desde, hasta=hasta, estado=estado),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{archivo}"'}
+    )
+
+@app.get("/api/estadisticas")
+async def get_estadisticas(request: Request):
+    """Obtener estadísticas del almacén (304 si el catálogo no cambió)"""
+    try:
+        def consultar(conn):
+            version = leer_version_catalogo(conn)
+            if if_none_match_coincide(request, etag_catalogo(version, "estadisticas")):
+                return version, None
+            
+            cursor = conn.cursor()
+            
+            # Total de productos
+            cursor.execute("SELECT COUNT(*) as total FROM productos")
+            total_productos = cursor.fetchone()["total"]
+            
+            # Productos con stock bajo
+            cursor.execute("""
+                SELECT COUNT(*) as stock_bajo 
+                FROM productos 
+                WHERE cantidad <= cantidad_minima AND cantidad_minima > 0
+            """)
+            stock_bajo = cursor.fetchone()["stock_bajo"]
+            
+            # Valor total del inventario
+            cursor.execute("""
+                SELECT SUM(cantidad * COALESCE(precio_unitario, 0)) as valor_total 
+                FROM productos
+            """)
+            valor_total = cursor.fetchone()["valor_total"] or 0
+            return version, (total_productos, stock_bajo, valor_total)
+        
+        version, estadisticas = await run_read(consultar)
+        if estadisticas is None:
+            return respuesta_no_modificada(request, version, "estadisticas")
+        total_productos, stock_bajo, valor_total = estadisticas
+        
+        return JSONResponse(
+            content={
+                "total_productos": total_productos,
+                "stock_bajo": stock_bajo,
+                "valor_total": round(valor_total, 2)
+            },
+            headers=encabezados_catalogo(version, etag_catalogo(version, "estadisticas"))
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener estadísticas: {str(e)}")
 
@@ -1098,115 +1673,72 @@ def generate_token():
     """Generar token de sesión"""
     return secrets.token_urlsafe(32)
 
-def create_session(user_id, ip_address, user_agent):
+async def create_session(user_id, ip_address, user_agent):
     """Crear nueva sesión"""
-    conn = None
-    max_retries = 5  # Aumentar de 3 a 5 reintentos
-    retry_count = 0
-    
     logger.info(f"Iniciando creación de sesión para usuario {user_id}")
     
-    while retry_count < max_retries:
-        try:
-            logger.debug(f"Intento {retry_count + 1} de crear sesión")
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            token = generate_token()
-            logger.debug(f"Token generado: {token[:20]}...")
-            
-            # Usar UTC para evitar problemas de zona horaria
-            now_utc = datetime.now(timezone.utc)
-            
-            # Si está configurado para cerrar al cerrar navegador, usar tiempo más corto
-            if SESSION_CONFIG["browser_close_logout"]:
-                expiration = now_utc + timedelta(hours=1)  # 1 hora como respaldo
-            else:
-                expiration = now_utc + timedelta(hours=SESSION_CONFIG["session_timeout_hours"])
-            
-            logger.debug(f"Fecha de expiración: {expiration.isoformat()}")
-            
-            cursor.execute("""
-                INSERT INTO sesiones (usuario_id, token, fecha_expiracion, ip_address, user_agent)
-                VALUES (?, ?, ?, ?, ?)
-            """, (user_id, token, expiration.isoformat(), ip_address, user_agent))
-            
-            logger.debug("Sesión insertada en la base de datos")
-            
-            # Actualizar último acceso
-            cursor.execute("""
-                UPDATE usuarios SET ultimo_acceso = CURRENT_TIMESTAMP WHERE id = ?
-            """, (user_id,))
-            
-            logger.debug("Último acceso actualizado")
-            
-            conn.commit()
-            logger.info(f"Nueva sesión creada para usuario {user_id} desde {ip_address}")
-            
-            # Cerrar conexión antes de retornar
-            if conn:
-                try:
-                    conn.close()
-                except:
-                    pass
-            
-            return token
-            
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e) and retry_count < max_retries - 1:
-                retry_count += 1
-                logger.warning(f"Base de datos bloqueada, reintentando ({retry_count}/{max_retries})")
-                if conn:
-                    try:
-                        conn.close()
-                    except:
-                        pass
-                import time
-                time.sleep(1 * retry_count)  # Espera lineal más larga
-                continue
-            else:
-                logger.error(f"Error creando sesión después de {retry_count + 1} intentos: {e}")
-                if conn:
-                    conn.rollback()
-                raise
-        except Exception as e:
-            logger.error(f"Error creando sesión: {e}")
-            if conn:
-                conn.rollback()
-            raise
-        finally:
-            if conn:
-                try:
-                    conn.close()
-                except:
-                    pass
+    def insertar_sesion(conn):
+        cursor = conn.cursor()
+        
+        token = generate_token()
+        logger.debug(f"Token generado: {token[:20]}...")
+        
+        # Usar UTC para evitar problemas de zona horaria
+        now_utc = datetime.now(timezone.utc)
+        
+        # Si está configurado para cerrar al cerrar navegador, usar tiempo más corto
+        if SESSION_CONFIG["browser_close_logout"]:
+            expiration = now_utc + timedelta(hours=1)  # 1 hora como respaldo
+        else:
+            expiration = now_utc + timedelta(hours=SESSION_CONFIG["session_timeout_hours"])
+        
+        logger.debug(f"Fecha de expiración: {expiration.isoformat()}")
+        
+        cursor.execute("""
+            INSERT INTO sesiones (usuario_id, token, fecha_expiracion, ip_address, user_agent)
+            VALUES (?, ?, ?, ?, ?)
+        """, (user_id, token, expiration.isoformat(), ip_address, user_agent))
+        
+        logger.debug("Sesión insertada en la base de datos")
+        
+        # Actualizar último acceso
+        cursor.execute("""
+            UPDATE usuarios SET ultimo_acceso = CURRENT_TIMESTAMP WHERE id = ?
+        """, (user_id,))
+        
+        logger.debug("Último acceso actualizado")
+        return token
     
-    # Si llegamos aquí, significa que se agotaron los reintentos
-    logger.error("No se pudo crear la sesión después de todos los reintentos")
-    raise Exception("No se pudo crear la sesión después de múltiples intentos")
+    # El hilo escritor serializa las escrituras, ya no hace falta reintentar por bloqueo
+    try:
+        token = await run_write(insertar_sesion)
+        logger.info(f"Nueva sesión creada para usuario {user_id} desde {ip_address}")
+        return token
+    except Exception as e:
+        logger.error(f"Error creando sesión: {e}")
+        raise
 
-def validate_session(token):
+async def validate_session(token):
     """Validar sesión activa"""
     if not token:
         logger.debug("No se proporcionó token")
         return None
     
-    conn = None
-    try:
-        conn = get_db_connection()
+    def consultar(conn):
         cursor = conn.cursor()
-        
-        # Usar UTC para la comparación
-        now_utc = datetime.now(timezone.utc)
-        
         cursor.execute("""
             SELECT s.*, u.username, u.nombre_completo, u.rol, u.activo
             FROM sesiones s
             JOIN usuarios u ON s.usuario_id = u.id
             WHERE s.token = ? AND s.activa = 1
         """, (token,))
+        return cursor.fetchone()
+    
+    try:
+        session = await run_read(consultar)
         
-        session = cursor.fetchone()
+        # Usar UTC para la comparación
+        now_utc = datetime.now(timezone.utc)
         
         if session:
             # Verificar si la sesión no ha expirado
@@ -1228,14 +1760,8 @@ def validate_session(token):
     except Exception as e:
         logger.error(f"Error validando sesión: {e}")
         return None
-    finally:
-        if conn:
-            try:
-                conn.close()
-            except:
-                pass
 
-def get_current_user(request):
+async def get_current_user(request):
     """Obtener usuario actual desde el token"""
     token = request.cookies.get("session_token")
     if not token:
@@ -1243,7 +1769,7 @@ def get_current_user(request):
         return None
     
     logger.debug(f"Validando token: {token[:20]}...")
-    session = validate_session(token)
+    session = await validate_session(token)
     if not session:
         logger.debug("Sesión inválida o expirada")
         return None
@@ -1261,7 +1787,6 @@ def get_current_user(request):
 @app.post("/api/auth/login")
 async def login(request: Request, credentials: dict):
     """Iniciar sesión"""
-    conn = None
     try:
         username = credentials.get("username")
         password = credentials.get("password")
@@ -1269,17 +1794,19 @@ async def login(request: Request, credentials: dict):
         if not username or not password:
             raise HTTPException(status_code=400, detail="Usuario y contraseña son requeridos")
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Verificar usuario
-        cursor.execute("""
-            SELECT id, username, password_hash, nombre_completo, rol, activo
-            FROM usuarios 
-            WHERE username = ?
-        """, (username,))
+        def consultar(conn):
+            cursor = conn.cursor()
+            
+            # Verificar usuario
+            cursor.execute("""
+                SELECT id, username, password_hash, nombre_completo, rol, activo
+                FROM usuarios 
+                WHERE username = ?
+            """, (username,))
+            
+            return cursor.fetchone()
         
-        user = cursor.fetchone()
+        user = await run_read(consultar)
         
         if not user:
             raise HTTPException(status_code=401, detail="Usuario o contraseña incorrectos")
@@ -1293,7 +1820,7 @@ async def login(request: Request, credentials: dict):
         # Crear sesión
         user_agent = request.headers.get("user-agent", "")
         ip_address = request.client.host
-        token = create_session(user["id"], ip_address, user_agent)
+        token = await create_session(user["id"], ip_address, user_agent)
         
         if not token:
             logger.error("No se pudo crear la sesión: token es None")
@@ -1333,12 +1860,6 @@ async def login(request: Request, credentials: dict):
     except Exception as e:
         logger.error(f"Error en login: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
-    finally:
-        if conn:
-            try:
-                conn.close()
-            except:
-                pass
 
 @app.post("/api/auth/logout")
 async def logout(request: Request):
@@ -1346,37 +1867,36 @@ async def logout(request: Request):
     try:
         token = request.cookies.get("session_token")
         if token:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            # Marcar la sesión como inactiva
-            cursor.execute("UPDATE sesiones SET activa = 0 WHERE token = ?", (token,))
-            
-            # Registrar el logout en el historial (verificar si las columnas existen)
-            try:
-                cursor.execute("""
-                    SELECT usuario_id, u.nombre_completo 
-                    FROM sesiones s 
-                    JOIN usuarios u ON s.usuario_id = u.id 
-                    WHERE s.token = ?
-                """, (token,))
+            def cerrar_sesion(conn):
+                cursor = conn.cursor()
                 
-                session_info = cursor.fetchone()
-                if session_info:
+                # Marcar la sesión como inactiva
+                cursor.execute("UPDATE sesiones SET activa = 0 WHERE token = ?", (token,))
+                
+                # Registrar el logout en el historial (verificar si las columnas existen)
+                try:
                     cursor.execute("""
-                        INSERT INTO historial (accion, usuario_id, usuario_nombre, detalles)
-                        VALUES (?, ?, ?, ?)
-                    """, ("logout", session_info[0], session_info[1], f"Logout desde {request.client.host}"))
-            except sqlite3.OperationalError as e:
-                # Si las columnas no existen, registrar sin ellas
-                logger.warning(f"No se pudo registrar logout en historial: {e}")
-                cursor.execute("""
-                    INSERT INTO historial (accion, detalles)
-                    VALUES (?, ?)
-                """, ("logout", f"Logout desde {request.client.host}"))
+                        SELECT usuario_id, u.nombre_completo 
+                        FROM sesiones s 
+                        JOIN usuarios u ON s.usuario_id = u.id 
+                        WHERE s.token = ?
+                    """, (token,))
+                    
+                    session_info = cursor.fetchone()
+                    if session_info:
+                        cursor.execute("""
+                            INSERT INTO historial (accion, usuario_id, usuario_nombre, detalles)
+                            VALUES (?, ?, ?, ?)
+                        """, ("logout", session_info[0], session_info[1], f"Logout desde {request.client.host}"))
+                except sqlite3.OperationalError as e:
+                    # Si las columnas no existen, registrar sin ellas
+                    logger.warning(f"No se pudo registrar logout en historial: {e}")
+                    cursor.execute("""
+                        INSERT INTO historial (accion, detalles)
+                        VALUES (?, ?)
+                    """, ("logout", f"Logout desde {request.client.host}"))
             
-            conn.commit()
-            conn.close()
+            await run_write(cerrar_sesion)
         
         from fastapi.responses import JSONResponse
         response = JSONResponse(content={"mensaje": "Sesión cerrada exitosamente"})
@@ -1402,7 +1922,7 @@ async def logout(request: Request):
 @app.get("/api/auth/me")
 async def get_current_user_info(request: Request):
     """Obtener información del usuario actual"""
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="No autenticado")
     
@@ -1412,7 +1932,7 @@ async def get_current_user_info(request: Request):
 async def check_auth(request: Request):
     """Verificar si el usuario está autenticado"""
     logger.info(f"Check auth - Cookies: {dict(request.cookies)}")
-    user = get_current_user(request)
+    user = await get_current_user(request)
     result = {"autenticado": user is not None, "usuario": user}
     logger.info(f"Check auth result: {result}")
     return result
@@ -1429,8 +1949,12 @@ def validar_orden_produccion(orden_produccion: str) -> bool:
     
     return True
 
-def generar_numero_ticket(orden_produccion: str) -> str:
-    """Generar número de ticket usando orden de producción"""
+def generar_numero_ticket(orden_produccion: str, cursor) -> str:
+    """Generar número de ticket usando orden de producción
+
+    Recibe el cursor de la transacción de escritura para que la validación
+    y el INSERT del ticket ocurran en la misma transacción.
+    """
     if not validar_orden_produccion(orden_produccion):
         raise HTTPException(
             status_code=400, 
@@ -1439,19 +1963,13 @@ def generar_numero_ticket(orden_produccion: str) -> str:
     
     # Verificar que no exista ya un ticket con esta orden
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         cursor.execute("SELECT COUNT(*) FROM tickets_compra WHERE orden_produccion = ?", (orden_produccion,))
         if cursor.fetchone()[0] > 0:
-            conn.close()
             raise HTTPException(
                 status_code=400, 
                 detail=f"Ya existe un ticket para la orden de producción {orden_produccion}"
             )
         
-        conn.close()
-        
         # Generar número de ticket usando la orden de producción
         numero_ticket = f"TICK-{orden_produccion}"
         return numero_ticket
@@ -1470,14 +1988,11 @@ async def crear_ticket_compra(ticket: dict, request: Request):
     """Crear un nuevo ticket de compra - Solo supervisores y operadores"""
     try:
         # Verificar que el usuario sea supervisor u operador
-        current_user = get_current_user(request)
+        current_user = await get_current_user(request)
         require_supervisor_or_operator(current_user)
         
         logger.info(f"Usuario {current_user['username']} creando ticket de compra")
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         # Validar datos del ticket
         if not ticket.get("orden_produccion"):
             raise HTTPException(status_code=400, detail="Orden de producción es obligatoria")
@@ -1490,65 +2005,68 @@ async def crear_ticket_compra(ticket: dict, request: Request):
         if not items or len(items) == 0:
             raise HTTPException(status_code=400, detail="El ticket debe contener al menos una herramienta")
         
-        # Verificar que todos los productos existen
-        productos_ids = [item["producto_id"] for item in items]
-        placeholders = ','.join(['?' for _ in productos_ids])
-        cursor.execute(f"SELECT id, nombre FROM productos WHERE id IN ({placeholders})", productos_ids)
-        productos_existentes = {row["id"]: row["nombre"] for row in cursor.fetchall()}
-        
-        if len(productos_existentes) != len(productos_ids):
-            raise HTTPException(status_code=400, detail="Uno o más productos no existen")
-        
-        # Generar número de ticket usando la orden de producción
-        numero_ticket = generar_numero_ticket(ticket["orden_produccion"])
-        
-        # Crear ticket principal
-        cursor.execute("""
-            INSERT INTO tickets_compra (
-                numero_ticket, orden_produccion, justificacion, solicitante_id, solicitante_nombre, solicitante_rol
-            ) VALUES (?, ?, ?, ?, ?, ?)
-        """, (
-            numero_ticket,
-            ticket["orden_produccion"],
-            ticket["justificacion"],
-            current_user["id"],
-            current_user["nombre_completo"],
-            current_user["rol"]
-        ))
-        
-        ticket_id = cursor.lastrowid
-        
-        # Crear items del ticket
-        for item in items:
-            cursor.execute("""
-                INSERT INTO ticket_items (
-                    ticket_id, producto_id, producto_nombre, cantidad_solicitada, precio_unitario
-                ) VALUES (?, ?, ?, ?, ?)
-            """, (
-                ticket_id,
-                item["producto_id"],
-                productos_existentes[item["producto_id"]],
-                item["cantidad_solicitada"],
-                item.get("precio_unitario")
-            ))
+        def registrar(conn):
+            cursor = conn.cursor()
             
-            # Registrar en historial
-            try:
+            # Verificar que todos los productos existen
+            productos_ids = [item["producto_id"] for item in items]
+            placeholders = ','.join(['?' for _ in productos_ids])
+            cursor.execute(f"SELECT id, nombre FROM productos WHERE id IN ({placeholders})", productos_ids)
+            productos_existentes = {row["id"]: row["nombre"] for row in cursor.fetchall()}
+            
+            if len(productos_existentes) != len(productos_ids):
+                raise HTTPException(status_code=400, detail="Uno o más productos no existen")
+            
+            # Generar número de ticket usando la orden de producción
+            numero_ticket = generar_numero_ticket(ticket["orden_produccion"], cursor)
+            
+            # Crear ticket principal
+            cursor.execute("""
+                INSERT INTO tickets_compra (
+                    numero_ticket, orden_produccion, justificacion, solicitante_id, solicitante_nombre, solicitante_rol
+                ) VALUES (?, ?, ?, ?, ?, ?)
+            """, (
+                numero_ticket,
+                ticket["orden_produccion"],
+                ticket["justificacion"],
+                current_user["id"],
+                current_user["nombre_completo"],
+                current_user["rol"]
+            ))
+            
+            ticket_id = cursor.lastrowid
+            
+            # Crear items del ticket
+            for item in items:
                 cursor.execute("""
-                    INSERT INTO historial (accion, producto_id, usuario_id, usuario_nombre, detalles)
-                    VALUES (?, ?, ?, ?, ?)
+                    INSERT INTO ticket_items (
+                        ticket_id, producto_id, producto_nombre, cantidad_solicitada, precio_unitario
+                    ) VALUES (?, ?, ?, ?, ?)
                 """, (
-                    "solicitud_compra",
+                    ticket_id,
                     item["producto_id"],
-                    current_user["id"],
-                    current_user["nombre_completo"],
-                    f"Ticket {numero_ticket} - Orden: {ticket['orden_produccion']} - Cantidad: {item['cantidad_solicitada']}"
+                    productos_existentes[item["producto_id"]],
+                    item["cantidad_solicitada"],
+                    item.get("precio_unitario")
                 ))
-            except sqlite3.OperationalError as e:
-                logger.warning(f"Error registrando en historial: {e}")
+                
+                # Registrar en historial
+                try:
+                    cursor.execute("""
+                        INSERT INTO historial (accion, producto_id, usuario_id, usuario_nombre, detalles)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, (
+                        "solicitud_compra",
+                        item["producto_id"],
+                        current_user["id"],
+                        current_user["nombre_completo"],
+                        f"Ticket {numero_ticket} - Orden: {ticket['orden_produccion']} - Cantidad: {item['cantidad_solicitada']}"
+                    ))
+                except sqlite3.OperationalError as e:
+                    logger.warning(f"Error registrando en historial: {e}")
+            return ticket_id, numero_ticket
         
-        conn.commit()
-        conn.close()
+        ticket_id, numero_ticket = await run_write(registrar)
         
         logger.info(f"Ticket {numero_ticket} creado exitosamente por {current_user['username']} con {len(items)} herramientas")
         return {
@@ -1568,62 +2086,63 @@ async def crear_ticket_compra(ticket: dict, request: Request):
 async def listar_tickets(request: Request, estado: str = None, limit: int = 50):
     """Listar tickets de compra - Filtrado por rol del usuario"""
     try:
-        current_user = get_current_user(request)
+        current_user = await get_current_user(request)
         require_auth(current_user)
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Construir query base
-        query = """
-            SELECT 
-                t.id, t.numero_ticket, t.orden_produccion, t.justificacion,
-                t.solicitante_id, t.solicitante_nombre, t.solicitante_rol, t.estado,
-                t.fecha_solicitud, t.fecha_entrega, t.entregado_por_nombre,
-                COUNT(ti.id) as total_items,
-                SUM(ti.cantidad_solicitada) as total_cantidad_solicitada
-            FROM tickets_compra t
-            LEFT JOIN ticket_items ti ON t.id = ti.ticket_id
-        """
-        
-        params = []
-        where_conditions = []
-        
-        # Filtrar por rol del usuario
-        if current_user["rol"] == "admin":
-            # Administradores ven todos los tickets
-            pass
-        elif current_user["rol"] in ["supervisor", "operador"]:
-            # Supervisores y operadores solo ven sus propios tickets
-            where_conditions.append("t.solicitante_id = ?")
-            params.append(current_user["id"])
-        
-        # Filtrar por estado si se especifica
-        if estado:
-            where_conditions.append("t.estado = ?")
-            params.append(estado)
-        
-        if where_conditions:
-            query += " WHERE " + " AND ".join(where_conditions)
-        
-        query += " GROUP BY t.id ORDER BY t.fecha_solicitud DESC LIMIT ?"
-        params.append(limit)
-        
-        cursor.execute(query, params)
-        tickets = [dict(row) for row in cursor.fetchall()]
-        
-        # Obtener items de cada ticket
-        for ticket in tickets:
-            cursor.execute("""
-                SELECT ti.id, ti.producto_id, ti.producto_nombre, ti.cantidad_solicitada, 
-                       ti.cantidad_entregada, ti.precio_unitario
-                FROM ticket_items ti
-                WHERE ti.ticket_id = ?
-                ORDER BY ti.producto_nombre
-            """, (ticket["id"],))
-            ticket["items"] = [dict(item) for item in cursor.fetchall()]
+        def consultar(conn):
+            cursor = conn.cursor()
+            
+            # Construir query base
+            query = """
+                SELECT 
+                    t.id, t.numero_ticket, t.orden_produccion, t.justificacion,
+                    t.solicitante_id, t.solicitante_nombre, t.solicitante_rol, t.estado,
+                    t.fecha_solicitud, t.fecha_entrega, t.entregado_por_nombre,
+                    COUNT(ti.id) as total_items,
+                    SUM(ti.cantidad_solicitada) as total_cantidad_solicitada
+                FROM tickets_compra t
+                LEFT JOIN ticket_items ti ON t.id = ti.ticket_id
+            """
+            
+            params = []
+            where_conditions = []
+            
+            # Filtrar por rol del usuario
+            if current_user["rol"] == "admin":
+                # Administradores ven todos los tickets
+                pass
+            elif current_user["rol"] in ["supervisor", "operador"]:
+                # Supervisores y operadores solo ven sus propios tickets
+                where_conditions.append("t.solicitante_id = ?")
+                params.append(current_user["id"])
+            
+            # Filtrar por estado si se especifica
+            if estado:
+                where_conditions.append("t.estado = ?")
+                params.append(estado)
+            
+            if where_conditions:
+                query += " WHERE " + " AND ".join(where_conditions)
+            
+            query += " GROUP BY t.id ORDER BY t.fecha_solicitud DESC LIMIT ?"
+            params.append(limit)
+            
+            cursor.execute(query, params)
+            tickets = [dict(row) for row in cursor.fetchall()]
+            
+            # Obtener items de cada ticket
+            for ticket in tickets:
+                cursor.execute("""
+                    SELECT ti.id, ti.producto_id, ti.producto_nombre, ti.cantidad_solicitada, 
+                           ti.cantidad_entregada, ti.precio_unitario
+                    FROM ticket_items ti
+                    WHERE ti.ticket_id = ?
+                    ORDER BY ti.producto_nombre
+                """, (ticket["id"],))
+                ticket["items"] = [dict(item) for item in cursor.fetchall()]
+            return tickets
         
-        conn.close()
+        tickets = await run_read(consultar)
         
         return {
             "tickets": tickets,
@@ -1638,137 +2157,138 @@ async def listar_tickets(request: Request, estado: str = None, limit: int = 50):
 
 @app.put("/api/tickets/{ticket_id}/entregar")
 async def entregar_ticket(ticket_id: int, entrega: dict, request: Request):
-    """Entregar herramientas de un ticket aprobado - Solo administradores"""
+    """Entregar herramientas de un ticket pendiente - Solo administradores"""
     try:
-        current_user = get_current_user(request)
+        current_user = await get_current_user(request)
         require_admin(current_user)
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Verificar que el ticket existe y está aprobado
-        cursor.execute("""
-            SELECT id, numero_ticket, estado, solicitante_nombre
-            FROM tickets_compra 
-            WHERE id = ?
-        """, (ticket_id,))
-        
-        ticket = cursor.fetchone()
-        if not ticket:
-            raise HTTPException(status_code=404, detail="Ticket no encontrado")
-        
-        if ticket["estado"] != "pendiente":
-            raise HTTPException(status_code=400, detail="Solo se pueden entregar tickets pendientes")
-        
-        # Obtener items del ticket
-        cursor.execute("""
-            SELECT ti.id, ti.producto_id, ti.producto_nombre, ti.cantidad_solicitada, ti.cantidad_entregada
-            FROM ticket_items ti
-            WHERE ti.ticket_id = ?
-        """, (ticket_id,))
-        
-        items = [dict(item) for item in cursor.fetchall()]
-        
-        # Procesar entregas
-        items_entregados = entrega.get("items", [])
-        for item_entrega in items_entregados:
-            item_id = item_entrega.get("item_id")
-            cantidad_entregada = item_entrega.get("cantidad_entregada", 0)
-            
-            # Encontrar el item correspondiente
-            item_ticket = next((item for item in items if item["id"] == item_id), None)
-            if not item_ticket:
-                continue
-            
-            # Verificar que no se entregue más de lo solicitado
-            if cantidad_entregada > item_ticket["cantidad_solicitada"]:
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"No se puede entregar más de lo solicitado para {item_ticket['producto_nombre']}"
-                )
-            
-            # Verificar stock disponible antes de entregar
-            cursor.execute("""
-                SELECT cantidad FROM productos WHERE id = ?
-            """, (item_ticket["producto_id"],))
-            
-            stock_result = cursor.fetchone()
-            if not stock_result:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Producto {item_ticket['producto_nombre']} no encontrado en inventario"
-                )
-            
-            stock_actual = stock_result["cantidad"]
-            if stock_actual < cantidad_entregada:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Stock insuficiente para {item_ticket['producto_nombre']}. Disponible: {stock_actual}, Solicitado: {cantidad_entregada}"
-                )
-            
-            # Actualizar cantidad entregada
+        def entregar(conn):
+            cursor = conn.cursor()
+            
+            # Verificar que el ticket existe y está pendiente
             cursor.execute("""
-                UPDATE ticket_items 
-                SET cantidad_entregada = ?
+                SELECT id, numero_ticket, estado, solicitante_nombre
+                FROM tickets_compra 
                 WHERE id = ?
-            """, (cantidad_entregada, item_id))
+            """, (ticket_id,))
             
-            # Actualizar inventario si se entregó algo
-            if cantidad_entregada > 0:
+            ticket = cursor.fetchone()
+            if not ticket:
+                raise HTTPException(status_code=404, detail="Ticket no encontrado")
+            
+            if ticket["estado"] != "pendiente":
+                raise HTTPException(status_code=400, detail="Solo se pueden entregar tickets pendientes")
+            
+            # Obtener items del ticket
+            cursor.execute("""
+                SELECT ti.id, ti.producto_id, ti.producto_nombre, ti.cantidad_solicitada, ti.cantidad_entregada
+                FROM ticket_items ti
+                WHERE ti.ticket_id = ?
+            """, (ticket_id,))
+            
+            items = [dict(item) for item in cursor.fetchall()]
+            
+            # Procesar entregas
+            items_entregados = entrega.get("items", [])
+            for item_entrega in items_entregados:
+                item_id = item_entrega.get("item_id")
+                cantidad_entregada = item_entrega.get("cantidad_entregada", 0)
+                
+                # Encontrar el item correspondiente
+                item_ticket = next((item for item in items if item["id"] == item_id), None)
+                if not item_ticket:
+                    continue
+                
+                # Verificar que no se entregue más de lo solicitado
+                if cantidad_entregada > item_ticket["cantidad_solicitada"]:
+                    raise HTTPException(
+                        status_code=400, 
+                        detail=f"No se puede entregar más de lo solicitado para {item_ticket['producto_nombre']}"
+                    )
+                
+                # Verificar stock disponible antes de entregar
                 cursor.execute("""
-                    UPDATE productos 
-                    SET cantidad = cantidad - ?
+                    SELECT cantidad FROM productos WHERE id = ?
+                """, (item_ticket["producto_id"],))
+                
+                stock_result = cursor.fetchone()
+                if not stock_result:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Producto {item_ticket['producto_nombre']} no encontrado en inventario"
+                    )
+                
+                stock_actual = stock_result["cantidad"]
+                if stock_actual < cantidad_entregada:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Stock insuficiente para {item_ticket['producto_nombre']}. Disponible: {stock_actual}, Solicitado: {cantidad_entregada}"
+                    )
+                
+                # Actualizar cantidad entregada
+                cursor.execute("""
+                    UPDATE ticket_items 
+                    SET cantidad_entregada = ?
                     WHERE id = ?
-                """, (cantidad_entregada, item_ticket["producto_id"]))
+                """, (cantidad_entregada, item_id))
                 
-                # Registrar en historial
-                try:
+                # Actualizar inventario si se entregó algo
+                if cantidad_entregada > 0:
                     cursor.execute("""
-                        INSERT INTO historial (accion, producto_id, usuario_id, usuario_nombre, detalles)
-                        VALUES (?, ?, ?, ?, ?)
-                    """, (
-                        "entrega_ticket",
-                        item_ticket["producto_id"],
-                        current_user["id"],
-                        current_user["nombre_completo"],
-                        f"Ticket {ticket['numero_ticket']} - Entregado: {cantidad_entregada} unidades"
-                    ))
-                except sqlite3.OperationalError as e:
-                    logger.warning(f"Error registrando en historial: {e}")
-        
-        # Verificar si todos los items fueron entregados
-        cursor.execute("""
-            SELECT 
-                SUM(cantidad_solicitada) as total_solicitado,
-                SUM(cantidad_entregada) as total_entregado
-            FROM ticket_items 
-            WHERE ticket_id = ?
-        """, (ticket_id,))
-        
-        totales = dict(cursor.fetchone())
-        nuevo_estado = "entregado" if totales["total_entregado"] >= totales["total_solicitado"] else "aprobado"
-        
-        # Obtener comentarios de entrega si se proporcionaron
-        comentarios_entrega = entrega.get("comentarios_entrega")
-        
-        # Actualizar estado del ticket
-        fecha_entrega = datetime.now().isoformat() if nuevo_estado == "entregado" else None
+                        UPDATE productos 
+                        SET cantidad = cantidad - ?
+                        WHERE id = ?
+                    """, (cantidad_entregada, item_ticket["producto_id"]))
+                    
+                    # Registrar en historial
+                    try:
+                        cursor.execute("""
+                            INSERT INTO historial (accion, producto_id, usuario_id, usuario_nombre, detalles)
+                            VALUES (?, ?, ?, ?, ?)
+                        """, (
+                            "entrega_ticket",
+                            item_ticket["producto_id"],
+                            current_user["id"],
+                            current_user["nombre_completo"],
+                            f"Ticket {ticket['numero_ticket']} - Entregado: {cantidad_entregada} unidades"
+                        ))
+                    except sqlite3.OperationalError as e:
+                        logger.warning(f"Error registrando en historial: {e}")
+            
+            # Verificar si todos los items fueron entregados
+            cursor.execute("""
+                SELECT 
+                    SUM(cantidad_solicitada) as total_solicitado,
+                    SUM(cantidad_entregada) as total_entregado
+                FROM ticket_items 
+                WHERE ticket_id = ?
+            """, (ticket_id,))
+            
+            totales = dict(cursor.fetchone())
+            # Una entrega parcial deja el ticket pendiente para entregar el resto
+            nuevo_estado = "entregado" if totales["total_entregado"] >= totales["total_solicitado"] else "pendiente"
+            
+            # Obtener comentarios de entrega si se proporcionaron
+            comentarios_entrega = entrega.get("comentarios_entrega")
+            
+            # Actualizar estado del ticket
+            fecha_entrega = datetime.now().isoformat() if nuevo_estado == "entregado" else None
+            
+            cursor.execute("""
+                UPDATE tickets_compra 
+                SET estado = ?, fecha_entrega = ?, entregado_por_id = ?, entregado_por_nombre = ?, comentarios_entrega = ?
+                WHERE id = ?
+            """, (
+                nuevo_estado,
+                fecha_entrega,
+                current_user["id"],
+                current_user["nombre_completo"],
+                comentarios_entrega,
+                ticket_id
+            ))
+            return ticket, nuevo_estado, items_entregados
         
-        cursor.execute("""
-            UPDATE tickets_compra 
-            SET estado = ?, fecha_entrega = ?, entregado_por_id = ?, entregado_por_nombre = ?, comentarios_entrega = ?
-            WHERE id = ?
-        """, (
-            nuevo_estado,
-            fecha_entrega,
-            current_user["id"],
-            current_user["nombre_completo"],
-            comentarios_entrega,
-            ticket_id
-        ))
-        
-        conn.commit()
-        conn.close()
+        ticket, nuevo_estado, items_entregados = await run_write(entregar)
         
         # Sistema de alertas automático cada 48 horas (no en cada operación)
         # Las alertas se ejecutan automáticamente en background, no aquí
@@ -1791,63 +2311,64 @@ async def entregar_ticket(ticket_id: int, entrega: dict, request: Request):
 async def obtener_ticket(ticket_id: int, request: Request):
     """Obtener un ticket específico por ID"""
     try:
-        current_user = get_current_user(request)
+        current_user = await get_current_user(request)
         require_auth(current_user)
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Obtener ticket principal
-        cursor.execute("""
-            SELECT 
-                t.id, t.numero_ticket, t.orden_produccion, t.justificacion,
-                t.solicitante_id, t.solicitante_nombre, t.solicitante_rol, t.estado,
-                t.fecha_solicitud, t.fecha_entrega, t.entregado_por_nombre, t.comentarios_entrega
-            FROM tickets_compra t
-            WHERE t.id = ?
-        """, (ticket_id,))
-        
-        ticket = cursor.fetchone()
-        if not ticket:
-            raise HTTPException(status_code=404, detail="Ticket no encontrado")
-        
-        # Convertir a diccionario
-        ticket = dict(ticket)
-        
-        # Verificar permisos
-        if current_user["rol"] not in ["admin"] and ticket["solicitante_id"] != current_user["id"]:
-            raise HTTPException(status_code=403, detail="No tienes permisos para ver este ticket")
-        
-        # Obtener items del ticket
-        cursor.execute("""
-            SELECT ti.id, ti.producto_id, ti.producto_nombre, ti.cantidad_solicitada, 
-                   ti.cantidad_entregada, ti.cantidad_devuelta, ti.precio_unitario
-            FROM ticket_items ti
-            WHERE ti.ticket_id = ?
-            ORDER BY ti.producto_nombre
-        """, (ticket_id,))
-        
-        ticket["items"] = [dict(item) for item in cursor.fetchall()]
-        
-        # Obtener fecha de devolución y usuario que devolvió desde el historial
-        cursor.execute("""
-            SELECT h.fecha, h.usuario_nombre
-            FROM historial h
-            WHERE h.accion IN ('devolucion_buen_estado', 'devolucion_mal_estado', 'devolucion')
-            AND h.detalles LIKE ?
-            ORDER BY h.fecha DESC
-            LIMIT 1
-        """, (f"%{ticket['numero_ticket']}%",))
-        
-        devolucion_result = cursor.fetchone()
-        if devolucion_result:
-            ticket["fecha_devolucion"] = devolucion_result[0]
-            ticket["devuelto_por_nombre"] = devolucion_result[1]
-        else:
-            ticket["fecha_devolucion"] = None
-            ticket["devuelto_por_nombre"] = None
+        def consultar(conn):
+            cursor = conn.cursor()
+            
+            # Obtener ticket principal
+            cursor.execute("""
+                SELECT 
+                    t.id, t.numero_ticket, t.orden_produccion, t.justificacion,
+                    t.solicitante_id, t.solicitante_nombre, t.solicitante_rol, t.estado,
+                    t.fecha_solicitud, t.fecha_entrega, t.entregado_por_nombre, t.comentarios_entrega
+                FROM tickets_compra t
+                WHERE t.id = ?
+            """, (ticket_id,))
+            
+            ticket = cursor.fetchone()
+            if not ticket:
+                raise HTTPException(status_code=404, detail="Ticket no encontrado")
+            
+            # Convertir a diccionario
+            ticket = dict(ticket)
+            
+            # Verificar permisos
+            if current_user["rol"] not in ["admin"] and ticket["solicitante_id"] != current_user["id"]:
+                raise HTTPException(status_code=403, detail="No tienes permisos para ver este ticket")
+            
+            # Obtener items del ticket
+            cursor.execute("""
+                SELECT ti.id, ti.producto_id, ti.producto_nombre, ti.cantidad_solicitada, 
+                       ti.cantidad_entregada, ti.cantidad_devuelta, ti.precio_unitario
+                FROM ticket_items ti
+                WHERE ti.ticket_id = ?
+                ORDER BY ti.producto_nombre
+            """, (ticket_id,))
+            
+            ticket["items"] = [dict(item) for item in cursor.fetchall()]
+            
+            # Obtener fecha de devolución y usuario que devolvió desde el historial
+            cursor.execute("""
+                SELECT h.fecha, h.usuario_nombre
+                FROM historial h
+                WHERE h.accion IN ('devolucion_buen_estado', 'devolucion_mal_estado', 'devolucion')
+                AND h.detalles LIKE ?
+                ORDER BY h.fecha DESC
+                LIMIT 1
+            """, (f"%{ticket['numero_ticket']}%",))
+            
+            devolucion_result = cursor.fetchone()
+            if devolucion_result:
+                ticket["fecha_devolucion"] = devolucion_result[0]
+                ticket["devuelto_por_nombre"] = devolucion_result[1]
+            else:
+                ticket["fecha_devolucion"] = None
+                ticket["devuelto_por_nombre"] = None
+            return ticket
         
-        conn.close()
+        ticket = await run_read(consultar)
         
         return ticket
         
@@ -1857,232 +2378,152 @@ async def obtener_ticket(ticket_id: int, request: Request):
         logger.error(f"Error al obtener ticket {ticket_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Error al obtener ticket: {str(e)}")
 
-def generar_pdf_ticket(ticket_data: dict) -> bytes:
-    """Generar PDF del ticket con información completa"""
+def leer_version_ticket(conn, ticket_id: int):
+    """Versión del ticket para la caché del PDF (una lectura por llave primaria)"""
+    return conn.execute("""
+        SELECT id, numero_ticket, solicitante_id, version,
+               COALESCE(fecha_version, fecha_solicitud) AS fecha_version
+        FROM tickets_compra
+        WHERE id = ?
+    """, (ticket_id,)).fetchone()
+
+def leer_ticket_pdf(conn, ticket_id: int) -> Optional[dict]:
+    """Ticket con sus herramientas y su devolución, como lo espera generar_pdf_ticket"""
+    cursor = conn.cursor()
+    
+    # Obtener ticket principal
+    cursor.execute("""
+        SELECT
+            t.id, t.numero_ticket, t.orden_produccion, t.justificacion,
+            t.solicitante_id, t.solicitante_nombre, t.solicitante_rol, t.estado,
+            t.fecha_solicitud, t.fecha_entrega, t.entregado_por_nombre, t.comentarios_entrega
+        FROM tickets_compra t
+        WHERE t.id = ?
+    """, (ticket_id,))
+    
+    ticket = cursor.fetchone()
+    if not ticket:
+        return None
+    
+    # Convertir a diccionario
+    ticket = dict(ticket)
+    
+    # Obtener items del ticket
+    cursor.execute("""
+        SELECT ti.id, ti.producto_id, ti.producto_nombre, ti.cantidad_solicitada,
+               ti.cantidad_entregada, ti.cantidad_devuelta, ti.precio_unitario
+        FROM ticket_items ti
+        WHERE ti.ticket_id = ?
+        ORDER BY ti.producto_nombre
+    """, (ticket_id,))
+    
+    ticket["items"] = [dict(item) for item in cursor.fetchall()]
+    
+    # Obtener fecha de devolución y usuario que devolvió desde el historial
+    cursor.execute("""
+        SELECT h.fecha, h.usuario_nombre
+        FROM historial h
+        WHERE h.accion IN ('devolucion_buen_estado', 'devolucion_mal_estado', 'devolucion')
+        AND h.detalles LIKE ?
+        ORDER BY h.fecha DESC
+        LIMIT 1
+    """, (f"%{ticket['numero_ticket']}%",))
+    
+    devolucion_result = cursor.fetchone()
+    if devolucion_result:
+        ticket["fecha_devolucion"] = devolucion_result[0]
+        ticket["devuelto_por_nombre"] = devolucion_result[1]
+    else:
+        ticket["fecha_devolucion"] = None
+        ticket["devuelto_por_nombre"] = None
+    return ticket
+
+def fecha_http(fecha) -> Optional[str]:
+    """Fecha de SQLite (CURRENT_TIMESTAMP, en UTC) en formato HTTP, o None"""
     try:
-        # Crear archivo temporal
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-            doc = SimpleDocTemplate(tmp_file.name, pagesize=A4)
-            story = []
-            
-            # Estilos
-            styles = getSampleStyleSheet()
-            title_style = ParagraphStyle(
-                'CustomTitle',
-                parent=styles['Heading1'],
-                fontSize=18,
-                spaceAfter=30,
-                alignment=TA_CENTER,
-                textColor=colors.darkblue
-            )
-            
-            subtitle_style = ParagraphStyle(
-                'CustomSubtitle',
-                parent=styles['Heading2'],
-                fontSize=14,
-                spaceAfter=20,
-                alignment=TA_CENTER,
-                textColor=colors.darkblue
-            )
-            
-            normal_style = styles['Normal']
-            bold_style = ParagraphStyle(
-                'Bold',
-                parent=styles['Normal'],
-                fontSize=12,
-                spaceAfter=6,
-                fontName='Helvetica-Bold'
-            )
-            
-            # Título
-            story.append(Paragraph("SISTEMA DE ALMACÉN", title_style))
-            story.append(Paragraph("COMPROBANTE DE SOLICITUD", subtitle_style))
-            story.append(Spacer(1, 20))
-            
-            # Información de generación
-            story.append(Paragraph(f"<b>Documento generado:</b> {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}", normal_style))
-            story.append(Spacer(1, 15))
-            
-            # Información del ticket
-            story.append(Paragraph(f"<b>Número de Ticket:</b> {ticket_data['numero_ticket']}", normal_style))
-            story.append(Paragraph(f"<b>Orden de Producción:</b> {ticket_data['orden_produccion']}", normal_style))
-            story.append(Paragraph(f"<b>Estado:</b> {ticket_data['estado'].upper()}", normal_style))
-            story.append(Paragraph(f"<b>Justificación:</b> {ticket_data['justificacion']}", normal_style))
-            story.append(Spacer(1, 15))
-            
-            # Información del solicitante
-            story.append(Paragraph("<b>INFORMACIÓN DEL SOLICITANTE</b>", bold_style))
-            story.append(Paragraph(f"<b>Nombre:</b> {ticket_data['solicitante_nombre']}", normal_style))
-            story.append(Paragraph(f"<b>Rol:</b> {ticket_data['solicitante_rol']}", normal_style))
-            story.append(Paragraph(f"<b>Fecha de Solicitud:</b> {ticket_data['fecha_solicitud']}", normal_style))
-            story.append(Spacer(1, 15))
-            
-            # Información de aprobación (si existe)
-            if ticket_data.get('aprobador_nombre'):
-                
-                story.append(Spacer(1, 15))
-            
-            # Información de entrega (si existe)
-            if ticket_data.get('entregado_por_nombre'):
-                story.append(Paragraph("<b>INFORMACIÓN DE ENTREGA</b>", bold_style))
-                story.append(Paragraph(f"<b>Entregado por:</b> {ticket_data['entregado_por_nombre']}", normal_style))
-                story.append(Paragraph(f"<b>Fecha de Entrega:</b> {ticket_data['fecha_entrega']}", normal_style))
-                
-                # Agregar comentarios de entrega si existen
-                if ticket_data.get('comentarios_entrega'):
-                    story.append(Paragraph(f"<b>Comentarios de Entrega:</b> {ticket_data['comentarios_entrega']}", normal_style))
-                
-                story.append(Spacer(1, 15))
-            
-            # Información de devolución (si existe)
-            if ticket_data.get('devuelto_por_nombre'):
-                story.append(Paragraph("<b>INFORMACIÓN DE DEVOLUCIÓN</b>", bold_style))
-                story.append(Paragraph(f"<b>Devuelto por:</b> {ticket_data['devuelto_por_nombre']}", normal_style))
-                story.append(Paragraph(f"<b>Fecha de Devolución:</b> {ticket_data['fecha_devolucion']}", normal_style))
-                story.append(Spacer(1, 15))
-            
-            # Tabla de herramientas
-            story.append(Paragraph("<b>HERRAMIENTAS SOLICITADAS</b>", bold_style))
-            
-            if ticket_data.get('items'):
-                # Preparar datos para la tabla
-                table_data = [
-                    ['Herramienta', 'Solicitado', 'Entregado', 'Devuelto', 'Precio Unit.']
-                ]
-                
-                for item in ticket_data['items']:
-                    cantidad_devuelta = item.get('cantidad_devuelta', 0) or 0
-                    table_data.append([
-                        item['producto_nombre'],
-                        str(item['cantidad_solicitada']),
-                        str(item.get('cantidad_entregada', 0) or 0),
-                        str(cantidad_devuelta),
-                        f"${item.get('precio_unitario', 0) or 0:.2f}"
-                    ])
-                
-                # Crear tabla
-                table = Table(table_data, colWidths=[2.5*inch, 1*inch, 1*inch, 1*inch, 1.2*inch])
-                table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 12),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                    ('FONTSIZE', (0, 1), (-1, -1), 10),
-                    ('ALIGN', (1, 1), (-1, -1), 'CENTER'),  # Centrar números
-                    ('ALIGN', (0, 1), (0, -1), 'LEFT'),      # Alinear texto a la izquierda
-                ]))
-                
-                story.append(table)
-                story.append(Spacer(1, 20))
-            
-            # Pie de página
-            story.append(Paragraph("<b>NOTAS IMPORTANTES:</b>", bold_style))
-            story.append(Paragraph("• Este documento es un comprobante oficial de la solicitud de herramientas.", normal_style))
-            story.append(Paragraph("• La información contenida en este PDF no puede ser alterada.", normal_style))
-            story.append(Paragraph("• Para consultas o aclaraciones, contacte al administrador del sistema.", normal_style))
-            story.append(Paragraph(f"• Documento generado el: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}", normal_style))
-            
-            # Generar PDF
-            doc.build(story)
-            
-            # Leer el archivo generado
-            with open(tmp_file.name, 'rb') as pdf_file:
-                pdf_content = pdf_file.read()
-            
-            # Cerrar el documento para liberar el archivo
-            doc = None
-            
-            # Eliminar archivo temporal (con manejo de errores)
-            try:
-                os.unlink(tmp_file.name)
-            except OSError as e:
-                logger.warning(f"No se pudo eliminar archivo temporal {tmp_file.name}: {e}")
-            
-            return pdf_content
-            
-    except Exception as e:
-        logger.error(f"Error generando PDF: {e}")
-        raise HTTPException(status_code=500, detail=f"Error generando PDF: {str(e)}")
+        valor = datetime.fromisoformat(str(fecha))
+    except (TypeError, ValueError):
+        return None
+    if valor.tzinfo is None:
+        valor = valor.replace(tzinfo=timezone.utc)
+    return format_datetime(valor.astimezone(timezone.utc), usegmt=True)
+
+def encabezados_pdf_ticket(estado) -> dict:
+    """ETag y Last-Modified de una versión del ticket; el navegador revalida siempre"""
+    encabezados = {
+        "ETag": f'"ticket-{estado["id"]}-v{estado["version"]}-f{PDF_TICKET_FORMATO}"',
+        "Cache-Control": "private, no-cache",
+    }
+    modificado = fecha_http(estado["fecha_version"])
+    if modificado:
+        encabezados["Last-Modified"] = modificado
+    return encabezados
+
+def pdf_no_modificado(request: Request, encabezados: dict) -> bool:
+    """If-None-Match manda; If-Modified-Since solo si no vino If-None-Match"""
+    if request.headers.get("if-none-match"):
+        return if_none_match_coincide(request, encabezados["ETag"])
+    desde = request.headers.get("if-modified-since")
+    if not desde or "Last-Modified" not in encabezados:
+        return False
+    try:
+        return parsedate_to_datetime(encabezados["Last-Modified"]) <= parsedate_to_datetime(desde)
+    except (TypeError, ValueError):
+        return False
+
+async def obtener_pdf_ticket(estado) -> bytes:
+    """PDF de una versión del ticket: de la caché en disco o generado y guardado"""
+    datos = await run_blocking(cache_pdf_tickets.leer, estado["id"], estado["version"])
+    if datos is not None:
+        return datos
+    
+    ticket = await run_read(leer_ticket_pdf, estado["id"])
+    if ticket is None:
+        raise HTTPException(status_code=404, detail="Ticket no encontrado")
+    
+    # Generar PDF en el pool de procesos (reportlab no compite por el GIL con las peticiones)
+    datos = await run_process(generar_pdf_ticket, ticket)
+    try:
+        # Si el ticket cambió mientras tanto, el PDF es más nuevo que la versión: no sirve viejo
+        await run_blocking(cache_pdf_tickets.guardar, estado["id"], estado["version"], datos)
+    except OSError as e:
+        logger.warning(f"⚠️ No se pudo guardar el PDF del ticket {estado['id']} en caché: {e}")
+    return datos
 
 @app.get("/api/tickets/{ticket_id}/pdf")
 async def descargar_pdf_ticket(ticket_id: int, request: Request):
-    """Descargar PDF del ticket"""
+    """Descargar PDF del ticket
+    
+    El PDF se genera una vez por versión del ticket (sube al entregar y al
+    devolver) y se guarda en disco; con ETag/Last-Modified volver a abrir
+    el mismo comprobante responde 304 sin leer el ticket ni generar nada.
+    """
     try:
-        current_user = get_current_user(request)
+        current_user = await get_current_user(request)
         require_auth(current_user)
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Obtener ticket principal
-        cursor.execute("""
-            SELECT 
-                t.id, t.numero_ticket, t.orden_produccion, t.justificacion,
-                t.solicitante_id, t.solicitante_nombre, t.solicitante_rol, t.estado,
-                t.fecha_solicitud, t.fecha_entrega, t.entregado_por_nombre, t.comentarios_entrega
-            FROM tickets_compra t
-            WHERE t.id = ?
-        """, (ticket_id,))
-        
-        ticket = cursor.fetchone()
-        if not ticket:
+        estado = await run_read(leer_version_ticket, ticket_id)
+        if not estado:
             raise HTTPException(status_code=404, detail="Ticket no encontrado")
         
-        # Convertir a diccionario
-        ticket = dict(ticket)
-        
         # Verificar permisos
-        if current_user["rol"] not in ["admin"] and ticket["solicitante_id"] != current_user["id"]:
+        if current_user["rol"] not in ["admin"] and estado["solicitante_id"] != current_user["id"]:
             raise HTTPException(status_code=403, detail="No tienes permisos para descargar este ticket")
         
-        # Obtener items del ticket
-        cursor.execute("""
-            SELECT ti.id, ti.producto_id, ti.producto_nombre, ti.cantidad_solicitada, 
-                   ti.cantidad_entregada, ti.cantidad_devuelta, ti.precio_unitario
-            FROM ticket_items ti
-            WHERE ti.ticket_id = ?
-            ORDER BY ti.producto_nombre
-        """, (ticket_id,))
+        encabezados = encabezados_pdf_ticket(estado)
+        if pdf_no_modificado(request, encabezados):
+            return Response(status_code=304, headers=encabezados)
         
-        ticket["items"] = [dict(item) for item in cursor.fetchall()]
-        
-        # Obtener fecha de devolución y usuario que devolvió desde el historial
-        cursor.execute("""
-            SELECT h.fecha, h.usuario_nombre
-            FROM historial h
-            WHERE h.accion IN ('devolucion_buen_estado', 'devolucion_mal_estado', 'devolucion')
-            AND h.detalles LIKE ?
-            ORDER BY h.fecha DESC
-            LIMIT 1
-        """, (f"%{ticket['numero_ticket']}%",))
-        
-        devolucion_result = cursor.fetchone()
-        if devolucion_result:
-            ticket["fecha_devolucion"] = devolucion_result[0]
-            ticket["devuelto_por_nombre"] = devolucion_result[1]
-        else:
-            ticket["fecha_devolucion"] = None
-            ticket["devuelto_por_nombre"] = None
-        
-        conn.close()
-        
-        # Generar PDF
-        pdf_content = generar_pdf_ticket(ticket)
+        pdf_content = await obtener_pdf_ticket(estado)
         
         # Devolver PDF como respuesta
+        encabezados["Content-Disposition"] = f"attachment; filename=ticket_{estado['numero_ticket']}.pdf"
         return Response(
             content=pdf_content,
             media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename=ticket_{ticket['numero_ticket']}.pdf"
-            }
+            headers=encabezados
         )
-        
+    
     except HTTPException:
         raise
     except Exception as e:
@@ -2096,7 +2537,7 @@ async def devolver_ticket(ticket_id: int, devolucion: dict, request: Request):
         logger.info(f"🔄 Iniciando devolución para ticket {ticket_id}")
         logger.info(f"📦 Datos de devolución: {devolucion}")
         
-        current_user = get_current_user(request)
+        current_user = await get_current_user(request)
         require_auth(current_user)
         
         logger.info(f"👤 Usuario autenticado: {current_user['username']} ({current_user['rol']})")
@@ -2105,171 +2546,164 @@ async def devolver_ticket(ticket_id: int, devolucion: dict, request: Request):
         if current_user["rol"] not in ["supervisor", "operador"]:
             raise HTTPException(status_code=403, detail="Solo supervisores y operadores pueden devolver herramientas")
         
-        logger.info("🔗 Conectando a base de datos...")
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Obtener ticket
-        logger.info(f"📋 Obteniendo ticket {ticket_id}...")
-        cursor.execute("""
-            SELECT id, numero_ticket, estado, solicitante_id, solicitante_nombre
-            FROM tickets_compra 
-            WHERE id = ?
-        """, (ticket_id,))
-        
-        ticket = cursor.fetchone()
-        if not ticket:
-            raise HTTPException(status_code=404, detail="Ticket no encontrado")
-        
-        ticket = dict(ticket)
-        logger.info(f"✅ Ticket encontrado: {ticket['numero_ticket']} (estado: {ticket['estado']})")
-        
-        # Verificar que el ticket esté entregado
-        if ticket["estado"] != "entregado":
-            raise HTTPException(status_code=400, detail="Solo se pueden devolver tickets entregados")
-        
-        # Verificar que el usuario sea el solicitante o supervisor
-        if current_user["rol"] != "supervisor" and ticket["solicitante_id"] != current_user["id"]:
-            raise HTTPException(status_code=403, detail="Solo puedes devolver tus propios tickets")
-        
-        # Obtener producto escaneado
-        codigo_escaneado = devolucion.get("codigo")
-        if not codigo_escaneado:
-            raise HTTPException(status_code=400, detail="Código de producto requerido")
-        
-        logger.info(f"🔍 Procesando código escaneado: {codigo_escaneado}")
-        
-        # Buscar el producto
-        producto_id = None
-        if "ID:" in codigo_escaneado:
-            try:
-                id_part = codigo_escaneado.split("|")[0]
-                producto_id = int(id_part.replace("ID:", ""))
-                logger.info(f"🎯 Producto ID extraído: {producto_id}")
-            except (ValueError, IndexError):
-                raise HTTPException(status_code=400, detail="Código QR inválido")
-        
-        if not producto_id:
-            raise HTTPException(status_code=400, detail="No se pudo identificar el producto")
-        
-        # Verificar que el producto esté en el ticket
-        logger.info(f"🔍 Verificando producto {producto_id} en ticket {ticket_id}...")
-        cursor.execute("""
-            SELECT ti.id, ti.producto_id, ti.producto_nombre, ti.cantidad_solicitada, 
-                   ti.cantidad_entregada, ti.cantidad_devuelta, p.cantidad as stock_actual
-            FROM ticket_items ti
-            JOIN productos p ON ti.producto_id = p.id
-            WHERE ti.ticket_id = ? AND ti.producto_id = ?
-        """, (ticket_id, producto_id))
-        
-        item = cursor.fetchone()
-        if not item:
-            raise HTTPException(status_code=400, detail="Este producto no está en el ticket")
-        
-        item = dict(item)
-        logger.info(f"✅ Producto encontrado en ticket: {item['producto_nombre']}")
-        logger.info(f"📊 Cantidades - Entregada: {item['cantidad_entregada']}, Devuelta: {item['cantidad_devuelta']}")
+        # Código de barras o QR del producto, con el mismo índice que /api/productos/buscar
+        codigo_escaneado = limpiar_codigo(devolucion.get("codigo"))
+        producto_escaneado = await resolver_escaneo(codigo_escaneado) if codigo_escaneado else None
+        producto_id = producto_escaneado["id"] if producto_escaneado else None
         
-        # Verificar que haya productos entregados para devolver
-        if item["cantidad_entregada"] <= 0:
-            raise HTTPException(status_code=400, detail="No hay productos entregados para devolver")
-        
-        # Calcular cantidad a devolver (por defecto 1, pero se puede especificar)
-        cantidad_devolver = devolucion.get("cantidad", 1)
-        if cantidad_devolver <= 0:
-            raise HTTPException(status_code=400, detail="La cantidad a devolver debe ser mayor a 0")
-        
-        if cantidad_devolver > item["cantidad_entregada"]:
-            raise HTTPException(status_code=400, detail=f"Solo se pueden devolver hasta {item['cantidad_entregada']} unidades")
-        
-        logger.info(f"📦 Cantidad a devolver: {cantidad_devolver}")
-        
-        # Obtener estado de la devolución (por defecto "buen_estado")
-        estado_devolucion = devolucion.get("estado", "buen_estado")
-        if estado_devolucion not in ["buen_estado", "mal_estado"]:
-            raise HTTPException(status_code=400, detail="Estado de devolución inválido")
-        
-        logger.info(f"🏷️ Estado de devolución: {estado_devolucion}")
-        
-        # Procesar devolución - mantener contadores independientes
-        cantidad_devuelta_actual = item["cantidad_devuelta"] if item["cantidad_devuelta"] is not None else 0
-        nueva_cantidad_devuelta = cantidad_devuelta_actual + cantidad_devolver
-        
-        logger.info(f"🔄 Actualizando cantidad_devuelta: {cantidad_devuelta_actual} → {nueva_cantidad_devuelta}")
-        
-        # Solo actualizar cantidad_devuelta, mantener cantidad_entregada fija
-        cursor.execute("""
-            UPDATE ticket_items 
-            SET cantidad_devuelta = ?
-            WHERE id = ?
-        """, (nueva_cantidad_devuelta, item["id"]))
-        
-        # Actualizar stock del producto solo si está en buen estado
-        nuevo_stock = item["stock_actual"]
-        if estado_devolucion == "buen_estado":
-            nuevo_stock += cantidad_devolver
-            logger.info(f"📈 Actualizando stock: {item['stock_actual']} → {nuevo_stock}")
+        logger.info("🔗 Conectando a base de datos...")
+        def devolver(conn):
+            cursor = conn.cursor()
+            
+            # Obtener ticket
+            logger.info(f"📋 Obteniendo ticket {ticket_id}...")
             cursor.execute("""
-                UPDATE productos 
-                SET cantidad = ?, fecha_actualizacion = CURRENT_TIMESTAMP
+                SELECT id, numero_ticket, estado, solicitante_id, solicitante_nombre
+                FROM tickets_compra 
                 WHERE id = ?
-            """, (nuevo_stock, producto_id))
-        
-        # Si está en mal estado, no se actualiza el stock (se considera desecho)
-        
-        # Registrar en historial
-        try:
-            accion_historial = "devolucion_buen_estado" if estado_devolucion == "buen_estado" else "devolucion_mal_estado"
-            detalles_historial = f"Devolución de ticket {ticket['numero_ticket']} - {cantidad_devolver} unidades ({estado_devolucion})"
+            """, (ticket_id,))
+            
+            ticket = cursor.fetchone()
+            if not ticket:
+                raise HTTPException(status_code=404, detail="Ticket no encontrado")
             
-            logger.info(f"📝 Registrando en historial: {accion_historial}")
+            ticket = dict(ticket)
+            logger.info(f"✅ Ticket encontrado: {ticket['numero_ticket']} (estado: {ticket['estado']})")
             
+            # Verificar que el ticket esté entregado
+            if ticket["estado"] != "entregado":
+                raise HTTPException(status_code=400, detail="Solo se pueden devolver tickets entregados")
+            
+            # Verificar que el usuario sea el solicitante o supervisor
+            if current_user["rol"] != "supervisor" and ticket["solicitante_id"] != current_user["id"]:
+                raise HTTPException(status_code=403, detail="Solo puedes devolver tus propios tickets")
+            
+            # Producto escaneado (resuelto antes de entrar al escritor)
+            if not codigo_escaneado:
+                raise HTTPException(status_code=400, detail="Código de producto requerido")
+            if not producto_id:
+                raise HTTPException(status_code=400, detail="No se pudo identificar el producto")
+            logger.info(f"🎯 Producto {producto_id} del código escaneado: {codigo_escaneado}")
+            
+            # Verificar que el producto esté en el ticket
+            logger.info(f"🔍 Verificando producto {producto_id} en ticket {ticket_id}...")
             cursor.execute("""
-                INSERT INTO historial (accion, producto_id, cantidad_anterior, cantidad_nueva, usuario_id, usuario_nombre, detalles)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                accion_historial, 
-                producto_id, 
-                item["stock_actual"], 
-                nuevo_stock, 
-                current_user["id"], 
-                current_user["nombre_completo"],
-                detalles_historial
-            ))
-        except sqlite3.OperationalError as e:
-            logger.warning(f"Error registrando devolución en historial: {e}")
-        
-        # Verificar si todos los items fueron devueltos
-        logger.info("🔍 Verificando estado del ticket...")
-        cursor.execute("""
-            SELECT 
-                SUM(cantidad_solicitada) as total_solicitado,
-                SUM(cantidad_entregada) as total_entregado,
-                SUM(cantidad_devuelta) as total_devuelto
-            FROM ticket_items 
-            WHERE ticket_id = ?
-        """, (ticket_id,))
-        
-        totales = dict(cursor.fetchone())
-        total_entregado = totales["total_entregado"] or 0
-        total_devuelto = totales["total_devuelto"] or 0
-        
-        logger.info(f"📊 Totales - Entregado: {total_entregado}, Devuelto: {total_devuelto}")
-        
-        # Si todo lo entregado fue devuelto, cambiar estado a "devuelto"
-        nuevo_estado = "devuelto" if total_devuelto >= total_entregado and total_entregado > 0 else "entregado"
-        
-        if nuevo_estado == "devuelto":
-            logger.info(f"🔄 Cambiando estado del ticket a: {nuevo_estado}")
+                SELECT ti.id, ti.producto_id, ti.producto_nombre, ti.cantidad_solicitada, 
+                       ti.cantidad_entregada, ti.cantidad_devuelta, p.cantidad as stock_actual
+                FROM ticket_items ti
+                JOIN productos p ON ti.producto_id = p.id
+                WHERE ti.ticket_id = ? AND ti.producto_id = ?
+            """, (ticket_id, producto_id))
+            
+            item = cursor.fetchone()
+            if not item:
+                raise HTTPException(status_code=400, detail="Este producto no está en el ticket")
+            
+            item = dict(item)
+            logger.info(f"✅ Producto encontrado en ticket: {item['producto_nombre']}")
+            logger.info(f"📊 Cantidades - Entregada: {item['cantidad_entregada']}, Devuelta: {item['cantidad_devuelta']}")
+            
+            # Verificar que haya productos entregados para devolver
+            if item["cantidad_entregada"] <= 0:
+                raise HTTPException(status_code=400, detail="No hay productos entregados para devolver")
+            
+            # Calcular cantidad a devolver (por defecto 1, pero se puede especificar)
+            cantidad_devolver = devolucion.get("cantidad", 1)
+            if cantidad_devolver <= 0:
+                raise HTTPException(status_code=400, detail="La cantidad a devolver debe ser mayor a 0")
+            
+            if cantidad_devolver > item["cantidad_entregada"]:
+                raise HTTPException(status_code=400, detail=f"Solo se pueden devolver hasta {item['cantidad_entregada']} unidades")
+            
+            logger.info(f"📦 Cantidad a devolver: {cantidad_devolver}")
+            
+            # Obtener estado de la devolución (por defecto "buen_estado")
+            estado_devolucion = devolucion.get("estado", "buen_estado")
+            if estado_devolucion not in ["buen_estado", "mal_estado"]:
+                raise HTTPException(status_code=400, detail="Estado de devolución inválido")
+            
+            logger.info(f"🏷️ Estado de devolución: {estado_devolucion}")
+            
+            # Procesar devolución - mantener contadores independientes
+            cantidad_devuelta_actual = item["cantidad_devuelta"] if item["cantidad_devuelta"] is not None else 0
+            nueva_cantidad_devuelta = cantidad_devuelta_actual + cantidad_devolver
+            
+            logger.info(f"🔄 Actualizando cantidad_devuelta: {cantidad_devuelta_actual} → {nueva_cantidad_devuelta}")
+            
+            # Solo actualizar cantidad_devuelta, mantener cantidad_entregada fija
             cursor.execute("""
-                UPDATE tickets_compra 
-                SET estado = ?
+                UPDATE ticket_items 
+                SET cantidad_devuelta = ?
                 WHERE id = ?
-            """, (nuevo_estado, ticket_id))
+            """, (nueva_cantidad_devuelta, item["id"]))
+            
+            # Actualizar stock del producto solo si está en buen estado
+            nuevo_stock = item["stock_actual"]
+            if estado_devolucion == "buen_estado":
+                nuevo_stock += cantidad_devolver
+                logger.info(f"📈 Actualizando stock: {item['stock_actual']} → {nuevo_stock}")
+                cursor.execute("""
+                    UPDATE productos 
+                    SET cantidad = ?, fecha_actualizacion = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                """, (nuevo_stock, producto_id))
+            
+            # Si está en mal estado, no se actualiza el stock (se considera desecho)
+            
+            # Registrar en historial
+            try:
+                accion_historial = "devolucion_buen_estado" if estado_devolucion == "buen_estado" else "devolucion_mal_estado"
+                detalles_historial = f"Devolución de ticket {ticket['numero_ticket']} - {cantidad_devolver} unidades ({estado_devolucion})"
+                
+                logger.info(f"📝 Registrando en historial: {accion_historial}")
+                
+                cursor.execute("""
+                    INSERT INTO historial (accion, producto_id, cantidad_anterior, cantidad_nueva, usuario_id, usuario_nombre, detalles)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    accion_historial, 
+                    producto_id, 
+                    item["stock_actual"], 
+                    nuevo_stock, 
+                    current_user["id"], 
+                    current_user["nombre_completo"],
+                    detalles_historial
+                ))
+            except sqlite3.OperationalError as e:
+                logger.warning(f"Error registrando devolución en historial: {e}")
+            
+            # Verificar si todos los items fueron devueltos
+            logger.info("🔍 Verificando estado del ticket...")
+            cursor.execute("""
+                SELECT 
+                    SUM(cantidad_solicitada) as total_solicitado,
+                    SUM(cantidad_entregada) as total_entregado,
+                    SUM(cantidad_devuelta) as total_devuelto
+                FROM ticket_items 
+                WHERE ticket_id = ?
+            """, (ticket_id,))
+            
+            totales = dict(cursor.fetchone())
+            total_entregado = totales["total_entregado"] or 0
+            total_devuelto = totales["total_devuelto"] or 0
+            
+            logger.info(f"📊 Totales - Entregado: {total_entregado}, Devuelto: {total_devuelto}")
+            
+            # Si todo lo entregado fue devuelto, cambiar estado a "devuelto"
+            nuevo_estado = "devuelto" if total_devuelto >= total_entregado and total_entregado > 0 else "entregado"
+            
+            if nuevo_estado == "devuelto":
+                logger.info(f"🔄 Cambiando estado del ticket a: {nuevo_estado}")
+                cursor.execute("""
+                    UPDATE tickets_compra 
+                    SET estado = ?
+                    WHERE id = ?
+                """, (nuevo_estado, ticket_id))
+            
+            logger.info("💾 Guardando cambios en base de datos...")
+            return ticket, item, cantidad_devolver, estado_devolucion, nueva_cantidad_devuelta, nuevo_estado
         
-        logger.info("💾 Guardando cambios en base de datos...")
-        conn.commit()
-        conn.close()
+        ticket, item, cantidad_devolver, estado_devolucion, nueva_cantidad_devuelta, nuevo_estado = await run_write(devolver)
         
         logger.info(f"✅ Devolución procesada exitosamente: {cantidad_devolver} unidades de {item['producto_nombre']} en ticket {ticket['numero_ticket']} - Estado: {estado_devolucion}")
         
@@ -0,0 +1,606 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Migraciones de esquema versionadas
+Sistema de Inventario - Empresa de Maquinados
+
+La versión del esquema se guarda en PRAGMA user_version. Cada migración
+numerada se aplica una sola vez, en su propia transacción junto con el
+cambio de versión. Con el esquema al día, arrancar el servidor solo lee
+el pragma.
+
+Las bases de datos creadas antes de este módulo tienen user_version = 0,
+por eso las migraciones 1 y 2 revisan la estructura existente en lugar de
+asumir una base vacía.
+"""
+
+import hashlib
+import logging
+import sqlite3
+from typing import Callable, List, Tuple
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+def _columnas(cursor, tabla: str) -> List[str]:
+    cursor.execute(f"PRAGMA table_info({tabla})")
+    return [column[1] for column in cursor.fetchall()]
+
+def _agregar_columnas(cursor, tabla: str, columnas: List[Tuple[str, str]]):
+    """Agregar las columnas que falten (bases creadas con versiones anteriores)"""
+    existentes = _columnas(cursor, tabla)
+    for nombre, definicion in columnas:
+        if nombre not in existentes:
+            cursor.execute(f"ALTER TABLE {tabla} ADD COLUMN {nombre} {definicion}")
+            logger.info(f"Columna {nombre} agregada a tabla {tabla}")
+
+# Estructura actual de tickets_compra (sin el flujo de aprobación)
+TICKETS_COMPRA_SQL = '''
+    CREATE TABLE IF NOT EXISTS {tabla} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        numero_ticket TEXT UNIQUE NOT NULL,
+        orden_produccion TEXT NOT NULL,
+        justificacion TEXT NOT NULL,
+        solicitante_id INTEGER NOT NULL,
+        solicitante_nombre TEXT NOT NULL,
+        solicitante_rol TEXT NOT NULL,
+        estado TEXT DEFAULT 'pendiente' CHECK (estado IN ('pendiente', 'entregado', 'devuelto')),
+        fecha_solicitud TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        fecha_entrega TIMESTAMP,
+        entregado_por_id INTEGER,
+        entregado_por_nombre TEXT,
+        comentarios_entrega TEXT,
+        FOREIGN KEY (solicitante_id) REFERENCES usuarios (id),
+        FOREIGN KEY (entregado_por_id) REFERENCES usuarios (id)
+    )
+'''
+
+TICKETS_INDICES = (
+    'CREATE INDEX IF NOT EXISTS idx_tickets_solicitante ON tickets_compra(solicitante_id)',
+    'CREATE INDEX IF NOT EXISTS idx_tickets_estado ON tickets_compra(estado)',
+    'CREATE INDEX IF NOT EXISTS idx_tickets_fecha ON tickets_compra(fecha_solicitud)',
+)
+
+def migracion_001_esquema_base(cursor):
+    """Tablas, columnas agregadas con el tiempo, índices y usuario admin"""
+    # Crear tabla de usuarios
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            nombre_completo TEXT NOT NULL,
+            email TEXT,
+            rol TEXT NOT NULL CHECK (rol IN ('admin', 'supervisor', 'operador')),
+            activo BOOLEAN DEFAULT 1,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ultimo_acceso TIMESTAMP
+        )
+    ''')
+
+    # Crear tabla de sesiones
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sesiones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario_id INTEGER NOT NULL,
+            token TEXT UNIQUE NOT NULL,
+            fecha_inicio TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            fecha_expiracion TIMESTAMP NOT NULL,
+            ip_address TEXT,
+            user_agent TEXT,
+            activa BOOLEAN DEFAULT 1,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+        )
+    ''')
+
+    # Crear tabla de productos
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS productos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            codigo_barras TEXT UNIQUE,
+            nombre TEXT NOT NULL,
+            descripcion TEXT,
+            cantidad INTEGER DEFAULT 0 CHECK (cantidad >= 0),
+            cantidad_minima INTEGER DEFAULT 0,
+            ubicacion TEXT,
+            categoria TEXT,
+            precio_unitario REAL,
+            codigo_qr TEXT,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Crear tabla de historial
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS historial (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            accion TEXT NOT NULL,
+            producto_id INTEGER,
+            cantidad_anterior INTEGER,
+            cantidad_nueva INTEGER,
+            usuario_id INTEGER,
+            usuario_nombre TEXT,
+            fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            detalles TEXT,
+            FOREIGN KEY (producto_id) REFERENCES productos (id),
+            FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+        )
+    ''')
+
+    # Crear tablas de tickets de compra
+    cursor.execute(TICKETS_COMPRA_SQL.format(tabla="tickets_compra"))
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ticket_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ticket_id INTEGER NOT NULL,
+            producto_id INTEGER NOT NULL,
+            producto_nombre TEXT NOT NULL,
+            cantidad_solicitada INTEGER NOT NULL,
+            cantidad_entregada INTEGER DEFAULT 0,
+            cantidad_devuelta INTEGER DEFAULT 0,
+            precio_unitario REAL,
+            FOREIGN KEY (ticket_id) REFERENCES tickets_compra (id) ON DELETE CASCADE,
+            FOREIGN KEY (producto_id) REFERENCES productos (id)
+        )
+    ''')
+
+    # Columnas que versiones anteriores agregaban en cada arranque
+    _agregar_columnas(cursor, "historial", [
+        ("usuario_id", "INTEGER"),
+        ("usuario_nombre", "TEXT"),
+        ("detalles", "TEXT"),
+    ])
+    _agregar_columnas(cursor, "productos", [("codigo_qr", "TEXT")])
+    _agregar_columnas(cursor, "ticket_items", [("cantidad_devuelta", "INTEGER DEFAULT 0")])
+
+    # Crear índices para rendimiento
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_productos_nombre ON productos(nombre)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_productos_ubicacion ON productos(ubicacion)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_historial_producto ON historial(producto_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_usuarios_username ON usuarios(username)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sesiones_token ON sesiones(token)')
+    for indice in TICKETS_INDICES:
+        cursor.execute(indice)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ticket_items_ticket ON ticket_items(ticket_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ticket_items_producto ON ticket_items(producto_id)')
+
+    # Crear usuario administrador por defecto si no existe
+    cursor.execute("SELECT COUNT(*) FROM usuarios WHERE username = 'admin'")
+    if cursor.fetchone()[0] == 0:
+        password_hash = hashlib.sha256('admin123'.encode()).hexdigest()
+        cursor.execute("""
+            INSERT INTO usuarios (username, password_hash, nombre_completo, email, rol)
+            VALUES (?, ?, ?, ?, ?)
+        """, ('admin', password_hash, 'Administrador del Sistema', 'admin@empresa.com', 'admin'))
+        logger.info("Usuario administrador creado: admin / admin123")
+
+def migracion_002_eliminar_aprobacion(cursor):
+    """Eliminar el estado 'aprobado' y los campos de aprobación de tickets_compra
+
+    Antes era scripts/migrar_eliminar_aprobacion.py (más
+    backend/scripts/migrar_eliminar_aprobacion.py para comentarios_entrega).
+    """
+    cursor.execute("UPDATE tickets_compra SET estado = 'pendiente' WHERE estado = 'aprobado'")
+    if cursor.rowcount:
+        logger.info(f"Tickets 'aprobado' convertidos a 'pendiente': {cursor.rowcount}")
+
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'tickets_compra'")
+    sql_actual = cursor.fetchone()[0]
+    if "aprobador_id" not in sql_actual and "'aprobado'" not in sql_actual:
+        _agregar_columnas(cursor, "tickets_compra", [("comentarios_entrega", "TEXT")])
+        return
+
+    # SQLite no permite cambiar un CHECK: reconstruir la tabla conservando los datos
+    columnas_anteriores = set(_columnas(cursor, "tickets_compra"))
+    cursor.execute(TICKETS_COMPRA_SQL.format(tabla="tickets_compra_new"))
+    columnas = [c for c in _columnas(cursor, "tickets_compra_new") if c in columnas_anteriores]
+    lista = ", ".join(columnas)
+    cursor.execute(f"INSERT INTO tickets_compra_new ({lista}) SELECT {lista} FROM tickets_compra")
+    cursor.execute("DROP TABLE tickets_compra")
+    cursor.execute("ALTER TABLE tickets_compra_new RENAME TO tickets_compra")
+    for indice in TICKETS_INDICES:
+        cursor.execute(indice)
+    logger.info("Estructura de tickets_compra actualizada (sin campos de aprobación)")
+
+def migracion_003_version_catalogo(cursor):
+    """Contador de versión del catálogo que sube con cada escritura a productos
+
+    Los triggers cubren tanto los endpoints como los scripts que escriben
+    directamente en la base de datos.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS catalogo_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO catalogo_version (id, version) VALUES (1, 1)")
+    for evento in ("INSERT", "UPDATE", "DELETE"):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_productos_version_{evento.lower()}
+            AFTER {evento} ON productos
+            BEGIN
+                UPDATE catalogo_version SET version = version + 1 WHERE id = 1;
+            END
+        ''')
+
+def migracion_004_cambios_productos(cursor):
+    """Versión de cambio por producto y lápidas para la sincronización por deltas
+
+    Cada fila de productos guarda la versión del catálogo en la que cambió
+    por última vez; los productos eliminados dejan una lápida con la versión
+    del borrado. Así /api/productos/cambios?desde=N solo lee lo posterior a N.
+    """
+    _agregar_columnas(cursor, "productos", [("version_cambio", "INTEGER NOT NULL DEFAULT 0")])
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS productos_eliminados (
+            producto_id INTEGER PRIMARY KEY,
+            version_cambio INTEGER NOT NULL,
+            fecha_eliminacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Los productos existentes cuentan como cambiados en la versión actual
+    cursor.execute("UPDATE productos SET version_cambio = (SELECT version FROM catalogo_version WHERE id = 1)")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_productos_version_cambio ON productos(version_cambio)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_productos_eliminados_version ON productos_eliminados(version_cambio)')
+
+    # Reemplazar los triggers de la migración 3: además de subir la versión
+    # la registran en la fila (o en la lápida)
+    for evento in ("insert", "update", "delete"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS trg_productos_version_{evento}")
+
+    cursor.execute('''
+        CREATE TRIGGER trg_productos_version_insert
+        AFTER INSERT ON productos
+        BEGIN
+            UPDATE catalogo_version SET version = version + 1 WHERE id = 1;
+            UPDATE productos SET version_cambio = (SELECT version FROM catalogo_version WHERE id = 1)
+            WHERE id = NEW.id;
+            DELETE FROM productos_eliminados WHERE producto_id = NEW.id;
+        END
+    ''')
+    # El WHEN evita volver a dispararse por su propio UPDATE de version_cambio
+    cursor.execute('''
+        CREATE TRIGGER trg_productos_version_update
+        AFTER UPDATE ON productos
+        WHEN NEW.version_cambio IS OLD.version_cambio
+        BEGIN
+            UPDATE catalogo_version SET version = version + 1 WHERE id = 1;
+            UPDATE productos SET version_cambio = (SELECT version FROM catalogo_version WHERE id = 1)
+            WHERE id = NEW.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER trg_productos_version_delete
+        AFTER DELETE ON productos
+        BEGIN
+            UPDATE catalogo_version SET version = version + 1 WHERE id = 1;
+            INSERT OR REPLACE INTO productos_eliminados (producto_id, version_cambio)
+            VALUES (OLD.id, (SELECT version FROM catalogo_version WHERE id = 1));
+        END
+    ''')
+
+def migracion_005_almacen_imagenes(cursor):
+    """Mover los QR de productos.codigo_qr a la tabla imagenes
+
+    Los QR en base64 no se convierten: se regeneran bajo demanda con la
+    clave del contenido actual del producto (mismos parámetros, misma
+    imagen). Después de esta migración se ejecuta VACUUM para devolver
+    el espacio que ocupaban.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS imagenes (
+            hash TEXT PRIMARY KEY,
+            tipo TEXT NOT NULL,
+            media_type TEXT NOT NULL,
+            datos BLOB NOT NULL,
+            bytes INTEGER NOT NULL,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    if "codigo_qr" in _columnas(cursor, "productos"):
+        cursor.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(codigo_qr)), 0) FROM productos WHERE codigo_qr IS NOT NULL")
+        cantidad, total_bytes = cursor.fetchone()
+        try:
+            cursor.execute("ALTER TABLE productos DROP COLUMN codigo_qr")
+        except sqlite3.OperationalError:
+            # SQLite < 3.35 no tiene DROP COLUMN: vaciar la columna
+            cursor.execute("UPDATE productos SET codigo_qr = NULL WHERE codigo_qr IS NOT NULL")
+        logger.info(f"QR en base64 eliminados de productos: {cantidad} ({total_bytes / 1024:.0f} KB)")
+
+    # Las respuestas del catálogo ya no incluyen codigo_qr
+    cursor.execute("UPDATE catalogo_version SET version = version + 1 WHERE id = 1")
+
+def migracion_006_conteos_ciclicos(cursor):
+    """Sesiones de conteo cíclico y sus lecturas"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conteos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            estado TEXT NOT NULL DEFAULT 'abierto' CHECK (estado IN ('abierto', 'aplicado', 'cancelado')),
+            notas TEXT,
+            usuario_id INTEGER,
+            usuario_nombre TEXT,
+            fecha_inicio TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            fecha_cierre TIMESTAMP,
+            productos_contados INTEGER DEFAULT 0,
+            productos_ajustados INTEGER DEFAULT 0,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+        )
+    ''')
+    # Una fila por producto contado; cantidad_sistema se fija al aplicar
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conteo_items (
+            conteo_id INTEGER NOT NULL,
+            producto_id INTEGER NOT NULL,
+            cantidad_contada INTEGER NOT NULL CHECK (cantidad_contada >= 0),
+            cantidad_sistema INTEGER,
+            lecturas INTEGER NOT NULL DEFAULT 1,
+            fecha_lectura TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (conteo_id, producto_id),
+            FOREIGN KEY (conteo_id) REFERENCES conteos (id),
+            FOREIGN KEY (producto_id) REFERENCES productos (id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_conteos_estado ON conteos(estado)')
+
+def migracion_007_busqueda_texto(cursor):
+    """Índice FTS5 de productos mantenido por triggers
+
+    Si SQLite no trae FTS5 la migración no crea nada y la búsqueda sigue
+    usando LIKE (ver busqueda.py).
+    """
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS productos_fts USING fts5(
+                nombre, descripcion, categoria, ubicacion, codigo_barras,
+                content='productos', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        if "fts5" not in str(e):
+            raise
+        logger.warning("⚠️ SQLite sin FTS5: la búsqueda de productos usará LIKE")
+        return
+
+    # Tabla de contenido externo: los triggers copian los cambios de productos.
+    # El de UPDATE solo mira las columnas indexadas (no version_cambio)
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_productos_fts_insert
+        AFTER INSERT ON productos
+        BEGIN
+            INSERT INTO productos_fts (rowid, nombre, descripcion, categoria, ubicacion, codigo_barras)
+            VALUES (NEW.id, NEW.nombre, NEW.descripcion, NEW.categoria, NEW.ubicacion, NEW.codigo_barras);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_productos_fts_delete
+        AFTER DELETE ON productos
+        BEGIN
+            INSERT INTO productos_fts (productos_fts, rowid, nombre, descripcion, categoria, ubicacion, codigo_barras)
+            VALUES ('delete', OLD.id, OLD.nombre, OLD.descripcion, OLD.categoria, OLD.ubicacion, OLD.codigo_barras);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_productos_fts_update
+        AFTER UPDATE OF nombre, descripcion, categoria, ubicacion, codigo_barras ON productos
+        BEGIN
+            INSERT INTO productos_fts (productos_fts, rowid, nombre, descripcion, categoria, ubicacion, codigo_barras)
+            VALUES ('delete', OLD.id, OLD.nombre, OLD.descripcion, OLD.categoria, OLD.ubicacion, OLD.codigo_barras);
+            INSERT INTO productos_fts (rowid, nombre, descripcion, categoria, ubicacion, codigo_barras)
+            VALUES (NEW.id, NEW.nombre, NEW.descripcion, NEW.categoria, NEW.ubicacion, NEW.codigo_barras);
+        END
+    ''')
+    cursor.execute("INSERT INTO productos_fts (productos_fts) VALUES ('rebuild')")
+
+# Columnas de productos con facetas (tipo en la tabla facetas)
+FACETAS = ("categoria", "ubicacion")
+
+def _sumar_faceta(fila: str, tipo: str, signo: str) -> str:
+    """Sentencias que suman (+) o restan (-) la fila NEW/OLD en su faceta"""
+    valor = f"COALESCE({fila}.{tipo}, '')"
+    unidades = f"COALESCE({fila}.cantidad, 0)"
+    bajo = f"CASE WHEN {fila}.cantidad <= {fila}.cantidad_minima AND {fila}.cantidad_minima > 0 THEN 1 ELSE 0 END"
+    if signo == "+":
+        return f"""
+            INSERT INTO facetas (tipo, valor, productos, unidades, stock_bajo)
+            VALUES ('{tipo}', {valor}, 1, {unidades}, {bajo})
+            ON CONFLICT (tipo, valor) DO UPDATE SET
+                productos = productos + 1,
+                unidades = unidades + excluded.unidades,
+                stock_bajo = stock_bajo + excluded.stock_bajo;"""
+    return f"""
+            UPDATE facetas SET productos = productos - 1, unidades = unidades - {unidades},
+                               stock_bajo = stock_bajo - ({bajo})
+            WHERE tipo = '{tipo}' AND valor = {valor};
+            DELETE FROM facetas WHERE tipo = '{tipo}' AND valor = {valor} AND productos <= 0;"""
+
+def migracion_008_facetas(cursor):
+    """Conteos por categoría y ubicación mantenidos por triggers
+
+    Cada faceta guarda cuántos productos tiene, sus unidades en stock y
+    cuántos están en stock bajo, así leerlas cuesta lo mismo con 100 que
+    con 50 000 productos. El trigger de UPDATE solo mira las columnas que
+    cambian los conteos.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS facetas (
+            tipo TEXT NOT NULL,
+            valor TEXT NOT NULL,
+            productos INTEGER NOT NULL DEFAULT 0,
+            unidades INTEGER NOT NULL DEFAULT 0,
+            stock_bajo INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (tipo, valor)
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_productos_facetas_insert
+        AFTER INSERT ON productos
+        BEGIN{"".join(_sumar_faceta("NEW", tipo, "+") for tipo in FACETAS)}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_productos_facetas_delete
+        AFTER DELETE ON productos
+        BEGIN{"".join(_sumar_faceta("OLD", tipo, "-") for tipo in FACETAS)}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_productos_facetas_update
+        AFTER UPDATE OF cantidad, cantidad_minima, {", ".join(FACETAS)} ON productos
+        BEGIN{"".join(_sumar_faceta("OLD", tipo, "-") + _sumar_faceta("NEW", tipo, "+") for tipo in FACETAS)}
+        END
+    ''')
+
+    # Conteos iniciales de los productos existentes
+    cursor.execute("DELETE FROM facetas")
+    for tipo in FACETAS:
+        cursor.execute(f'''
+            INSERT INTO facetas (tipo, valor, productos, unidades, stock_bajo)
+            SELECT '{tipo}', COALESCE({tipo}, ''), COUNT(*), COALESCE(SUM(cantidad), 0),
+                   SUM(CASE WHEN cantidad <= cantidad_minima AND cantidad_minima > 0 THEN 1 ELSE 0 END)
+            FROM productos
+            GROUP BY COALESCE({tipo}, '')
+        ''')
+
+def migracion_009_codigos_pendientes(cursor):
+    """Cola persistente de productos cuyos QR y códigos de barras hay que generar
+
+    Los triggers encolan un producto al crearlo y cuando cambia lo que
+    codifican sus imágenes (nombre o código de barras); el generador en
+    segundo plano (generador_codigos.py) la vacía. solicitud cambia en cada
+    encolado para no borrar un pedido más nuevo que el que se procesó.
+    Los productos existentes no se encolan: se generan bajo demanda o con
+    scripts/regenerar_codigos.py.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS codigos_pendientes (
+            producto_id INTEGER PRIMARY KEY,
+            solicitud INTEGER NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'pendiente' CHECK (estado IN ('pendiente', 'error')),
+            intentos INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            fecha_solicitud TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_codigos_pendientes_estado ON codigos_pendientes(estado, fecha_solicitud)')
+
+    encolar = '''
+            INSERT OR REPLACE INTO codigos_pendientes (producto_id, solicitud)
+            VALUES (NEW.id, random());'''
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_productos_codigos_insert
+        AFTER INSERT ON productos
+        BEGIN{encolar}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_productos_codigos_update
+        AFTER UPDATE OF nombre, codigo_barras ON productos
+        BEGIN{encolar}
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_productos_codigos_delete
+        AFTER DELETE ON productos
+        BEGIN
+            DELETE FROM codigos_pendientes WHERE producto_id = OLD.id;
+        END
+    ''')
+
+def migracion_010_version_tickets(cursor):
+    """Versión por ticket que sube con cada cambio al ticket o a sus artículos
+
+    La caché de PDFs de tickets usa (id, versión) como clave y ETag: entregar
+    y devolver cambian tickets_compra o ticket_items y los triggers suben la
+    versión (también si escribe un script). fecha_version es el Last-Modified.
+    """
+    _agregar_columnas(cursor, "tickets_compra", [
+        ("version", "INTEGER NOT NULL DEFAULT 1"),
+        ("fecha_version", "TIMESTAMP"),
+    ])
+    cursor.execute("UPDATE tickets_compra SET fecha_version = CURRENT_TIMESTAMP WHERE fecha_version IS NULL")
+
+    subir = '''
+            UPDATE tickets_compra SET version = version + 1, fecha_version = CURRENT_TIMESTAMP
+            WHERE id = {ticket};'''
+    # El WHEN evita que el propio UPDATE de la versión vuelva a contar
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_tickets_version_update
+        AFTER UPDATE ON tickets_compra
+        WHEN NEW.version = OLD.version
+        BEGIN{subir.format(ticket="NEW.id")}
+        END
+    ''')
+    for evento, ticket in (("INSERT", "NEW.ticket_id"), ("UPDATE", "NEW.ticket_id"), ("DELETE", "OLD.ticket_id")):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_ticket_items_version_{evento.lower()}
+            AFTER {evento} ON ticket_items
+            BEGIN{subir.format(ticket=ticket)}
+            END
+        ''')
+
+# Lista ordenada de migraciones: (versión, descripción, función)
+MIGRACIONES: List[Tuple[int, str, Callable]] = [
+    (1, "esquema base", migracion_001_esquema_base),
+    (2, "eliminar estado aprobado de tickets", migracion_002_eliminar_aprobacion),
+    (3, "versión del catálogo de productos", migracion_003_version_catalogo),
+    (4, "cambios de productos para sincronización", migracion_004_cambios_productos),
+    (5, "almacén de imágenes por contenido", migracion_005_almacen_imagenes),
+    (6, "conteos cíclicos", migracion_006_conteos_ciclicos),
+    (7, "búsqueda de texto completo (FTS5)", migracion_007_busqueda_texto),
+    (8, "facetas de categoría y ubicación", migracion_008_facetas),
+    (9, "cola de generación de códigos", migracion_009_codigos_pendientes),
+    (10, "versión de tickets para la caché de PDFs", migracion_010_version_tickets),
+]
+
+# Migraciones que liberan mucho espacio: VACUUM al terminar (fuera de la transacción)
+MIGRACIONES_CON_VACUUM = {5}
+
+VERSION_ACTUAL = MIGRACIONES[-1][0]
+
+def obtener_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def aplicar_migraciones(conn) -> int:
+    """Aplicar las migraciones pendientes y devolver cuántas se aplicaron
+
+    La conexión debe ser de escritura. Cada migración corre en su propia
+    transacción junto con el cambio de user_version, así una migración que
+    falla no deja la base a medias.
+    """
+    version = obtener_version(conn)
+    if version >= VERSION_ACTUAL:
+        return 0
+
+    aplicadas = 0
+    vacuum = False
+    for numero, descripcion, migracion in MIGRACIONES:
+        if numero <= version:
+            continue
+        logger.info(f"🛠️ Aplicando migración {numero}: {descripcion}")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            migracion(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {numero}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"❌ Migración {numero} ({descripcion}) falló, esquema en versión {version}")
+            raise
+        version = numero
+        aplicadas += 1
+        if numero in MIGRACIONES_CON_VACUUM:
+            vacuum = True
+
+    if vacuum:
+        logger.info("🧹 Ejecutando VACUUM")
+        conn.execute("VACUUM")
+
+    logger.info(f"✅ Esquema en versión {version} ({aplicadas} migraciones aplicadas)")
+    return aplicadas
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PDF del comprobante de un ticket
+Sistema de Inventario - Empresa de Maquinados
+
+Se ejecuta en el pool de procesos (db_async.run_process): reportlab
+ocupa el GIL mientras arma el documento y, en un hilo, frenaba a las
+demás peticiones. El PDF se arma en memoria (BytesIO) y los estilos se
+crean una sola vez al importar el módulo, es decir, una vez por proceso.
+"""
+
+from datetime import datetime
+from io import BytesIO
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+
+# Subir al cambiar el diseño: invalida los PDFs guardados en cache_pdf.py
+PDF_TICKET_FORMATO = 1
+
+# Estilos
+_styles = getSampleStyleSheet()
+TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=_styles['Heading1'],
+    fontSize=18,
+    spaceAfter=30,
+    alignment=TA_CENTER,
+    textColor=colors.darkblue
+)
+SUBTITLE_STYLE = ParagraphStyle(
+    'CustomSubtitle',
+    parent=_styles['Heading2'],
+    fontSize=14,
+    spaceAfter=20,
+    alignment=TA_CENTER,
+    textColor=colors.darkblue
+)
+NORMAL_STYLE = _styles['Normal']
+BOLD_STYLE = ParagraphStyle(
+    'Bold',
+    parent=_styles['Normal'],
+    fontSize=12,
+    spaceAfter=6,
+    fontName='Helvetica-Bold'
+)
+ITEMS_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 12),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 10),
+    ('ALIGN', (1, 1), (-1, -1), 'CENTER'),  # Centrar números
+    ('ALIGN', (0, 1), (0, -1), 'LEFT'),      # Alinear texto a la izquierda
+])
+ITEMS_COL_WIDTHS = [2.5*inch, 1*inch, 1*inch, 1*inch, 1.2*inch]
+
+def generar_pdf_ticket(ticket_data: dict) -> bytes:
+    """Generar PDF del ticket con información completa"""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    story = []
+    generado = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+
+    # Título
+    story.append(Paragraph("SISTEMA DE ALMACÉN", TITLE_STYLE))
+    story.append(Paragraph("COMPROBANTE DE SOLICITUD", SUBTITLE_STYLE))
+    story.append(Spacer(1, 20))
+
+    # Información de generación
+    story.append(Paragraph(f"<b>Documento generado:</b> {generado}", NORMAL_STYLE))
+    story.append(Spacer(1, 15))
+
+    # Información del ticket
+    story.append(Paragraph(f"<b>Número de Ticket:</b> {ticket_data['numero_ticket']}", NORMAL_STYLE))
+    story.append(Paragraph(f"<b>Orden de Producción:</b> {ticket_data['orden_produccion']}", NORMAL_STYLE))
+    story.append(Paragraph(f"<b>Estado:</b> {ticket_data['estado'].upper()}", NORMAL_STYLE))
+    story.append(Paragraph(f"<b>Justificación:</b> {ticket_data['justificacion']}", NORMAL_STYLE))
+    story.append(Spacer(1, 15))
+
+    # Información del solicitante
+    story.append(Paragraph("<b>INFORMACIÓN DEL SOLICITANTE</b>", BOLD_STYLE))
+    story.append(Paragraph(f"<b>Nombre:</b> {ticket_data['solicitante_nombre']}", NORMAL_STYLE))
+    story.append(Paragraph(f"<b>Rol:</b> {ticket_data['solicitante_rol']}", NORMAL_STYLE))
+    story.append(Paragraph(f"<b>Fecha de Solicitud:</b> {ticket_data['fecha_solicitud']}", NORMAL_STYLE))
+    story.append(Spacer(1, 15))
+
+    # Información de entrega (si existe)
+    if ticket_data.get('entregado_por_nombre'):
+        story.append(Paragraph("<b>INFORMACIÓN DE ENTREGA</b>", BOLD_STYLE))
+        story.append(Paragraph(f"<b>Entregado por:</b> {ticket_data['entregado_por_nombre']}", NORMAL_STYLE))
+        story.append(Paragraph(f"<b>Fecha de Entrega:</b> {ticket_data['fecha_entrega']}", NORMAL_STYLE))
+
+        # Agregar comentarios de entrega si existen
+        if ticket_data.get('comentarios_entrega'):
+            story.append(Paragraph(f"<b>Comentarios de Entrega:</b> {ticket_data['comentarios_entrega']}", NORMAL_STYLE))
+
+        story.append(Spacer(1, 15))
+
+    # Información de devolución (si existe)
+    if ticket_data.get('devuelto_por_nombre'):
+        story.append(Paragraph("<b>INFORMACIÓN DE DEVOLUCIÓN</b>", BOLD_STYLE))
+        story.append(Paragraph(f"<b>Devuelto por:</b> {ticket_data['devuelto_por_nombre']}", NORMAL_STYLE))
+        story.append(Paragraph(f"<b>Fecha de Devolución:</b> {ticket_data['fecha_devolucion']}", NORMAL_STYLE))
+        story.append(Spacer(1, 15))
+
+    # Tabla de herramientas
+    story.append(Paragraph("<b>HERRAMIENTAS SOLICITADAS</b>", BOLD_STYLE))
+
+    if ticket_data.get('items'):
+        # Preparar datos para la tabla
+        table_data = [
+            ['Herramienta', 'Solicitado', 'Entregado', 'Devuelto', 'Precio Unit.']
+        ]
+
+        for item in ticket_data['items']:
+            cantidad_devuelta = item.get('cantidad_devuelta', 0) or 0
+            table_data.append([
+                item['producto_nombre'],
+                str(item['cantidad_solicitada']),
+                str(item.get('cantidad_entregada', 0) or 0),
+                str(cantidad_devuelta),
+                f"${item.get('precio_unitario', 0) or 0:.2f}"
+            ])
+
+        table = Table(table_data, colWidths=ITEMS_COL_WIDTHS)
+        table.setStyle(ITEMS_TABLE_STYLE)
+
+        story.append(table)
+        story.append(Spacer(1, 20))
+
+    # Pie de página
+    story.append(Paragraph("<b>NOTAS IMPORTANTES:</b>", BOLD_STYLE))
+    story.append(Paragraph("• Este documento es un comprobante oficial de la solicitud de herramientas.", NORMAL_STYLE))
+    story.append(Paragraph("• La información contenida en este PDF no puede ser alterada.", NORMAL_STYLE))
+    story.append(Paragraph("• Para consultas o aclaraciones, contacte al administrador del sistema.", NORMAL_STYLE))
+    story.append(Paragraph(f"• Documento generado el: {generado}", NORMAL_STYLE))
+
+    doc.build(story)
+    return buffer.getvalue()
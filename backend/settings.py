@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Configuración del servidor resuelta una sola vez al arrancar
+Sistema de Inventario - Empresa de Maquinados
+
+La rama (BRANCH o Git) y la ruta de la base de datos se calculan en
+lifespan() y se comparten con el pool de conexiones y el sistema de
+alertas, en lugar de ejecutar `git` en cada conexión.
+"""
+
+import os
+import subprocess
+import logging
+from datetime import datetime
+from typing import Dict
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+DATA_DIR = "../data"
+
+def get_current_git_branch() -> str:
+    """Detecta la rama Git actual ("main" si no se puede detectar)"""
+    comandos = (
+        ['git', 'branch', '--show-current'],
+        ['git', 'rev-parse', '--abbrev-ref', 'HEAD'],
+    )
+    try:
+        for comando in comandos:
+            # Intentar desde el directorio actual y luego desde el directorio padre
+            for cwd in ('.', '..'):
+                result = subprocess.run(comando, capture_output=True, text=True, cwd=cwd)
+                if result.returncode == 0 and result.stdout.strip():
+                    return result.stdout.strip()
+    except Exception as e:
+        logger.warning(f"No se pudo detectar la rama Git: {e}")
+
+    return "main"  # Rama por defecto
+
+class Settings:
+    """Configuración inmutable del proceso"""
+
+    def __init__(self, branch: str, branch_source: str, data_dir: str = DATA_DIR,
+                 db_pool_readers: int = 4, db_pool_timeout: float = 30.0,
+                 write_batch_max: int = 64, write_batch_window_ms: float = 2.0):
+        self.branch = branch
+        self.branch_source = branch_source
+        self.data_dir = data_dir
+
+        # Definir nombre de base de datos según la rama
+        if branch.lower() == "desarrollo":
+            self.db_name = "almacen_desarrollo.db"
+        else:
+            self.db_name = "almacen_main.db"
+        self.db_path = f"{data_dir}/{self.db_name}"
+        # PDFs de tickets ya generados (uno por base de datos)
+        self.pdf_cache_dir = f"{data_dir}/pdf_{os.path.splitext(self.db_name)[0]}"
+
+        self.db_pool_readers = db_pool_readers
+        self.db_pool_timeout = db_pool_timeout
+        self.write_batch_max = write_batch_max
+        self.write_batch_window_ms = write_batch_window_ms
+        self.resuelto_en = datetime.now().isoformat()
+
+    def to_dict(self) -> Dict:
+        return {
+            "rama": self.branch,
+            "origen_rama": self.branch_source,
+            "base_datos": self.db_name,
+            "db_path": self.db_path,
+            "db_path_absoluto": os.path.abspath(self.db_path),
+            "pdf_cache_dir": self.pdf_cache_dir,
+            "pool_lectores": self.db_pool_readers,
+            "pool_timeout_segundos": self.db_pool_timeout,
+            "escritura_lote_max": self.write_batch_max,
+            "escritura_ventana_ms": self.write_batch_window_ms,
+            "resuelto_en": self.resuelto_en
+        }
+
+def load_settings() -> Settings:
+    """Resolver la configuración desde variables de entorno y Git"""
+    # Priorizar variable de entorno BRANCH sobre detección automática
+    branch = os.getenv("BRANCH")
+    branch_source = "env"
+    if not branch:
+        branch = get_current_git_branch()
+        branch_source = "git"
+
+    return Settings(
+        branch=branch,
+        branch_source=branch_source,
+        db_pool_readers=int(os.getenv("DB_POOL_READERS", "4")),
+        db_pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        write_batch_max=int(os.getenv("DB_WRITE_BATCH_MAX", "64")),
+        write_batch_window_ms=float(os.getenv("DB_WRITE_BATCH_WINDOW_MS", "2"))
+    )
+
+# Instancia global de configuración
+settings = None
+
+def init_settings() -> Settings:
+    """Construir la configuración global (se llama una vez en lifespan)"""
+    global settings
+    settings = load_settings()
+    logger.info(f"⚙️ Configuración resuelta: rama={settings.branch} ({settings.branch_source}), db={settings.db_path}")
+    return settings
+
+def get_settings() -> Settings:
+    """Obtener la configuración global, resolviéndola si aún no existe"""
+    if settings is None:
+        return init_settings()
+    return settings
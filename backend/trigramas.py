@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Búsqueda tolerante a errores de escritura por trigramas
+Sistema de Inventario - Empresa de Maquinados
+
+Índice en memoria de los nombres de productos. Cada palabra distinta del
+catálogo se parte en trigramas (grupos de 3 letras, como pg_trgm): una
+palabra mal escrita de la consulta ("brocca") se compara contra ese
+vocabulario y se cambia por las palabras más parecidas ("broca"); después
+se suman, por producto, las similitudes de cada palabra de la consulta.
+Las medidas y números ("1/4", "10") deben coincidir exactos: un error ahí
+cambiaría de herramienta.
+
+El índice se carga completo la primera vez y después solo aplica los
+productos cambiados y eliminados desde su versión del catálogo (las mismas
+columnas que usa /api/productos/cambios), así que seguir al día cuesta una
+lectura por clave primaria cuando nada cambió.
+"""
+
+import heapq
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from itertools import count
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from catalogo import leer_cambios_catalogo, leer_version_catalogo
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Similitud mínima (Jaccard de trigramas) para cambiar una palabra por otra
+SIMILITUD_PALABRA = 0.3
+# Palabras del vocabulario que se prueban por cada palabra de la consulta
+PALABRAS_CANDIDATAS = 5
+# Similitud promedio mínima de un producto con la consulta
+SIMILITUD_MINIMA = 0.3
+
+_NO_ALFANUMERICO = re.compile(r"[^0-9a-z]+")
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sin acentos y solo letras y números separados por espacios"""
+    texto = unicodedata.normalize("NFKD", (texto or "").lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return _NO_ALFANUMERICO.sub(" ", texto).strip()
+
+def palabras(texto: str) -> Tuple[str, ...]:
+    return tuple(dict.fromkeys(normalizar(texto).split()))
+
+def trigramas(palabra: str) -> FrozenSet[str]:
+    """Trigramas con relleno (broca: '  b', ' br', 'bro', 'roc', 'oca', 'ca ')"""
+    relleno = f"  {palabra} "
+    return frozenset(relleno[i:i + 3] for i in range(len(relleno) - 2))
+
+def es_difusa(palabra: str) -> bool:
+    """Solo palabras con letras y de 3 o más caracteres admiten errores"""
+    return len(palabra) >= 3 and not palabra.isdigit()
+
+class IndiceTrigramas:
+    """Vocabulario de nombres (palabra -> productos) e índice trigrama -> palabras"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._productos_por_palabra: Dict[str, Set[int]] = {}
+        self._palabras_por_trigrama: Dict[str, Set[str]] = {}
+        self._trigramas_palabra: Dict[str, FrozenSet[str]] = {}
+        self._palabras_producto: Dict[int, Tuple[str, ...]] = {}
+        self.version: Optional[int] = None
+        self.cargas_completas = 0
+        self.actualizaciones = 0
+
+    def _agregar(self, producto_id: int, nombre: str):
+        self._quitar(producto_id)
+        lista = palabras(nombre)
+        self._palabras_producto[producto_id] = lista
+        for palabra in lista:
+            ids = self._productos_por_palabra.get(palabra)
+            if ids is None:
+                ids = self._productos_por_palabra[palabra] = set()
+                if es_difusa(palabra):
+                    grams = trigramas(palabra)
+                    self._trigramas_palabra[palabra] = grams
+                    for gram in grams:
+                        self._palabras_por_trigrama.setdefault(gram, set()).add(palabra)
+            ids.add(producto_id)
+
+    def _quitar(self, producto_id: int):
+        for palabra in self._palabras_producto.pop(producto_id, ()):
+            ids = self._productos_por_palabra.get(palabra)
+            if ids is None:
+                continue
+            ids.discard(producto_id)
+            if ids:
+                continue
+            # Última aparición: sacar la palabra del vocabulario
+            del self._productos_por_palabra[palabra]
+            for gram in self._trigramas_palabra.pop(palabra, ()):
+                vocabulario = self._palabras_por_trigrama.get(gram)
+                if vocabulario is not None:
+                    vocabulario.discard(palabra)
+                    if not vocabulario:
+                        del self._palabras_por_trigrama[gram]
+
+    def actualizar(self, conn):
+        """Cargar o aplicar los cambios del catálogo desde la última versión"""
+        version_actual = leer_version_catalogo(conn)
+        if self.version is not None and self.version >= version_actual:
+            return
+
+        with self._lock:
+            if self.version is not None and self.version >= version_actual:
+                return
+            inicio = time.perf_counter()
+            version, filas, eliminados = leer_cambios_catalogo(conn, self.version, "id, nombre")
+
+            for producto_id in eliminados:
+                self._quitar(producto_id)
+            for row in filas:
+                self._agregar(row[0], row[1])
+
+            if self.version is None:
+                self.cargas_completas += 1
+                logger.info(f"🔤 Índice de trigramas cargado: {len(self._palabras_producto)} productos, "
+                            f"{len(self._productos_por_palabra)} palabras en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+            else:
+                self.actualizaciones += 1
+            self.version = version
+
+    def _parecidas(self, palabra: str) -> List[Tuple[float, str]]:
+        """Palabras del vocabulario parecidas a la escrita, la más parecida al final"""
+        if not es_difusa(palabra):
+            return [(1.0, palabra)] if palabra in self._productos_por_palabra else []
+
+        grams = trigramas(palabra)
+        comunes: Counter = Counter()
+        for gram in grams:
+            vocabulario = self._palabras_por_trigrama.get(gram)
+            if vocabulario:
+                comunes.update(vocabulario)
+        parecidas = []
+        for candidata, n in comunes.items():
+            similitud = n / (len(grams) + len(self._trigramas_palabra[candidata]) - n)
+            if similitud >= SIMILITUD_PALABRA:
+                parecidas.append((similitud, candidata))
+        parecidas.sort()
+        return parecidas[-PALABRAS_CANDIDATAS:]
+
+    def _grupos(self, palabra: str) -> List[Tuple[float, Set[int]]]:
+        """Productos por similitud con una palabra de la consulta (conjuntos disjuntos)"""
+        grupos = []
+        vistos: Set[int] = set()
+        for similitud, candidata in reversed(self._parecidas(palabra)):
+            # Los conjuntos del índice solo se leen: sin copiar si no hay nada que quitar
+            ids = self._productos_por_palabra[candidata] - vistos if vistos else self._productos_por_palabra[candidata]
+            if ids:
+                grupos.append((similitud, ids))
+                vistos |= ids
+        return grupos
+
+    def buscar(self, texto: str, limit: int = 20, minima: float = SIMILITUD_MINIMA) -> List[Tuple[int, float]]:
+        """[(producto_id, similitud)] ordenados de más a menos parecidos
+
+        La similitud es el promedio, sobre las palabras de la consulta, de la
+        mejor palabra parecida que tiene el producto; a igualdad gana el
+        nombre con menos palabras. En lugar de sumar producto por producto se
+        combinan los conjuntos de cada palabra con intersecciones (en C).
+        Las ramas se abren de mayor a menor puntaje posible y la búsqueda
+        termina al juntar limit productos: las palabras muy comunes (números
+        como "1" o "4") no se cruzan con todo el catálogo si la mejor rama ya
+        alcanza, y las ramas que no pueden llegar al mínimo se descartan.
+        """
+        consulta = palabras(texto)
+        if not consulta:
+            return []
+        total = len(consulta)
+        minimo = minima * total - 1e-9
+
+        with self._lock:
+            por_palabra = sorted((self._grupos(p) for p in consulta),
+                                 key=lambda grupos: sum(len(ids) for _, ids in grupos))
+
+            # (-puntaje posible, -palabras revisadas, orden, puntaje, productos
+            # o None = cualquiera, conjuntos que hay que quitarle al abrirla)
+            contador = count()
+            pendientes = [(-float(total), 0, next(contador), 0.0, None, ())]
+            resultado: List[Tuple[int, float]] = []
+            agregados: Set[int] = set()
+            while pendientes and len(resultado) < limit:
+                _, revisadas, _, puntaje, conjunto, quitar = heapq.heappop(pendientes)
+                revisadas = -revisadas
+                if quitar and conjunto is not None:
+                    conjunto = conjunto.difference(*quitar)
+                    if not conjunto:
+                        continue
+
+                if revisadas == total:
+                    if conjunto is None:
+                        continue
+                    mejores = heapq.nsmallest(limit - len(resultado), conjunto - agregados,
+                                              key=lambda pid: (len(self._palabras_producto[pid]), pid))
+                    similitud = round(puntaje / total, 3)
+                    resultado.extend((producto_id, similitud) for producto_id in mejores)
+                    agregados.update(mejores)
+                    continue
+
+                grupos = por_palabra[revisadas]
+                restantes = total - revisadas - 1
+                for similitud, ids in grupos:
+                    comunes = ids if conjunto is None else conjunto & ids
+                    if comunes and puntaje + similitud + restantes >= minimo:
+                        heapq.heappush(pendientes, (-(puntaje + similitud + restantes), -(revisadas + 1),
+                                                    next(contador), puntaje + similitud, comunes, ()))
+                # Productos que no tienen esta palabra (la resta se hace solo si se abre la rama)
+                if puntaje + restantes >= minimo:
+                    heapq.heappush(pendientes, (-(puntaje + restantes), -(revisadas + 1), next(contador),
+                                                puntaje, conjunto, tuple(ids for _, ids in grupos)))
+        return resultado
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "version": self.version,
+                "productos": len(self._palabras_producto),
+                "palabras": len(self._productos_por_palabra),
+                "trigramas": len(self._palabras_por_trigrama),
+                "cargas_completas": self.cargas_completas,
+                "actualizaciones": self.actualizaciones
+            }
+
+# Instancia global del índice de nombres de productos
+indice_nombres = IndiceTrigramas()
@@ -2,11 +2,17 @@ class AlmacenApp {
     constructor() {
         this.apiUrl = '/api';
         this.productos = [];
+        this.productosEtag = null; // ETag de la última versión del catálogo descargada
+        this.catalogoVersion = null; // Versión del catálogo que refleja this.productos
+        this.estadisticasEtag = null;
         this.filtroActual = '';
         this.currentUser = null;
         this.filtroStockBajo = false;
         this.allTickets = []; // Array para almacenar todos los tickets para filtrado
         this.ticketItems = []; // Array para almacenar los items del ticket actual
+        this.colaEscaneos = []; // Códigos escaneados pendientes de enviar en tanda
+        this.timerEscaneos = null;
+        this.ultimoEscaneo = { codigo: null, tiempo: 0 };
         this.init();
     }
     
@@ -300,11 +306,35 @@ class AlmacenApp {
     
     async loadProductos() {
         try {
-            const response = await fetch(`${this.apiUrl}/productos`);
-            if (!response.ok) throw new Error('Error en la respuesta del servidor');
-            
-            const data = await response.json();
-            this.productos = data.productos;
+            // Paginación por cursor
+            const productos = [];
+            let cursor = null;
+            let etag = null;
+            let version = null;
+            do {
+                const params = new URLSearchParams({ limit: 500 });
+                if (cursor) params.set('cursor', cursor);
+
+                // En la primera página se pregunta si el catálogo cambió
+                const headers = {};
+                if (!cursor && this.productosEtag) headers['If-None-Match'] = this.productosEtag;
+
+                const response = await fetch(`${this.apiUrl}/productos?${params}`, { headers, cache: 'no-store' });
+                if (response.status === 304) return; // Sin cambios: se conserva this.productos
+                if (!response.ok) throw new Error('Error en la respuesta del servidor');
+
+                if (!cursor) {
+                    etag = response.headers.get('ETag');
+                    version = parseInt(response.headers.get('X-Catalogo-Version'), 10);
+                }
+                const data = await response.json();
+                productos.push(...data.productos);
+                cursor = data.siguiente_cursor;
+            } while (cursor);
+
+            this.productos = productos;
+            this.productosEtag = etag;
+            this.catalogoVersion = Number.isNaN(version) ? null : version;
             this.renderProductos(this.productos);
         } catch (error) {
             console.error('Error cargando productos:', error);
@@ -312,12 +342,52 @@ class AlmacenApp {
         }
     }
     
+    async sincronizarProductos() {
+        // Sin una versión base no hay deltas que aplicar: carga completa
+        if (this.catalogoVersion === null) {
+            return this.loadProductos();
+        }
+        
+        try {
+            const response = await fetch(`${this.apiUrl}/productos/cambios?desde=${this.catalogoVersion}`, { cache: 'no-store' });
+            if (!response.ok) throw new Error('Error en la respuesta del servidor');
+            
+            const data = await response.json();
+            if (data.reiniciar) {
+                // La base de datos es otra (restaurada o cambio de rama)
+                this.catalogoVersion = null;
+                this.productosEtag = null;
+                return this.loadProductos();
+            }
+            if (data.productos.length === 0 && data.eliminados.length === 0) return;
+            
+            // Aplicar los cambios sobre la lista en memoria
+            const eliminados = new Set(data.eliminados);
+            const porId = new Map(this.productos.filter(p => !eliminados.has(p.id)).map(p => [p.id, p]));
+            data.productos.forEach(producto => porId.set(producto.id, producto));
+            
+            // Mismo orden que el servidor: (nombre, id)
+            this.productos = Array.from(porId.values()).sort((a, b) =>
+                a.nombre < b.nombre ? -1 : a.nombre > b.nombre ? 1 : a.id - b.id
+            );
+            this.catalogoVersion = data.version;
+            this.productosEtag = null; // El ETag de la carga completa ya no corresponde
+            this.filtrarProductos();
+        } catch (error) {
+            console.error('Error sincronizando productos:', error);
+            this.loadProductos();
+        }
+    }
+    
     async loadEstadisticas() {
         try {
-            const response = await fetch(`${this.apiUrl}/estadisticas`);
+            const headers = this.estadisticasEtag ? { 'If-None-Match': this.estadisticasEtag } : {};
+            const response = await fetch(`${this.apiUrl}/estadisticas`, { headers, cache: 'no-store' });
+            if (response.status === 304) return;
             if (!response.ok) throw new Error('Error en la respuesta del servidor');
             
             const data = await response.json();
+            this.estadisticasEtag = response.headers.get('ETag');
             this.updateEstadisticas(data);
         } catch (error) {
             console.error('Error cargando estadísticas:', error);
@@ -422,7 +492,7 @@ class AlmacenApp {
             const result = await response.json();
             this.showNotification(result.mensaje, 'success');
             this.limpiarFormulario();
-            this.loadProductos();
+            this.sincronizarProductos();
             this.loadEstadisticas();
             
             // VOLVER AL MENÚ "INVENTARIO" DESPUÉS DE GUARDAR/ACTUALIZAR
@@ -531,7 +601,7 @@ class AlmacenApp {
             const result = await response.json();
             this.showNotification(result.mensaje, 'success');
             this.cerrarModal();
-            this.loadProductos();
+            this.sincronizarProductos();
             this.loadEstadisticas();
         } catch (error) {
             console.error('Error:', error);
@@ -557,11 +627,41 @@ class AlmacenApp {
                        (producto.ubicacion && producto.ubicacion.toLowerCase().includes(this.filtroActual)) ||
                        (producto.categoria && producto.categoria.toLowerCase().includes(this.filtroActual));
             });
+            
+            // Sin coincidencias: pedir al servidor nombres parecidos (errores de escritura)
+            if (productosFiltrados.length === 0 && this.filtroActual.trim().length >= 3) {
+                this.buscarSugerencias(this.filtroActual.trim());
+            }
         }
         
         this.renderProductos(productosFiltrados);
     }
     
+    buscarSugerencias(termino) {
+        clearTimeout(this.sugerenciasTimer);
+        this.sugerenciasTimer = setTimeout(async () => {
+            try {
+                const response = await fetch(`${this.apiUrl}/productos/buscar?q=${encodeURIComponent(termino)}&limit=20&fields=id`);
+                if (!response.ok) return;
+                const data = await response.json();
+                
+                // El usuario siguió escribiendo: ignorar la respuesta vieja
+                if (termino !== (this.filtroActual || '').trim()) return;
+                
+                const porId = new Map(this.productos.map(p => [p.id, p]));
+                let sugeridos = data.productos.map(p => porId.get(p.id)).filter(Boolean);
+                if (this.filtroStockBajo) {
+                    sugeridos = sugeridos.filter(p => p.cantidad_minima > 0 && p.cantidad <= p.cantidad_minima);
+                }
+                if (sugeridos.length > 0) {
+                    this.renderProductos(sugeridos);
+                }
+            } catch (error) {
+                console.error('Error buscando sugerencias:', error);
+            }
+        }, 250);
+    }
+    
     renderProductos(productos) {
         const container = document.getElementById('productosList');
         container.innerHTML = '';
@@ -680,17 +780,12 @@ class AlmacenApp {
             if (!producto) return;
             
             // Mostrar loading
-            document.getElementById('qrProductoImg').src = '';
+            document.getElementById('qrProductoImg').removeAttribute('src');
             document.getElementById('qrProductoInfo').innerHTML = 'Cargando QR...';
             document.getElementById('qrModal').style.display = 'block';
             // Prevenir scroll del body
             document.body.classList.add('modal-open');
             
-            const response = await fetch(`${this.apiUrl}/productos/${productoId}/qr`);
-            if (!response.ok) throw new Error('No se pudo obtener el QR');
-            
-            const data = await response.json();
-            
             // Mostrar información del producto
             document.getElementById('qrProductoInfo').innerHTML = `
                 <div style="margin-bottom: 15px; text-align: left;">
@@ -700,8 +795,12 @@ class AlmacenApp {
                 </div>
             `;
             
-            // Mostrar QR
-            document.getElementById('qrProductoImg').src = data.qr;
+            // Mostrar QR (imagen PNG; el navegador la revalida con su ETag)
+            const qrImg = document.getElementById('qrProductoImg');
+            qrImg.onerror = () => {
+                document.getElementById('qrProductoInfo').innerHTML = 'Error al cargar el QR';
+            };
+            qrImg.src = `${this.apiUrl}/productos/${productoId}/qr`;
         } catch (error) {
             console.error('Error:', error);
             document.getElementById('qrProductoInfo').innerHTML = 'Error al cargar el QR';
@@ -1367,6 +1466,8 @@ class AlmacenApp {
         console.log('🆔 currentTicketId antes de cerrar:', this.currentTicketId);
         
         this.detenerQrScanner();
+        // Enviar lo que quedó en cola
+        this.enviarEscaneos();
         document.getElementById('qrScannerModal').style.display = 'none';
         
         // Solo restaurar scroll del body si no hay otros modales abiertos
@@ -1382,6 +1483,12 @@ class AlmacenApp {
         try {
             console.log('🔍 Procesando código QR:', qrData);
             
+            // Armando un ticket: juntar los escaneos y resolverlos en tandas
+            if (!this.currentTicketId) {
+                this.encolarEscaneo(qrData);
+                return;
+            }
+            
             // Enviar código al backend para buscar el producto
             fetch(`${this.apiUrl}/productos/buscar`, {
                 method: 'POST',
@@ -1415,6 +1522,75 @@ class AlmacenApp {
         }
     }
     
+    encolarEscaneo(codigo) {
+        const ahora = Date.now();
+        // La cámara lee el mismo código varias veces mientras sigue enfrente
+        const repetido = codigo === this.ultimoEscaneo.codigo && ahora - this.ultimoEscaneo.tiempo < 1500;
+        this.ultimoEscaneo = { codigo, tiempo: ahora };
+        
+        if (!repetido) {
+            this.colaEscaneos.push(codigo);
+            document.getElementById('scannerStatusText').textContent = `📥 ${this.colaEscaneos.length} escaneo(s) en cola`;
+            document.getElementById('qrScannerStatus').className = 'scanner-status scanning';
+            
+            clearTimeout(this.timerEscaneos);
+            if (this.colaEscaneos.length >= 50) {
+                this.enviarEscaneos();
+            } else {
+                this.timerEscaneos = setTimeout(() => this.enviarEscaneos(), 400);
+            }
+        }
+        
+        // Seguir escaneando la charola
+        setTimeout(() => {
+            if (this.zxingReader) {
+                this.iniciarEscaneoZXing(document.getElementById('qrVideo'));
+            }
+        }, 300);
+    }
+    
+    async enviarEscaneos() {
+        clearTimeout(this.timerEscaneos);
+        this.timerEscaneos = null;
+        if (this.colaEscaneos.length === 0) return;
+        
+        const codigos = this.colaEscaneos.splice(0);
+        try {
+            const response = await fetch(`${this.apiUrl}/productos/buscar-lote`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({ codigos })
+            });
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            const data = await response.json();
+            const porCodigo = new Map(data.encontrados.map(e => [e.codigo, e.producto]));
+            
+            // Un escaneo = una unidad, en el orden en que se leyeron
+            codigos.forEach(codigo => {
+                const producto = porCodigo.get(codigo.replace(/[\x00-\x1f\x7f]/g, '').trim());
+                if (producto) {
+                    this.agregarProductoAlTicket(producto);
+                }
+            });
+            
+            if (data.no_encontrados.length > 0) {
+                this.showNotification(`${data.no_encontrados.length} código(s) no encontrados en el inventario`, 'error');
+            }
+            const statusText = document.getElementById('scannerStatusText');
+            if (statusText && this.colaEscaneos.length === 0) {
+                statusText.textContent = `✅ ${data.encontrados.length} producto(s) agregados - Siga escaneando`;
+                document.getElementById('qrScannerStatus').className = 'scanner-status success';
+            }
+        } catch (error) {
+            console.error('❌ Error enviando escaneos:', error);
+            this.showNotification('Error buscando los productos escaneados', 'error');
+        }
+    }
+    
     productoEscaneado(producto) {
         console.log('🔄 productoEscaneado llamado con:', producto);
         console.log('🆔 currentTicketId:', this.currentTicketId);
@@ -1901,7 +2077,7 @@ class AlmacenApp {
             
             // Recargar tickets y actualizar contadores
             await this.loadTickets();
-            this.loadProductos(); // Recargar productos para actualizar inventario
+            this.sincronizarProductos(); // Recargar productos para actualizar inventario
             
         } catch (error) {
             console.error('Error procesando entrega:', error);
@@ -2123,6 +2299,10 @@ class AlmacenApp {
             // Recargar tickets y actualizar contadores
             await this.loadTickets();
             
+            // Las devoluciones en buen estado cambian el inventario
+            this.sincronizarProductos();
+            this.loadEstadisticas();
+            
         } catch (error) {
             console.error('❌ Error en confirmarTodasDevoluciones:', error);
             this.showNotification('Error al procesar devoluciones', 'error');
@@ -2168,7 +2348,7 @@ class AlmacenApp {
         
         // Cargar datos si es necesario
         if (seccionId === 'products-section') {
-            this.loadProductos();
+            this.sincronizarProductos();
         } else if (seccionId === 'tickets-section') {
             this.loadTickets();
         } else if (seccionId === 'historial-section') {
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark de búsqueda de productos: LIKE '%x%' vs índice FTS5 y trigramas
+
+Crea una base temporal con el esquema actual (todas las migraciones),
+carga productos sintéticos y mide las dos rutas de backend/busqueda.py
+con las mismas consultas. LIKE recorre toda la tabla en cada búsqueda;
+FTS5 solo lee las listas de términos que coinciden. Después mide la
+búsqueda difusa (trigramas.py) con nombres mal escritos: carga inicial,
+consultas y actualización incremental tras un cambio.
+
+Uso (desde la raíz del proyecto):
+    python scripts/benchmark_busqueda.py [--productos 50000] [--repeticiones 50]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from busqueda import ids_fts, ids_like  # noqa: E402
+from migrations import aplicar_migraciones  # noqa: E402
+from trigramas import IndiceTrigramas  # noqa: E402
+
+TIPOS = ["Broca", "Fresa", "Inserto", "Machuelo", "Rima", "Buril", "Porta inserto", "Boquilla", "Cortador", "Avellanador"]
+MATERIALES = ["carburo", "HSS", "cobalto", "diamante", "cerámica"]
+MEDIDAS = ["1/8", "1/4", "3/8", "1/2", "3/4", "1", "2 mm", "3 mm", "6 mm", "10 mm", "12 mm"]
+CATEGORIAS = ["Brocas", "Fresas", "Insertos", "Machuelos", "Rimas", "Herramental", "Sujeción"]
+
+CONSULTAS = ["broca", "fresa carb", "inserto 3", "cobalto 1/2", "sujecion", "zzz"]
+CONSULTAS_DIFUSAS = ["brocca", "machuelo 1/4", "frsa carburo", "insreto", "abellanador cobalto"]
+
+def preparar_base_datos(total):
+    tmp_dir = tempfile.mkdtemp(prefix="bench_busqueda_")
+    ruta = os.path.join(tmp_dir, "almacen_bench.db")
+    conn = sqlite3.connect(ruta)
+    conn.execute("PRAGMA journal_mode=WAL")
+    aplicar_migraciones(conn)
+
+    random.seed(42)
+    filas = []
+    for i in range(total):
+        tipo = random.choice(TIPOS)
+        nombre = f"{tipo} {random.choice(MEDIDAS)} {random.choice(MATERIALES)} #{i}"
+        filas.append((
+            f"BM{i:010d}", nombre, f"{tipo} para torno CNC, lote {i % 97}",
+            random.randint(0, 50), random.choice(CATEGORIAS), f"{chr(65 + i % 26)}{i % 10 + 1:02d}"
+        ))
+    inicio = time.perf_counter()
+    conn.execute("BEGIN")
+    conn.executemany("""
+        INSERT INTO productos (codigo_barras, nombre, descripcion, cantidad, categoria, ubicacion)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, filas)
+    conn.commit()
+    print(f"📦 {total} productos cargados en {time.perf_counter() - inicio:.1f} s (incluye triggers FTS)")
+    conn.row_factory = sqlite3.Row
+    return tmp_dir, conn
+
+def medir(fn, conn, consulta, repeticiones):
+    tiempos = []
+    resultados = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultados = fn(conn, consulta, 20)
+        tiempos.append(time.perf_counter() - inicio)
+    tiempos.sort()
+    return tiempos[len(tiempos) // 2] * 1000, tiempos[int(len(tiempos) * 0.95) - 1] * 1000, len(resultados)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LIKE vs FTS5")
+    parser.add_argument("--productos", type=int, default=50000)
+    parser.add_argument("--repeticiones", type=int, default=50)
+    args = parser.parse_args()
+
+    print("🔎 Benchmark de búsqueda de productos")
+    print("=" * 78)
+    tmp_dir, conn = preparar_base_datos(args.productos)
+    try:
+        print(f"\n{'consulta':<16}{'LIKE p50':>11}{'LIKE p95':>11}{'filas':>7}{'FTS p50':>11}{'FTS p95':>11}{'filas':>7}{'x':>8}")
+        for consulta in CONSULTAS:
+            like_p50, like_p95, like_filas = medir(ids_like, conn, consulta, args.repeticiones)
+            fts_p50, fts_p95, fts_filas = medir(ids_fts, conn, consulta, args.repeticiones)
+            mejora = like_p50 / fts_p50 if fts_p50 else float("inf")
+            print(f"{consulta:<16}{like_p50:>9.2f}ms{like_p95:>9.2f}ms{like_filas:>7}"
+                  f"{fts_p50:>9.2f}ms{fts_p95:>9.2f}ms{fts_filas:>7}{mejora:>7.1f}x")
+        print("\nNota: LIKE busca la subcadena exacta en nombre y código; FTS5 busca")
+        print("cada palabra como prefijo en todas las columnas y ordena por relevancia.")
+
+        print("\n🔤 Búsqueda difusa por trigramas")
+        indice = IndiceTrigramas()
+        inicio = time.perf_counter()
+        indice.actualizar(conn)
+        print(f"Carga inicial: {(time.perf_counter() - inicio) * 1000:.0f} ms "
+              f"({indice.stats()['palabras']} palabras, {indice.stats()['trigramas']} trigramas)")
+
+        def difusa(conn, consulta, limit):
+            indice.actualizar(conn)
+            return indice.buscar(consulta, limit)
+
+        print(f"\n{'consulta':<22}{'p50':>9}{'p95':>9}  mejor resultado")
+        for consulta in CONSULTAS_DIFUSAS:
+            p50, p95, _ = medir(difusa, conn, consulta, args.repeticiones)
+            mejores = indice.buscar(consulta, 1)
+            nombre = conn.execute("SELECT nombre FROM productos WHERE id = ?", (mejores[0][0],)).fetchone()[0] if mejores else "-"
+            similitud = f" ({mejores[0][1]:.2f})" if mejores else ""
+            print(f"{consulta:<22}{p50:>7.2f}ms{p95:>7.2f}ms  {nombre}{similitud}")
+
+        conn.execute("UPDATE productos SET nombre = 'Avellanador especial' WHERE id = 1")
+        conn.commit()
+        inicio = time.perf_counter()
+        indice.actualizar(conn)
+        print(f"\nActualización incremental (1 producto cambiado): {(time.perf_counter() - inicio) * 1000:.2f} ms")
+    finally:
+        conn.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Benchmark de latencia por petición: conexión por llamada vs settings + pool
+
+"Antes" reproduce el get_db_connection() original: sin BRANCH definido se
+ejecuta git para detectar la rama, se abre una conexión nueva y se corren
+los seis PRAGMAs, dos veces por petición autenticada (validate_session y
+el endpoint). "Después" resuelve la configuración una sola vez y presta
+conexiones del pool.
+
+Uso (desde la raíz del proyecto):
+    python scripts/benchmark_conexiones.py [--peticiones 300] [--db data/almacen_main.db]
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from settings import get_current_git_branch, load_settings  # noqa: E402
+from db_pool import ConnectionPool, PRAGMAS  # noqa: E402
+
+def preparar_base_datos(origen):
+    """Copiar la base de datos a un directorio temporal para no modificarla"""
+    tmp_dir = tempfile.mkdtemp(prefix="bench_conexiones_")
+    destino = os.path.join(tmp_dir, "almacen_bench.db")
+    if origen and os.path.exists(origen):
+        shutil.copy2(origen, destino)
+    else:
+        conn = sqlite3.connect(destino)
+        conn.executescript("""
+            CREATE TABLE usuarios (id INTEGER PRIMARY KEY, username TEXT, nombre_completo TEXT, rol TEXT, activo BOOLEAN DEFAULT 1);
+            CREATE TABLE sesiones (id INTEGER PRIMARY KEY, usuario_id INTEGER, token TEXT UNIQUE, fecha_expiracion TIMESTAMP, activa BOOLEAN DEFAULT 1);
+            CREATE TABLE productos (id INTEGER PRIMARY KEY, nombre TEXT, cantidad INTEGER);
+            INSERT INTO usuarios (id, username, nombre_completo, rol) VALUES (1, 'admin', 'Administrador', 'admin');
+        """)
+        conn.executemany("INSERT INTO productos (nombre, cantidad) VALUES (?, ?)",
+                         [(f"Herramienta {i}", i % 50) for i in range(500)])
+        conn.commit()
+        conn.close()
+
+    conn = sqlite3.connect(destino)
+    conn.execute("INSERT OR REPLACE INTO sesiones (usuario_id, token, fecha_expiracion, activa) VALUES (1, 'bench-token', '2999-01-01T00:00:00+00:00', 1)")
+    conn.commit()
+    conn.close()
+    return tmp_dir, destino
+
+def consultas_peticion(conn_sesion, conn_endpoint):
+    """Consultas de una petición autenticada típica"""
+    conn_sesion.execute("""
+        SELECT s.*, u.username, u.nombre_completo, u.rol, u.activo
+        FROM sesiones s
+        JOIN usuarios u ON s.usuario_id = u.id
+        WHERE s.token = ? AND s.activa = 1
+    """, ("bench-token",)).fetchone()
+    conn_endpoint.execute("SELECT COUNT(*) FROM productos").fetchone()
+
+def conexion_antes(db_path):
+    """Equivalente al get_db_connection() original"""
+    branch = os.getenv("BRANCH") or get_current_git_branch()
+    _ = "almacen_desarrollo.db" if branch.lower() == "desarrollo" else "almacen_main.db"
+    conn = sqlite3.connect(db_path, timeout=60.0)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def medir(nombre, peticion, n):
+    tiempos = []
+    for _ in range(n):
+        inicio = time.perf_counter()
+        peticion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    resultado = {
+        "promedio": statistics.mean(tiempos),
+        "p50": tiempos[len(tiempos) // 2],
+        "p95": tiempos[int(len(tiempos) * 0.95) - 1],
+        "p99": tiempos[int(len(tiempos) * 0.99) - 1],
+    }
+    print(f"   {nombre:<28} promedio {resultado['promedio']:8.3f} ms | p50 {resultado['p50']:8.3f} | "
+          f"p95 {resultado['p95']:8.3f} | p99 {resultado['p99']:8.3f}")
+    return resultado
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de conexiones a la base de datos")
+    parser.add_argument("--peticiones", type=int, default=300)
+    parser.add_argument("--db", default=os.path.join("data", "almacen_main.db"))
+    args = parser.parse_args()
+
+    print("⏱️  Benchmark de latencia por petición autenticada")
+    print("=" * 60)
+
+    tmp_dir, db_path = preparar_base_datos(args.db)
+    try:
+        def peticion_antes():
+            conn_sesion = conexion_antes(db_path)
+            conn_endpoint = conexion_antes(db_path)
+            consultas_peticion(conn_sesion, conn_endpoint)
+            conn_sesion.close()
+            conn_endpoint.close()
+
+        settings = load_settings()
+        pool = ConnectionPool(db_path, settings.db_pool_readers, settings.db_pool_timeout)
+
+        def peticion_despues():
+            with pool.reader() as conn_sesion, pool.reader() as conn_endpoint:
+                consultas_peticion(conn_sesion, conn_endpoint)
+
+        env_branch = os.environ.pop("BRANCH", None)
+        try:
+            print(f"\n📊 {args.peticiones} peticiones (BRANCH sin definir, rama detectada: {get_current_git_branch()})")
+            antes = medir("Antes (git + conexión nueva)", peticion_antes, args.peticiones)
+            despues = medir("Después (settings + pool)", peticion_despues, args.peticiones)
+        finally:
+            if env_branch is not None:
+                os.environ["BRANCH"] = env_branch
+
+        print(f"\n🚀 Mejora en latencia promedio: {antes['promedio'] / despues['promedio']:.1f}x")
+        stats = pool.stats()
+        print(f"🔌 Pool: {stats['lectores']['creados']} conexiones de lectura, "
+              f"{stats['lectores']['checkouts']} préstamos, {stats['lectores']['esperas']} esperas")
+        pool.close()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Benchmark de escrituras en ráfaga: transacción por petición vs commit agrupado
+
+"Antes" reproduce el comportamiento original: cada petición abre su propia
+transacción y compite por el candado de escritura de SQLite (busy_timeout).
+"Después" envía las mismas operaciones al hilo escritor de db_writer, que
+las agrupa en una sola transacción con un SAVEPOINT por operación.
+
+También comprueba que una operación que falla dentro de un lote no revierte
+las demás.
+
+Uso (desde la raíz del proyecto):
+    python scripts/benchmark_escrituras.py [--hilos 16] [--operaciones 50] [--db data/almacen_main.db]
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from db_pool import ConnectionPool, PRAGMAS  # noqa: E402
+from db_writer import WriteQueue  # noqa: E402
+
+def preparar_base_datos(origen):
+    """Copiar la base de datos a un directorio temporal para no modificarla"""
+    tmp_dir = tempfile.mkdtemp(prefix="bench_escrituras_")
+    destino = os.path.join(tmp_dir, "almacen_bench.db")
+    if origen and os.path.exists(origen):
+        shutil.copy2(origen, destino)
+    conn = sqlite3.connect(destino)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS bench_escrituras (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hilo INTEGER,
+            valor TEXT UNIQUE,
+            fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+    conn.close()
+    return tmp_dir, destino
+
+def escribir(conn, hilo, i):
+    """Operación típica de un endpoint: un INSERT y un UPDATE"""
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO bench_escrituras (hilo, valor) VALUES (?, ?)", (hilo, f"{hilo}-{i}"))
+    cursor.execute("UPDATE bench_escrituras SET fecha = CURRENT_TIMESTAMP WHERE id = ?", (cursor.lastrowid,))
+    return cursor.lastrowid
+
+def antes(db_path, hilos, operaciones):
+    """Cada operación abre su transacción en una conexión propia del hilo"""
+    errores = []
+
+    def trabajador(hilo):
+        conn = sqlite3.connect(db_path, timeout=60.0)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        for i in range(operaciones):
+            try:
+                escribir(conn, hilo, i)
+                conn.commit()
+            except sqlite3.OperationalError as e:
+                conn.rollback()
+                errores.append(str(e))
+        conn.close()
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=hilos) as executor:
+        list(executor.map(trabajador, range(hilos)))
+    return time.perf_counter() - inicio, errores
+
+def despues(db_path, hilos, operaciones):
+    """Las mismas operaciones a través del hilo escritor"""
+    pool = ConnectionPool(db_path)
+    cola = WriteQueue(pool)
+    errores = []
+
+    def trabajador(hilo):
+        futuros = []
+        for i in range(operaciones):
+            futuros.append(cola.submit(escribir, hilo + 1000, i))
+            # Simular peticiones independientes: esperar de vez en cuando
+            if i % 4 == 3:
+                for f in futuros:
+                    f.result()
+                futuros = []
+        for f in futuros:
+            try:
+                f.result()
+            except sqlite3.OperationalError as e:
+                errores.append(str(e))
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=hilos) as executor:
+        list(executor.map(trabajador, range(hilos)))
+    total = time.perf_counter() - inicio
+
+    # Una operación fallida no debe revertir las demás del mismo lote
+    ok = cola.submit(escribir, 9999, 0)
+    duplicada = cola.submit(escribir, 9999, 0)
+    ok.result()
+    try:
+        duplicada.result()
+        aislamiento = False
+    except sqlite3.IntegrityError:
+        aislamiento = True
+
+    stats = cola.stats()
+    cola.close()
+    pool.close()
+    return total, errores, stats, aislamiento
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de escrituras concurrentes")
+    parser.add_argument("--hilos", type=int, default=16)
+    parser.add_argument("--operaciones", type=int, default=50)
+    parser.add_argument("--db", default=os.path.join("data", "almacen_main.db"))
+    args = parser.parse_args()
+
+    total_ops = args.hilos * args.operaciones
+    print("✍️  Benchmark de escrituras en ráfaga")
+    print("=" * 60)
+
+    tmp_dir, db_path = preparar_base_datos(args.db)
+    try:
+        t_antes, errores_antes = antes(db_path, args.hilos, args.operaciones)
+        t_despues, errores_despues, stats, aislamiento = despues(db_path, args.hilos, args.operaciones)
+
+        print(f"\n📊 {total_ops} escrituras desde {args.hilos} hilos")
+        print(f"   Antes (transacción por petición)  {t_antes * 1000:8.0f} ms | "
+              f"{total_ops / t_antes:8.0f} ops/s | {len(errores_antes)} errores 'database is locked'")
+        print(f"   Después (commit agrupado)         {t_despues * 1000:8.0f} ms | "
+              f"{total_ops / t_despues:8.0f} ops/s | {len(errores_despues)} errores")
+        print(f"\n🚀 Mejora en throughput: {t_antes / t_despues:.1f}x")
+        print(f"📦 Lotes: {stats['lotes']} (promedio {stats['lote_promedio']} ops, máximo {stats['lote_max']})")
+        print(f"🛡️  Operación fallida aislada dentro del lote: {'sí' if aislamiento else 'NO'}")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
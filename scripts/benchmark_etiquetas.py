@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la hoja de etiquetas: escalamiento con el número de procesos
+
+Genera las imágenes (QR y Code128) de N etiquetas sintéticas repartidas
+entre 1, 2, ... procesos, como hace /api/etiquetas/lote cuando las
+imágenes no están en la tabla imagenes, y mide aparte el acomodo del PDF
+(que solo coloca imágenes ya hechas). No usa la base de datos.
+
+Uso (desde la raíz del proyecto):
+    python scripts/benchmark_etiquetas.py [--etiquetas 1000] [--procesos 1,2,4]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from codigos import renderizar_codigos, trabajos_producto  # noqa: E402
+from hojas_etiquetas import dibujar_hoja_etiquetas, repartir  # noqa: E402
+
+def productos_sinteticos(total):
+    return [{"id": i, "nombre": f"Broca {i % 13}/16 cobalto #{i}", "codigo_barras": None,
+             "ubicacion": f"{chr(65 + i % 26)}{i % 10 + 1:02d}"} for i in range(1, total + 1)]
+
+def renderizar(trabajos, procesos):
+    """Generar todas las imágenes con `procesos` procesos; devuelve {clave: datos} y segundos"""
+    partes = repartir(trabajos, procesos)
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context("spawn")) as executor:
+        # Arrancar los procesos antes de medir
+        list(executor.map(renderizar_codigos, [[]] * procesos))
+        inicio = time.perf_counter()
+        resultados = list(executor.map(renderizar_codigos, partes))
+        duracion = time.perf_counter() - inicio
+    return {clave: datos for parte in resultados for clave, datos, _ in parte}, duracion
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la hoja de etiquetas en PDF")
+    parser.add_argument("--etiquetas", type=int, default=1000)
+    cpus = os.cpu_count() or 1
+    por_defecto = ",".join(str(n) for n in sorted({1, 2, 4, cpus}) if n <= cpus)
+    parser.add_argument("--procesos", default=por_defecto, help="lista separada por comas")
+    args = parser.parse_args()
+
+    print("🏷️ Benchmark de hoja de etiquetas")
+    print("=" * 60)
+    productos = productos_sinteticos(args.etiquetas)
+    por_producto = [trabajos_producto(p["id"], p["nombre"], p["codigo_barras"]) for p in productos]
+    trabajos = [(clave, tipo, contenido) for lista in por_producto for clave, tipo, _, contenido in lista]
+    print(f"📦 {args.etiquetas} etiquetas, {len(trabajos)} imágenes, {cpus} núcleos")
+
+    primera = None
+    imagenes = {}
+    for procesos in (int(n) for n in args.procesos.split(",") if n.strip()):
+        imagenes, duracion = renderizar(trabajos, procesos)
+        primera = primera or duracion
+        print(f"   {procesos} procesos: {duracion:.2f} s ({len(trabajos) / duracion:.0f} imágenes/s, "
+              f"{primera / duracion:.2f}x)")
+
+    etiquetas = [(p["nombre"], p["ubicacion"], imagenes.get(qr[0]), imagenes.get(barras[0]))
+                 for p, (qr, barras) in zip(productos, por_producto)]
+    inicio = time.perf_counter()
+    pdf = dibujar_hoja_etiquetas(etiquetas)
+    duracion = time.perf_counter() - inicio
+    print(f"📄 Acomodo del PDF: {duracion:.2f} s, {len(pdf) / 1024:.0f} KB")
+
+if __name__ == "__main__":
+    main()
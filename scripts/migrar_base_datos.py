@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Aplicar las migraciones de esquema pendientes a una base de datos
+
+El servidor aplica las migraciones al arrancar; este script sirve para
+hacerlo a mano (por ejemplo antes de un despliegue) con un backup previo.
+Reemplaza a los antiguos scripts migrar_eliminar_aprobacion.py, que ahora
+son la migración 2 de backend/migrations.py.
+
+Uso (desde la raíz del proyecto):
+    python scripts/migrar_base_datos.py [--db data/almacen_main.db] [--sin-backup]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from migrations import MIGRACIONES, VERSION_ACTUAL, aplicar_migraciones, obtener_version  # noqa: E402
+
+def backup_database(db_path):
+    """Crea una copia de seguridad de la base de datos"""
+    backup_path = f"{db_path}.backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    conn = sqlite3.connect(db_path)
+    destino = sqlite3.connect(backup_path)
+    conn.backup(destino)
+    destino.close()
+    conn.close()
+    print(f"✅ Backup creado: {backup_path}")
+    return backup_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Migraciones de esquema")
+    branch = os.environ.get('BRANCH', 'main')
+    db_default = os.path.join("data", "almacen_desarrollo.db" if branch == "desarrollo" else "almacen_main.db")
+    parser.add_argument("--db", default=db_default)
+    parser.add_argument("--sin-backup", action="store_true")
+    args = parser.parse_args()
+
+    print("🚀 Migraciones de esquema")
+    print("=" * 60)
+
+    if not os.path.exists(args.db):
+        print(f"❌ Base de datos no encontrada: {args.db}")
+        sys.exit(1)
+
+    conn = sqlite3.connect(args.db, timeout=60.0)
+    version = obtener_version(conn)
+    print(f"📁 Base de datos: {args.db}")
+    print(f"📋 Versión actual: {version} / {VERSION_ACTUAL}")
+
+    pendientes = [m for m in MIGRACIONES if m[0] > version]
+    if not pendientes:
+        print("✅ El esquema ya está al día")
+        conn.close()
+        return
+
+    for numero, descripcion, _ in pendientes:
+        print(f"   - {numero}: {descripcion}")
+
+    backup_path = None if args.sin_backup else backup_database(args.db)
+    try:
+        aplicar_migraciones(conn)
+        print(f"\n🎉 Esquema en versión {obtener_version(conn)}")
+    except Exception as e:
+        print(f"\n❌ Error durante la migración: {e}")
+        if backup_path:
+            print(f"🔄 Puedes restaurar desde el backup: {backup_path}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
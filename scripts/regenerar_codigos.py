@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Generar los QR y códigos de barras de todos los productos
+
+El servidor genera en segundo plano los códigos de productos nuevos o
+renombrados (cola codigos_pendientes); este script llena de una vez los
+de los productos que ya existían, repartiendo el dibujo de las imágenes
+entre varios procesos (uno por núcleo). Solo genera las imágenes que
+faltan en la tabla imagenes, salvo con --forzar. Se puede ejecutar con el
+servidor encendido.
+
+Uso (desde la raíz del proyecto):
+    python scripts/regenerar_codigos.py [--db data/almacen_main.db] [--procesos N] [--forzar]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from codigos import renderizar_codigos, trabajos_producto  # noqa: E402
+from migrations import obtener_version  # noqa: E402
+
+# Versión del esquema con la tabla codigos_pendientes
+VERSION_REQUERIDA = 9
+
+def leer_trabajos(conn, forzar):
+    """Imágenes por generar [(clave, tipo, media_type, contenido)] y pendientes de la cola"""
+    existentes = set() if forzar else {row[0] for row in conn.execute("SELECT hash FROM imagenes")}
+    trabajos = {}
+    productos = 0
+    for producto_id, nombre, codigo_barras in conn.execute("SELECT id, nombre, codigo_barras FROM productos ORDER BY id"):
+        productos += 1
+        for trabajo in trabajos_producto(producto_id, nombre, codigo_barras):
+            if trabajo[0] not in existentes:
+                trabajos[trabajo[0]] = trabajo
+    pendientes = conn.execute("SELECT producto_id, solicitud FROM codigos_pendientes WHERE estado = 'pendiente'").fetchall()
+    return productos, list(trabajos.values()), pendientes
+
+def main():
+    parser = argparse.ArgumentParser(description="Generar QR y códigos de barras de todos los productos")
+    branch = os.environ.get('BRANCH', 'main')
+    db_default = os.path.join("data", "almacen_desarrollo.db" if branch == "desarrollo" else "almacen_main.db")
+    parser.add_argument("--db", default=db_default)
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--lote", type=int, default=200, help="imágenes por tarea de cada proceso")
+    parser.add_argument("--forzar", action="store_true", help="volver a generar aunque ya existan")
+    args = parser.parse_args()
+
+    print("🏷️ Generación de QR y códigos de barras")
+    print("=" * 60)
+
+    if not os.path.exists(args.db):
+        print(f"❌ Base de datos no encontrada: {args.db}")
+        sys.exit(1)
+
+    conn = sqlite3.connect(args.db, timeout=60.0)
+    try:
+        if obtener_version(conn) < VERSION_REQUERIDA:
+            print(f"❌ El esquema debe estar en la versión {VERSION_REQUERIDA}: ejecuta scripts/migrar_base_datos.py")
+            sys.exit(1)
+
+        productos, trabajos, pendientes = leer_trabajos(conn, args.forzar)
+        print(f"📁 Base de datos: {args.db}")
+        print(f"📦 {productos} productos, {len(trabajos)} imágenes por generar con {args.procesos} procesos")
+
+        inicio = time.perf_counter()
+        generadas = 0
+        errores = []
+        if trabajos:
+            por_clave = {t[0]: t for t in trabajos}
+            tareas = [[(clave, tipo, contenido) for clave, tipo, _, contenido in trabajos[i:i + args.lote]]
+                      for i in range(0, len(trabajos), args.lote)]
+            insertar = "INSERT OR REPLACE" if args.forzar else "INSERT OR IGNORE"
+            with ProcessPoolExecutor(max_workers=max(1, args.procesos)) as executor:
+                futuros = [executor.submit(renderizar_codigos, tarea) for tarea in tareas]
+                for futuro in as_completed(futuros):
+                    filas = []
+                    for clave, datos, error in futuro.result():
+                        if error is not None:
+                            errores.append((por_clave[clave][3], error))
+                            continue
+                        _, tipo, media_type, _ = por_clave[clave]
+                        filas.append((clave, tipo, media_type, datos, len(datos)))
+                    # Una transacción corta por tarea: el servidor puede seguir escribiendo
+                    with conn:
+                        conn.executemany(f"""
+                            {insertar} INTO imagenes (hash, tipo, media_type, datos, bytes)
+                            VALUES (?, ?, ?, ?, ?)
+                        """, filas)
+                    generadas += len(filas)
+                    print(f"   {generadas}/{len(trabajos)} imágenes", end="\r")
+            print()
+
+        # La cola que había al empezar ya quedó cubierta (si no se volvió a encolar)
+        if not errores:
+            with conn:
+                conn.executemany("DELETE FROM codigos_pendientes WHERE producto_id = ? AND solicitud = ?", pendientes)
+
+        duracion = time.perf_counter() - inicio
+        velocidad = f" ({generadas / duracion:.0f} imágenes/s)" if generadas and duracion else ""
+        print(f"✅ {generadas} imágenes generadas en {duracion:.1f} s{velocidad}")
+        if errores:
+            print(f"⚠️ {len(errores)} imágenes con error:")
+            for contenido, error in errores[:20]:
+                print(f"   - {contenido}: {error}")
+            sys.exit(1)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
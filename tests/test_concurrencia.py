@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba de concurrencia del servidor con la capa de datos no bloqueante
+Sistema de Inventario - Empresa de Maquinados
+
+Levanta uvicorn en otro proceso sobre una copia temporal del backend con
+una base de datos nueva (la real no se toca). Mientras varios hilos
+descargan PDFs de tickets que todavía no están en caché y crean tickets
+nuevos, los inicios de sesión y /api/productos deben responder casi como
+sin carga. Si sqlite3 o reportlab bloquearan el event loop, cada petición
+rápida esperaría a que terminara la lenta que se está atendiendo.
+
+Se compara la mediana de latencia de cada petición rápida con su línea
+base medida en el mismo servidor, así que no depende de la velocidad de
+la máquina.
+"""
+
+import hashlib
+import os
+import shutil
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Las peticiones rápidas durante la carga pueden tardar a lo más esto
+# veces su línea base, más una holgura fija para el ruido del scheduler
+FACTOR_MAXIMO = 3
+HOLGURA_MS = 8
+# Tickets cuyos PDFs se generan durante la prueba (cada uno una sola vez)
+TICKETS = 60
+# Herramientas por ticket: un PDF con tabla completa tarda decenas de ms
+ITEMS_TICKET = 30
+MUESTRAS = 30
+# Pausa entre mediciones para no saturar el servidor con ellas
+PAUSA_MEDICION = 0.01
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def mediana_ms(fn, veces):
+    tiempos = []
+    for _ in range(veces):
+        inicio = time.perf_counter()
+        r = fn()
+        r.raise_for_status()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+class Servidor:
+    def __init__(self, base, admin, sup, producto_ids):
+        self.base = base
+        self.admin = admin
+        self.sup = sup
+        self.producto_ids = producto_ids
+
+    def productos(self):
+        return self.admin.get(f"{self.base}/api/productos", params={"limit": 100}, timeout=60)
+
+    def login(self):
+        return requests.post(f"{self.base}/api/auth/login",
+                             json={"username": "admin", "password": "admin123"}, timeout=60)
+
+    def crear_ticket(self, orden):
+        return self.sup.post(f"{self.base}/api/tickets", json={
+            "orden_produccion": str(orden),
+            "justificacion": "Prueba de concurrencia",
+            "items": [{"producto_id": producto_id, "cantidad_solicitada": 1} for producto_id in self.producto_ids]
+        }, timeout=60)
+
+@pytest.fixture(scope="module")
+def servidor():
+    tmp_dir = tempfile.mkdtemp(prefix="prueba_concurrencia_")
+    for carpeta in ("backend", "frontend"):
+        shutil.copytree(os.path.join(RAIZ, carpeta), os.path.join(tmp_dir, carpeta),
+                        ignore=shutil.ignore_patterns("__pycache__"))
+    os.makedirs(os.path.join(tmp_dir, "data"))
+
+    puerto = puerto_libre()
+    entorno = dict(os.environ, ALERT_SYSTEM_ENABLED="false", BRANCH="main")
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(puerto), "--log-level", "warning"],
+        cwd=os.path.join(tmp_dir, "backend"), env=entorno
+    )
+    base = f"http://127.0.0.1:{puerto}"
+    try:
+        for _ in range(300):
+            try:
+                requests.get(f"{base}/api/auth/check", timeout=1)
+                break
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        else:
+            pytest.fail("El servidor no arrancó")
+
+        conn = sqlite3.connect(os.path.join(tmp_dir, "data", "almacen_main.db"))
+        conn.execute("""
+            INSERT OR IGNORE INTO usuarios (username, password_hash, nombre_completo, rol)
+            VALUES ('prueba_sup', ?, 'Supervisor de Prueba', 'supervisor')
+        """, (hashlib.sha256(b"prueba_sup").hexdigest(),))
+        conn.commit()
+        conn.close()
+
+        admin = requests.Session()
+        admin.post(f"{base}/api/auth/login", json={"username": "admin", "password": "admin123"}, timeout=30).raise_for_status()
+        sup = requests.Session()
+        sup.post(f"{base}/api/auth/login", json={"username": "prueba_sup", "password": "prueba_sup"}, timeout=30).raise_for_status()
+        producto_ids = []
+        for i in range(200):
+            r = admin.post(f"{base}/api/productos", json={"nombre": f"Broca {i}", "cantidad": 100000}, timeout=30)
+            r.raise_for_status()
+            producto_ids.append(r.json()["id"])
+        yield Servidor(base, admin, sup, producto_ids[:ITEMS_TICKET])
+    finally:
+        proceso.terminate()
+        proceso.wait(timeout=30)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def durante(carga, hilos, medir):
+    """Ejecutar carga() en varios hilos y medir mientras dura; (mediana ms, muestras)"""
+    errores = []
+
+    def trabajar():
+        try:
+            carga()
+        except Exception as e:
+            errores.append(e)
+
+    trabajadores = [threading.Thread(target=trabajar) for _ in range(hilos)]
+    for hilo in trabajadores:
+        hilo.start()
+    tiempos = []
+    while any(hilo.is_alive() for hilo in trabajadores):
+        inicio = time.perf_counter()
+        medir().raise_for_status()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        time.sleep(PAUSA_MEDICION)
+    for hilo in trabajadores:
+        hilo.join()
+    assert not errores, errores
+    return statistics.median(tiempos), len(tiempos)
+
+def test_pdfs_y_tickets_no_frenan_las_peticiones_rapidas(servidor):
+    # Calentar el snapshot del catálogo y medir sin carga
+    servidor.productos().raise_for_status()
+    base_productos = mediana_ms(servidor.productos, MUESTRAS)
+    base_login = mediana_ms(servidor.login, MUESTRAS)
+
+    # Tickets nuevos: sus PDFs no están en caché y se generan durante la prueba
+    ordenes = iter(range(10000, 10000 + TICKETS))
+    lock = threading.Lock()
+    ticket_ids = []
+
+    def crear_tickets():
+        while True:
+            with lock:
+                orden = next(ordenes, None)
+            if orden is None:
+                return
+            r = servidor.crear_ticket(orden)
+            assert r.status_code == 200, r.text
+            with lock:
+                ticket_ids.append(r.json()["id"])
+
+    def descargar_pdfs():
+        while True:
+            with lock:
+                if not pendientes:
+                    return
+                ticket_id = pendientes.pop()
+            r = servidor.sup.get(f"{servidor.base}/api/tickets/{ticket_id}/pdf", timeout=60)
+            r.raise_for_status()
+            assert r.content.startswith(b"%PDF")
+
+    productos_tickets, n = durante(crear_tickets, 3, servidor.productos)
+    assert len(ticket_ids) == TICKETS
+    assert productos_tickets <= FACTOR_MAXIMO * base_productos + HOLGURA_MS, (productos_tickets, base_productos, n)
+
+    pendientes = list(ticket_ids)
+    productos_pdf, n = durante(descargar_pdfs, 3, servidor.productos)
+    assert n >= 10, "los PDFs terminaron antes de poder medir"
+    assert productos_pdf <= FACTOR_MAXIMO * base_productos + HOLGURA_MS, (productos_pdf, base_productos, n)
+
+    # Otros tickets, también sin PDF en caché, para medir los inicios de sesión
+    ticket_ids.clear()
+    ordenes = iter(range(20000, 20000 + TICKETS))
+    crear_tickets()
+    pendientes = list(ticket_ids)
+    login_pdf, n = durante(descargar_pdfs, 3, servidor.login)
+    assert n >= 10, "los PDFs terminaron antes de poder medir"
+    assert login_pdf <= FACTOR_MAXIMO * base_login + HOLGURA_MS, (login_pdf, base_login, n)
+
+    estadisticas = servidor.admin.get(f"{servidor.base}/api/sistema/pool", timeout=30).json()
+    # Los PDFs se generaron en el pool de procesos, no en el event loop
+    assert estadisticas["ejecutores"]["procesos"]["tareas"]["generar_pdf_ticket"]["completados"] == 2 * TICKETS
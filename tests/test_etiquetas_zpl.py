@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pruebas de las etiquetas ZPL contra archivos de referencia (tests/golden)
+Sistema de Inventario - Empresa de Maquinados
+
+La salida de etiquetas.py depende solo de los datos del producto, así que
+se compara byte por byte con el .zpl guardado. Si el diseño cambia a
+propósito, regenerar las referencias con:
+
+    ACTUALIZAR_GOLDEN=1 python -m pytest tests/test_etiquetas_zpl.py
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from etiquetas import etiqueta_zpl, etiquetas_zpl
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+
+BROCA = {"id": 26, "nombre": "Broca 9.0", "codigo_barras": "7501234567890", "ubicacion": "C06"}
+INSERTO = {"id": 41, "nombre": "Inserto ^CNMG_120408~PM", "codigo_barras": "CNMG^120408", "ubicacion": "A_01"}
+MACHUELO = {"id": 57, "nombre": "Machuelo métrico M8 × 1.25 (acero rápido)", "codigo_barras": "7509876543210", "ubicacion": "Almacén 2"}
+SIN_DATOS = {"id": 7, "nombre": "Llave Allen 5/32", "codigo_barras": None, "ubicacion": None}
+BLANCOS = {"id": 1234, "nombre": "Rondana   plana\n3/8", "codigo_barras": "   ", "ubicacion": ""}
+
+def comparar_golden(nombre: str, zpl: str):
+    """Comparar con tests/golden/<nombre>.zpl (o reescribirlo con ACTUALIZAR_GOLDEN=1)"""
+    ruta = os.path.join(GOLDEN_DIR, f"{nombre}.zpl")
+    if os.environ.get("ACTUALIZAR_GOLDEN"):
+        with open(ruta, "w", encoding="utf-8", newline="") as archivo:
+            archivo.write(zpl)
+    with open(ruta, encoding="utf-8", newline="") as archivo:
+        assert zpl == archivo.read()
+
+def test_producto_simple():
+    zpl = etiqueta_zpl(BROCA)
+    comparar_golden("producto_simple", zpl)
+    assert "^PQ" not in zpl
+
+def test_caracteres_reservados():
+    zpl = etiqueta_zpl(INSERTO)
+    comparar_golden("caracteres_reservados", zpl)
+    # Cada campo va con ^FH_ y los datos no abren comandos nuevos
+    for linea in zpl.splitlines():
+        if "^FD" in linea:
+            datos = linea.split("^FD", 1)[1][:-len("^FS")]
+            assert "^" not in datos and "~" not in datos
+            assert "^FH_^FD" in linea
+    assert "Inserto _5ECNMG_5F120408_7EPM" in zpl
+
+def test_acentos():
+    zpl = etiqueta_zpl(MACHUELO)
+    comparar_golden("acentos", zpl)
+    # ^CI28: la impresora interpreta los campos como UTF-8, el texto va sin cambios
+    assert "^CI28" in zpl
+    assert "Machuelo métrico M8 × 1.25" in zpl
+    assert "Ubic: Almacén 2" in zpl
+
+def test_sin_ubicacion_ni_codigo():
+    zpl = etiqueta_zpl(SIN_DATOS)
+    comparar_golden("sin_ubicacion_ni_codigo", zpl)
+    assert "^FDUbic: -^FS" in zpl
+    assert "^FD000000000007^FS" in zpl
+    # Sin código propio el QR no lleva la parte |Codigo:
+    assert "^FDLA,ID:7|Nombre:Llave Allen 5/32^FS" in zpl
+
+def test_campos_en_blanco():
+    zpl = etiqueta_zpl(BLANCOS)
+    comparar_golden("campos_en_blanco", zpl)
+    assert "^FDRondana plana 3/8^FS" in zpl
+    assert "^FDUbic: -^FS" in zpl
+    assert "^FD000000001234^FS" in zpl
+
+def test_copias():
+    zpl = etiqueta_zpl(BROCA, copias=3)
+    comparar_golden("copias", zpl)
+    assert zpl.splitlines()[-2:] == ["^PQ3", "^XZ"]
+
+def test_lote_en_orden():
+    productos = [SIN_DATOS, BROCA, MACHUELO]
+    zpl = etiquetas_zpl(productos, copias=2)
+    comparar_golden("lote", zpl)
+    # Una etiqueta completa por producto, en el orden recibido
+    assert zpl == "".join(etiqueta_zpl(producto, 2) for producto in productos)
+    etiquetas = zpl.split("^XZ\n")[:-1]
+    assert len(etiquetas) == len(productos)
+    for etiqueta, producto in zip(etiquetas, productos):
+        assert etiqueta.startswith("^XA\n")
+        assert f"ID:{producto['id']}|" in etiqueta
+        assert etiqueta.endswith("^PQ2\n")
+
+def test_lote_vacio():
+    assert etiquetas_zpl([]) == ""
+
+@pytest.mark.parametrize("producto", [BROCA, INSERTO, MACHUELO, SIN_DATOS, BLANCOS])
+def test_estructura(producto):
+    lineas = etiqueta_zpl(producto).splitlines()
+    assert lineas[:4] == ["^XA", "^CI28", "^PW406", "^LL203"]
+    assert lineas[-1] == "^XZ"
+    assert all(linea.endswith("^FS") for linea in lineas[4:-1])
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pruebas del snapshot del catálogo (backend/catalogo.py)
+Sistema de Inventario - Empresa de Maquinados
+
+Varias tablets recorren el catálogo página por página al empezar el turno:
+todas las páginas de una versión deben salir de la misma entrada, aunque
+sean más que max_entradas.
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from catalogo import (
+    CatalogoSerializado, SnapshotCatalogo, etag_catalogo, respuesta_no_modificada, serializar_json
+)
+
+PRODUCTOS = [{"id": i, "nombre": f"{nombre} {i % 13}"}
+             for i, nombre in enumerate(["Broca", "Fresa", "Ñandú", "árbol", "broca"] * 60, start=1)]
+
+def codificar_cursor(nombre, producto_id):
+    return json.dumps([nombre, producto_id])
+
+def catalogo(version: int) -> CatalogoSerializado:
+    ordenados = sorted(PRODUCTOS, key=lambda p: (p["nombre"], p["id"]))
+    return CatalogoSerializado(version, [(p["nombre"], p["id"]) for p in ordenados],
+                               [serializar_json(p) for p in ordenados])
+
+def recorrer(snapshot: SnapshotCatalogo, version: int, limit: int, construidos: list) -> list:
+    """Páginas de una tablet, como loadProductos en app.js"""
+    async def construir():
+        construidos.append(version)
+        return catalogo(version)
+
+    async def paginas():
+        cuerpos = []
+        posicion = None
+        while True:
+            entrada = await snapshot.obtener(("id,nombre",), version, construir)
+            pagina = entrada.pagina(limit, posicion, codificar_cursor)
+            cuerpos.append(json.loads(pagina.cuerpos["identity"]))
+            if cuerpos[-1]["siguiente_cursor"] is None:
+                return cuerpos
+            posicion = tuple(json.loads(cuerpos[-1]["siguiente_cursor"]))
+
+    return asyncio.run(paginas())
+
+def test_recorrido_mas_largo_que_max_entradas():
+    snapshot = SnapshotCatalogo(max_entradas=4)
+    construidos = []
+    for _ in range(5):
+        paginas = recorrer(snapshot, 1, 10, construidos)
+    assert len(paginas) == 30
+
+    stats = snapshot.stats()
+    assert construidos == [1]
+    assert stats["misses"] == 1
+    assert stats["hits"] == 5 * 30 - 1
+    assert stats["entradas"] == 1
+    assert stats["paginas"] == 30
+
+def test_paginas_en_orden_sin_huecos():
+    paginas = recorrer(SnapshotCatalogo(), 1, 7, [])
+    productos = [p for pagina in paginas for p in pagina["productos"]]
+    assert productos == sorted(PRODUCTOS, key=lambda p: (p["nombre"], p["id"]))
+    assert all(len(pagina["productos"]) == 7 for pagina in paginas[:-1])
+
+def test_version_nueva_reemplaza_la_entrada():
+    snapshot = SnapshotCatalogo()
+    construidos = []
+    recorrer(snapshot, 1, 50, construidos)
+    recorrer(snapshot, 2, 50, construidos)
+    assert construidos == [1, 2]
+    assert snapshot.stats()["entradas"] == 1
+
+def test_pagina_igual_a_la_serializacion_completa():
+    entrada = catalogo(1)
+    ordenados = sorted(PRODUCTOS, key=lambda p: (p["nombre"], p["id"]))
+    completa = entrada.pagina(None, None, codificar_cursor)
+    assert completa.cuerpos["identity"] == serializar_json({"productos": ordenados, "siguiente_cursor": None})
+
+    # Cursor después del último producto: página vacía y sin siguiente
+    vacia = entrada.pagina(10, ("\uffff", 0), codificar_cursor)
+    assert json.loads(vacia.cuerpos["identity"]) == {"productos": [], "siguiente_cursor": None}
+
+def test_construccion_fallida_no_deja_locks():
+    snapshot = SnapshotCatalogo()
+
+    async def falla():
+        raise RuntimeError("sin base de datos")
+
+    async def pedir(clave):
+        try:
+            await snapshot.obtener(clave, 1, falla)
+        except RuntimeError:
+            pass
+
+    async def muchas():
+        await asyncio.gather(*(pedir((f"campos{i % 50}",)) for i in range(200)))
+
+    asyncio.run(muchas())
+    assert snapshot._locks == {}
+    assert snapshot.stats()["entradas"] == 0
+
+    recorrer(snapshot, 1, 100, [])
+    assert list(snapshot._locks) == [("id,nombre",)]
+
+def peticion(**encabezados):
+    from starlette.requests import Request
+    return Request({"type": "http", "method": "GET", "path": "/api/productos",
+                    "headers": [(k.replace("_", "-").encode(), v.encode()) for k, v in encabezados.items()]})
+
+def test_etag_por_codificacion():
+    assert etag_catalogo(12, "productos") == '"productos-v12"'
+    assert etag_catalogo(12, "productos", "br") == '"productos-v12-br"'
+    assert etag_catalogo(12, "productos", "gzip") == '"productos-v12-gzip"'
+
+    # Un ETag de brotli no valida la representación gzip ni la identity
+    con_br = peticion(if_none_match='"productos-v12-br"')
+    assert respuesta_no_modificada(con_br, 12, "productos", "br").status_code == 304
+    assert respuesta_no_modificada(con_br, 12, "productos", "gzip") is None
+    assert respuesta_no_modificada(con_br, 12, "productos") is None
+    assert respuesta_no_modificada(peticion(if_none_match='W/"productos-v12-gzip"'), 12, "productos", "gzip") is not None
+    assert respuesta_no_modificada(peticion(if_none_match='"productos-v11-br"'), 12, "productos", "br") is None